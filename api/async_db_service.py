@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Variante async de db_service para los handlers de FastAPI
+Mismas funciones y mismos dicts de retorno, pero sobre AsyncSession
+(aiosqlite en local, aiomysql en producción) para no bloquear el event loop
+
+Con DB_SINGLE_WRITER=1 las escrituras se encolan al escritor único de
+db_writer (las mismas funciones _*_tx que db_service) y se esperan sin bloquear
+"""
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from database import AsyncSessionLocal, track_db_stats
+from db_models import Post, User, PostCodeCounter
+from db_service import (
+    _build_post, _post_changes, _post_update_stmt, _posts_page_stmt, _posts_page,
+    POST_SUMMARY_COLUMNS, _summary_dict, POST_GC_COLUMNS, _gc_dict, _post_code_increment_stmt, post_cache,
+    _create_post_tx, _allocate_post_code_tx, _update_post_tx, _update_posts_tx, _update_each_post_tx,
+    _delete_post_tx, _create_user_tx, _update_user_tx, user_cache
+)
+from db_writer import write_queue
+from contextlib import asynccontextmanager
+from functools import partial
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import List, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Unit of Work (request/job)
+# ==============================
+class UnitOfWork:
+    """
+    Unidad de trabajo: una sola sesión para varias escrituras que son un único paso
+    
+    - Las lecturas de posts se cachean (el ownership check se hace una vez)
+    - Las escrituras se acumulan por código y se confirman en un único commit al salir
+    - Las lecturas no retienen la conexión
+    ⚠️ Solo para bloques sin llamadas largas (IA, FFmpeg): el panel no ve nada
+    de lo acumulado hasta el commit. Los pasos de generación escriben fuera de
+    una unidad de trabajo, cada uno con su commit.
+    """
+    
+    def __init__(self):
+        self.session = AsyncSessionLocal()
+        self.posts: Dict[str, Dict] = {}    # codigo → dict con los cambios pendientes aplicados
+        self.pending: Dict[str, Dict] = {}  # codigo → cambios acumulados
+        self.stats: Dict[str, int] = {'queries': 0, 'commits': 0}
+    
+    async def get_post(self, codigo: str, user_id: Optional[int] = None) -> Optional[Dict]:
+        if codigo not in self.posts:
+            post = post_cache.get(codigo)
+            if post is None:
+                version = post_cache.version()
+                result = await self.session.execute(_post_query(codigo))
+                post = result.scalars().first()
+                post = post.to_dict() if post else None
+                # Liberar la conexión: la transacción de escritura se abre solo en commit()
+                await self.session.rollback()
+                if not post:
+                    return None
+                post_cache.put(codigo, None, post, version)
+            self.posts[codigo] = post
+        post = self.posts[codigo]
+        if user_id is not None and post.get('user_id') != user_id:
+            return None
+        return dict(post)
+    
+    async def update_post(self, codigo: str, data: Dict, user_id: Optional[int] = None) -> Dict:
+        post = await self.get_post(codigo, user_id=user_id)
+        if not post:
+            raise ValueError(f"Post {codigo} no encontrado")
+        self.pending.setdefault(codigo, {}).update(data)
+        _overlay_post(self.posts[codigo], data)
+        return dict(self.posts[codigo])
+    
+    def forget(self, codigo: str):
+        """Descarta lecturas y cambios pendientes de un post (ej: tras borrarlo)"""
+        self.posts.pop(codigo, None)
+        self.pending.pop(codigo, None)
+    
+    async def commit(self):
+        """
+        Aplica todos los cambios pendientes en una sola transacción (un UPDATE por post)
+        Lanza ValueError si algún post se borró mientras tanto (el resto sí se confirma)
+        """
+        if not self.pending:
+            return
+        pending = dict(self.pending)
+        self.pending.clear()
+        if write_queue is not None:
+            missing = await write_queue.run_async(partial(_update_each_post_tx, pending, None))
+        else:
+            missing = []
+            for codigo, data in pending.items():
+                result = await self.session.execute(_post_update_stmt(codigo, data))
+                if result.rowcount == 0:
+                    missing.append(codigo)
+            await self.session.commit()
+        post_cache.invalidate(*pending)
+        if missing:
+            for codigo in missing:
+                self.posts.pop(codigo, None)
+            raise ValueError(f"Post {', '.join(missing)} no encontrado (borrado durante la petición)")
+
+_current_uow: ContextVar[Optional[UnitOfWork]] = ContextVar('unit_of_work', default=None)
+
+def _overlay_post(post: Dict, data: Dict):
+    """Refleja en el dict cacheado los cambios pendientes (mismo formato que to_dict)"""
+    for key, value in _post_changes(data).items():
+        if key not in post:
+            continue  # proyección resumen: solo sus columnas
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        post[key] = value
+
+@asynccontextmanager
+async def unit_of_work():
+    """
+    Abre (o reutiliza) la unidad de trabajo del contexto actual
+    Las funciones de este módulo la usan automáticamente mientras está activa.
+    Solo la más externa hace commit. Si el bloque lanza una excepción también
+    se confirma lo acumulado (escrituras de pasos ya terminados: sus archivos
+    ya están en el storage) y después se relanza.
+    
+    Uso:
+        async with unit_of_work():
+            await update_post(codigo, {...})
+    """
+    current = _current_uow.get()
+    if current is not None:
+        yield current
+        return
+    
+    uow = UnitOfWork()
+    token = _current_uow.set(uow)
+    try:
+        with track_db_stats() as stats:
+            uow.stats = stats
+            try:
+                yield uow
+            except BaseException:
+                try:
+                    await uow.commit()
+                except Exception as e:
+                    await uow.session.rollback()
+                    logger.error(f"❌ UoW: no se pudo confirmar lo terminado antes del error: {e}")
+                raise
+            else:
+                await uow.commit()
+            finally:
+                await uow.session.close()
+        logger.info(f"🧮 UoW: {stats['queries']} queries, {stats['commits']} commits")
+    finally:
+        _current_uow.reset(token)
+
+async def get_unit_of_work():
+    """
+    Dependency de FastAPI: una unidad de trabajo por request
+    Uso: uow: UnitOfWork = Depends(get_unit_of_work, scope="function")
+    (scope="function" → el commit ocurre antes de enviar la respuesta)
+    No usar en endpoints que esperan a la IA (ver UnitOfWork).
+    """
+    async with unit_of_work() as uow:
+        yield uow
+
+def _post_query(codigo: str, user_id: Optional[int] = None):
+    """SELECT de un post por código (opcionalmente verificando ownership)"""
+    stmt = select(Post).where(Post.codigo == codigo)
+    if user_id is not None:
+        stmt = stmt.where(Post.user_id == user_id)
+    return stmt
+
+async def get_all_posts(user_id: Optional[int] = None) -> List[Dict]:
+    """Obtiene todos los posts (opcionalmente filtrados por usuario)"""
+    async with AsyncSessionLocal() as db:
+        stmt = select(Post)
+        if user_id is not None:
+            stmt = stmt.where(Post.user_id == user_id)
+        result = await db.execute(stmt)
+        posts = [post.to_dict() for post in result.scalars().all()]
+    
+    uow = _current_uow.get()
+    if uow is not None:
+        for post in posts:
+            if post['codigo'] in uow.pending:
+                _overlay_post(post, uow.pending[post['codigo']])
+    return posts
+
+async def get_posts_by_codigos(codigos: List[str], user_id: Optional[int] = None) -> List[Dict]:
+    """Posts con esos códigos en una sola consulta (los que no existen o no son del usuario no salen)"""
+    if not codigos:
+        return []
+    async with AsyncSessionLocal() as db:
+        stmt = select(Post).where(Post.codigo.in_(set(codigos)))
+        if user_id is not None:
+            stmt = stmt.where(Post.user_id == user_id)
+        result = await db.execute(stmt)
+        posts = [post.to_dict() for post in result.scalars().all()]
+    
+    uow = _current_uow.get()
+    if uow is not None:
+        for post in posts:
+            if post['codigo'] in uow.pending:
+                _overlay_post(post, uow.pending[post['codigo']])
+    return posts
+
+async def get_posts_summary(user_id: Optional[int] = None) -> List[Dict]:
+    """Resumen de todos los posts (ver db_service.get_posts_summary)"""
+    async with AsyncSessionLocal() as db:
+        stmt = select(*POST_SUMMARY_COLUMNS)
+        if user_id is not None:
+            stmt = stmt.where(Post.user_id == user_id)
+        result = await db.execute(stmt)
+        posts = [_summary_dict(row) for row in result]
+    
+    uow = _current_uow.get()
+    if uow is not None:
+        for post in posts:
+            if post['codigo'] in uow.pending:
+                _overlay_post(post, uow.pending[post['codigo']])
+    return posts
+
+async def get_posts_for_gc(user_id: Optional[int] = None) -> List[Dict]:
+    """Posts para el GC de storage (ver db_service.get_posts_for_gc)"""
+    async with AsyncSessionLocal() as db:
+        stmt = select(*POST_GC_COLUMNS)
+        if user_id is not None:
+            stmt = stmt.where(Post.user_id == user_id)
+        result = await db.execute(stmt)
+        return [_gc_dict(row) for row in result]
+
+async def get_posts_page(user_id: Optional[int] = None, limit: Optional[int] = 50,
+                         cursor: Optional[str] = None, estado: Optional[str] = None,
+                         fecha_desde=None, fecha_hasta=None, summary: bool = False) -> Dict:
+    """
+    Obtiene una página de posts filtrada en SQL (ver db_service.get_posts_page)
+    Devuelve {'posts': [...], 'next_cursor': str | None}
+    """
+    async with AsyncSessionLocal() as db:
+        stmt = _posts_page_stmt(user_id, limit, cursor, estado, fecha_desde, fecha_hasta, summary)
+        result = await db.execute(stmt)
+        if summary:
+            posts = [_summary_dict(row) for row in result]
+        else:
+            posts = [post.to_dict() for post in result.scalars().all()]
+    
+    uow = _current_uow.get()
+    if uow is not None:
+        for post in posts:
+            if post['codigo'] in uow.pending:
+                _overlay_post(post, uow.pending[post['codigo']])
+    return _posts_page(posts, limit)
+
+async def get_post_by_codigo(codigo: str, user_id: Optional[int] = None) -> Optional[Dict]:
+    """Obtiene un post por su código (opcionalmente verificando ownership)"""
+    uow = _current_uow.get()
+    if uow is not None:
+        return await uow.get_post(codigo, user_id=user_id)
+    
+    cached = post_cache.get(codigo, user_id)
+    if cached is not None:
+        return cached
+    
+    version = post_cache.version()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(_post_query(codigo, user_id))
+        post = result.scalars().first()
+        if not post:
+            return None
+        post = post.to_dict()
+    post_cache.put(codigo, user_id, post, version)
+    return post
+
+async def allocate_post_code(fecha: Optional[str] = None) -> str:
+    """
+    Reserva el siguiente código YYYYMMDD-n (ver db_service.allocate_post_code)
+    Se confirma al momento, también dentro de una unit_of_work().
+    """
+    fecha = fecha or datetime.now().strftime('%Y%m%d')
+    if write_queue is not None:
+        return await write_queue.run_async(partial(_allocate_post_code_tx, fecha))
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            result = await db.execute(_post_code_increment_stmt(fecha))
+            if result.rowcount == 0:
+                # Primer post del día
+                try:
+                    await db.execute(insert(PostCodeCounter).values(fecha=fecha, ultimo_numero=1))
+                except IntegrityError:
+                    # Otro proceso creó la fila a la vez: incrementar la suya
+                    await db.rollback()
+                    await db.execute(_post_code_increment_stmt(fecha))
+            
+            result = await db.execute(
+                select(PostCodeCounter.ultimo_numero).where(PostCodeCounter.fecha == fecha)
+            )
+            numero = result.scalar_one()
+            await db.commit()
+            return f"{fecha}-{numero}"
+        except Exception:
+            await db.rollback()
+            raise
+
+async def create_post(data: Dict) -> Dict:
+    """Crea un nuevo post"""
+    if write_queue is not None:
+        post = await write_queue.run_async(partial(_create_post_tx, data))
+        post_cache.invalidate(post['codigo'])
+        return post
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            post = _build_post(data)
+            db.add(post)
+            await db.commit()
+            await db.refresh(post)
+            post_cache.invalidate(post.codigo)
+            return post.to_dict()
+        except Exception:
+            await db.rollback()
+            raise
+
+async def update_post(codigo: str, data: Dict, user_id: Optional[int] = None, return_row: bool = False):
+    """
+    Actualiza un post existente (opcionalmente verificando ownership)
+    Un único UPDATE con las columnas cambiadas; True o el dict si return_row=True.
+    Dentro de una unit_of_work() el cambio se acumula y se confirma al final.
+    """
+    uow = _current_uow.get()
+    if uow is not None:
+        return await uow.update_post(codigo, data, user_id=user_id)
+    
+    if write_queue is not None:
+        result = await write_queue.run_async(partial(_update_post_tx, codigo, data, user_id, return_row))
+        post_cache.invalidate(codigo)
+        return result
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            result = await db.execute(_post_update_stmt(codigo, data, user_id))
+            if result.rowcount == 0:
+                raise ValueError(f"Post {codigo} no encontrado")
+            
+            row = None
+            if return_row:
+                result = await db.execute(_post_query(codigo))
+                row = result.scalars().first().to_dict()
+            
+            await db.commit()
+            post_cache.invalidate(codigo)
+            return row if return_row else True
+        except Exception:
+            await db.rollback()
+            raise
+
+async def update_posts(updates: Dict[str, Dict], user_id: Optional[int] = None) -> int:
+    """
+    Actualiza varios posts en una sola transacción
+    Dentro de una unit_of_work() se acumulan como el resto de cambios.
+    """
+    uow = _current_uow.get()
+    if uow is not None:
+        updated = 0
+        for codigo, data in updates.items():
+            try:
+                await uow.update_post(codigo, data, user_id=user_id)
+                updated += 1
+            except ValueError:
+                pass
+        return updated
+    
+    if write_queue is not None:
+        updated = await write_queue.run_async(partial(_update_posts_tx, updates, user_id))
+        post_cache.invalidate(*updates)
+        return updated
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            updated = 0
+            for codigo, data in updates.items():
+                result = await db.execute(_post_update_stmt(codigo, data, user_id))
+                updated += result.rowcount
+            await db.commit()
+            post_cache.invalidate(*updates)
+            return updated
+        except Exception:
+            await db.rollback()
+            raise
+
+async def delete_post(codigo: str, user_id: Optional[int] = None) -> bool:
+    """Elimina un post (opcionalmente verificando ownership). Se confirma al momento."""
+    uow = _current_uow.get()
+    if uow is not None:
+        uow.forget(codigo)
+    
+    if write_queue is not None:
+        deleted = await write_queue.run_async(partial(_delete_post_tx, codigo, user_id))
+        if deleted:
+            post_cache.invalidate(codigo)
+        return deleted
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            result = await db.execute(_post_query(codigo, user_id))
+            post = result.scalars().first()
+
+            if not post:
+                return False
+
+            await db.delete(post)
+            await db.commit()
+            post_cache.invalidate(codigo)
+            return True
+        except Exception:
+            await db.rollback()
+            raise
+
+# ==============================
+# Users
+# ==============================
+async def get_user_by_id(user_id: int) -> Optional[User]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.id == user_id))
+        return result.scalars().first()
+
+async def get_user_profile(user_id: int) -> Optional[Dict]:
+    """Perfil del usuario desde user_cache (ver db_service.get_user_profile)"""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    version = user_cache.version()
+    user = await get_user_by_id(user_id)
+    if not user:
+        return None
+    profile = user.to_dict()
+    user_cache.put(user_id, None, profile, version)
+    return profile
+
+async def get_user_by_email(email: str) -> Optional[User]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalars().first()
+
+async def create_user(email: str, password_hash: str, name: Optional[str] = None) -> User:
+    if write_queue is not None:
+        return await write_queue.run_async(partial(_create_user_tx, email, password_hash, name))
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            user = User(email=email, password_hash=password_hash, name=name)
+            db.add(user)
+            await db.commit()
+            await db.refresh(user)
+            return user
+        except Exception:
+            await db.rollback()
+            raise
+
+async def update_user(user_id: int, updates: Dict) -> Optional[User]:
+    """Actualiza campos del usuario (incluido el tier de la suscripción) e invalida su perfil cacheado"""
+    if write_queue is not None:
+        user = await write_queue.run_async(partial(_update_user_tx, user_id, updates))
+        user_cache.invalidate(user_id)
+        return user
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            result = await db.execute(select(User).where(User.id == user_id))
+            user = result.scalars().first()
+            if not user:
+                return None
+            for key, value in updates.items():
+                if hasattr(user, key):
+                    setattr(user, key, value)
+            await db.commit()
+            await db.refresh(user)
+            user_cache.invalidate(user_id)
+            return user
+        except Exception:
+            await db.rollback()
+            raise
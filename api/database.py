@@ -5,7 +5,11 @@ Usa SQLite en local y MySQL en producción
 from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from dotenv import load_dotenv
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict
 import os
 
 # Cargar variables de entorno (producción primero, luego fallback local)
@@ -43,46 +47,33 @@ engine = create_engine(
     } if DATABASE_URL.startswith("sqlite") else {}
 )
 
-def _ensure_sqlite_auth_schema():
-    """Asegura columnas nuevas en SQLite sin necesidad de migraciones manuales."""
-    if not DATABASE_URL.startswith("sqlite"):
-        return
-    try:
-        conn = engine.raw_connection()
-        cur = conn.cursor()
-
-        # Users table
-        cur.execute("PRAGMA table_info(users)")
-        user_cols = {row[1] for row in cur.fetchall()}
-        if "email" not in user_cols:
-            cur.execute("ALTER TABLE users ADD COLUMN email VARCHAR(255)")
-        if "password_hash" not in user_cols:
-            cur.execute("ALTER TABLE users ADD COLUMN password_hash VARCHAR(255)")
-        if "name" not in user_cols:
-            cur.execute("ALTER TABLE users ADD COLUMN name VARCHAR(255)")
-        if "system_prompt" not in user_cols:
-            cur.execute("ALTER TABLE users ADD COLUMN system_prompt TEXT")
-
-        # Unique index for email
-        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email)")
-
-        # Posts table
-        cur.execute("PRAGMA table_info(posts)")
-        post_cols = {row[1] for row in cur.fetchall()}
-        if "user_id" not in post_cols:
-            cur.execute("ALTER TABLE posts ADD COLUMN user_id INTEGER")
-
-        # Redes seleccionadas por el usuario (persistencia entre recargas)
-        for redes_col in ['redes_instagram', 'redes_linkedin', 'redes_twitter', 'redes_facebook', 'redes_tiktok']:
-            if redes_col not in post_cols:
-                cur.execute(f"ALTER TABLE posts ADD COLUMN {redes_col} BOOLEAN DEFAULT 0")
-
-        conn.commit()
-        cur.close()
-        conn.close()
-    except Exception:
-        # No bloquear arranque por migración ligera
-        pass
+def _async_database_url(url: str) -> str:
+    """
+    Traduce DATABASE_URL a su driver async equivalente
+    sqlite:// → sqlite+aiosqlite://, mysql(+pymysql):// → mysql+aiomysql://
+    """
+    if url.startswith('sqlite+aiosqlite') or url.startswith('mysql+aiomysql') or url.startswith('mysql+asyncmy'):
+        return url
+    if url.startswith('sqlite'):
+        return 'sqlite+aiosqlite' + url[url.index(':'):]
+    if url.startswith('mysql'):
+        return 'mysql+aiomysql' + url[url.index(':'):]
+    return url
+
+# Engine async (mismo esquema, driver async) para los handlers de FastAPI
+# Se puede forzar otro driver con ASYNC_DATABASE_URL (ej: mysql+asyncmy://...)
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL') or _async_database_url(DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    echo=False,
+    connect_args={
+        "timeout": 30,
+        "check_same_thread": False
+    } if ASYNC_DATABASE_URL.startswith("sqlite") else {}
+)
 
 # Activar WAL, busy_timeout y synchronous en SQLite local
 @event.listens_for(Engine, "connect")
@@ -99,15 +90,47 @@ def _set_sqlite_pragma(dbapi_conn, connection_record):
         # No romper en otros motores
         pass
 
-# Asegurar schema mínimo para auth en SQLite
-_ensure_sqlite_auth_schema()
+# Contadores de queries/commits (por request o por unidad de trabajo)
+# Cada track_db_stats() apila su dict; los listeners incrementan todos los activos
+_db_stats: ContextVar[tuple] = ContextVar('db_stats', default=())
+
+@contextmanager
+def track_db_stats():
+    """
+    Cuenta queries y commits ejecutados dentro del bloque (sync y async)
+    Uso: with track_db_stats() as stats: ... → stats = {'queries': n, 'commits': m}
+    """
+    stats: Dict[str, int] = {'queries': 0, 'commits': 0}
+    token = _db_stats.set(_db_stats.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _db_stats.reset(token)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    for stats in _db_stats.get():
+        stats['queries'] += 1
+
+@event.listens_for(Engine, "commit")
+def _count_commit(conn):
+    for stats in _db_stats.get():
+        stats['commits'] += 1
+
+# Las migraciones (db_migrations.py) no corren al importar: las lanza el arranque de la API o el script
 
 # Crear session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Session factory de escrituras (db_writer): los objetos devueltos siguen cargados tras el commit
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
 # Session con scope (thread-safe)
 db_session = scoped_session(SessionLocal)
 
+# Session factory async (expire_on_commit=False: los objetos se usan tras cerrar la sesión)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     """
     Dependency para obtener sesión de base de datos
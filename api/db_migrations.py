@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Migraciones versionadas del esquema (SQLite y MySQL)
+
+Cada migración se aplica una sola vez y queda registrada en la tabla
+schema_version. En el arranque basta con leer la versión actual: si está
+al día no se inspecciona nada más.
+
+No se ejecutan al importar database.py: las lanza el arranque de la API
+(DB_MIGRATE_ON_STARTUP) o este script. Varios procesos a la vez se
+serializan con un lock (GET_LOCK en MySQL, flock en SQLite), y cada paso
+comprueba el esquema antes de tocarlo: en MySQL los ALTER no son
+transaccionales y una migración cortada a medias se vuelve a ejecutar entera.
+
+Para añadir una migración: escribir la función (idempotente) y añadirla al final de MIGRATIONS.
+
+Uso manual:
+    python db_migrations.py
+"""
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, Boolean
+from sqlalchemy import inspect, select, func, text
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from datetime import datetime
+from db_models import Base, POST_FLAG_GROUPS
+import os
+
+# Nombre del lock de MySQL y espera máxima por él (otro proceso migrando)
+MIGRATION_LOCK_NAME = 'lavelo_schema_migrations'
+MIGRATION_LOCK_TIMEOUT = int(os.getenv('DB_MIGRATION_LOCK_TIMEOUT', '600'))
+
+# La API migra al arrancar (0 = solo a mano con este script, p. ej. en el deploy)
+DB_MIGRATE_ON_STARTUP = os.getenv('DB_MIGRATE_ON_STARTUP', '1') == '1'
+
+# Tabla de control (fuera de Base: no es un modelo de la app)
+_version_metadata = MetaData()
+schema_version = Table(
+    'schema_version', _version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255)),
+    Column('applied_at', DateTime, default=datetime.utcnow)
+)
+
+# ==============================
+# Helpers
+# ==============================
+def _add_missing_columns(conn, table_name: str, column_names):
+    """ALTER TABLE ADD COLUMN para las columnas del modelo que falten en la tabla"""
+    inspector = inspect(conn)
+    if not inspector.has_table(table_name):
+        return
+    existing = {col['name'] for col in inspector.get_columns(table_name)}
+    table = Base.metadata.tables[table_name]
+    for name in column_names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = f"ALTER TABLE {table_name} ADD COLUMN {name} {column.type.compile(dialect=conn.dialect)}"
+        if isinstance(column.type, Boolean):
+            ddl += " DEFAULT 0"
+        conn.execute(text(ddl))
+        print(f"  ➕ {table_name}.{name}")
+
+def _create_indexes(conn, *index_names):
+    """Crea los índices declarados en los modelos (__table_args__) que aún no existan"""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {idx['name'] for idx in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in index_names and index.name not in existing:
+                index.create(conn)
+                print(f"  🔎 {index.name}")
+
+# ==============================
+# Migraciones
+# ==============================
+def _m001_legacy_columns(conn):
+    """Columnas que antes se añadían con ALTER TABLE en cada arranque"""
+    _add_missing_columns(conn, 'users', ['email', 'password_hash', 'name', 'system_prompt'])
+    # (las columnas redes_* de entonces ahora son bits de redes_mask: ver migración 5)
+    _add_missing_columns(conn, 'posts', ['user_id'])
+    _add_missing_columns(conn, 'social_tokens', ['page_id', 'instagram_account_id'])
+
+    # Índice único de email (si la tabla no lo trae ya de create_all)
+    inspector = inspect(conn)
+    if inspector.has_table('users'):
+        unique_cols = [idx['column_names'] for idx in inspector.get_indexes('users') if idx.get('unique')]
+        unique_cols += [uc['column_names'] for uc in inspector.get_unique_constraints('users')]
+        if ['email'] not in unique_cols:
+            conn.execute(text("CREATE UNIQUE INDEX idx_users_email ON users(email)"))
+
+def _m002_secondary_indexes(conn):
+    """Índices para los filtros de las rutas calientes (ownership, tokens, páginas, IPs)"""
+    _create_indexes(
+        conn,
+        'ix_posts_user_id',
+        'ix_social_tokens_platform_user_id',
+        'ix_social_pages_page_id',
+        'ix_social_pages_instagram_account_id'
+    )
+    # anonymous_usage.ip_address: índice único en la migración 6
+
+def _m003_posts_keyset_index(conn):
+    """Índice para la paginación por cursor (updated_at, codigo) de los posts de un usuario"""
+    # Las filas sin updated_at quedarían fuera del keyset
+    if inspect(conn).has_table('posts'):
+        conn.execute(text("UPDATE posts SET updated_at = created_at WHERE updated_at IS NULL"))
+    _create_indexes(conn, 'ix_posts_user_id_updated_at_codigo')
+
+def _m004_post_code_counters(conn):
+    """Contador por día para los códigos YYYYMMDD-n, inicializado con los posts existentes"""
+    counters = Base.metadata.tables['post_code_counters']
+    counters.create(conn, checkfirst=True)
+    if not inspect(conn).has_table('posts'):
+        return
+
+    ultimos = {}
+    for (codigo,) in conn.execute(text("SELECT codigo FROM posts")):
+        fecha, _, numero = (codigo or '').partition('-')
+        if len(fecha) == 8 and numero.isdigit():
+            ultimos[fecha] = max(ultimos.get(fecha, 0), int(numero))
+    # Repetible: no duplicar los contadores de una ejecución anterior cortada
+    ya_creados = {fecha for (fecha,) in conn.execute(select(counters.c.fecha))}
+    pendientes = {fecha: numero for fecha, numero in ultimos.items() if fecha not in ya_creados}
+    if pendientes:
+        conn.execute(counters.insert(), [
+            {'fecha': fecha, 'ultimo_numero': numero} for fecha, numero in pendientes.items()
+        ])
+
+def _m005_post_flag_masks(conn):
+    """Checkboxes booleanos de posts → tres máscaras de bits (artefactos, redes, publicación)"""
+    inspector = inspect(conn)
+    if not inspector.has_table('posts'):
+        return
+    existing = {col['name'] for col in inspector.get_columns('posts')}
+
+    for mask, names in POST_FLAG_GROUPS.items():
+        if mask not in existing:
+            conn.execute(text(f"ALTER TABLE posts ADD COLUMN {mask} INTEGER NOT NULL DEFAULT 0"))
+            print(f"  ➕ posts.{mask}")
+        bits = [
+            f"(CASE WHEN {name} THEN {1 << bit} ELSE 0 END)"
+            for bit, name in enumerate(names) if name in existing
+        ]
+        if bits:
+            # OR y no asignación: si una ejecución anterior ya borró columnas, sus bits siguen en la máscara
+            conn.execute(text(f"UPDATE posts SET {mask} = {mask} | ({' + '.join(bits)})"))
+
+    # Las columnas antiguas ya no se leen; si el motor no puede borrar alguna se queda huérfana
+    for names in POST_FLAG_GROUPS.values():
+        for name in names:
+            if name not in existing:
+                continue
+            try:
+                conn.execute(text(f"ALTER TABLE posts DROP COLUMN {name}"))
+                print(f"  ➖ posts.{name}")
+            except Exception as e:
+                print(f"  ⚠️ No se pudo borrar posts.{name}: {e}")
+
+def _m006_anonymous_usage_unique_ip(conn):
+    """Una sola fila de cupo por IP/usuario (el consumo atómico de LimitsService cuenta con ello)"""
+    inspector = inspect(conn)
+    if not inspector.has_table('anonymous_usage'):
+        return
+    # Duplicados de inserciones concurrentes: conservar la fila más reciente
+    conn.execute(text(
+        "DELETE FROM anonymous_usage WHERE id NOT IN "
+        "(SELECT id FROM (SELECT MAX(id) AS id FROM anonymous_usage GROUP BY ip_address) AS keep)"
+    ))
+    # BDs migradas con la versión anterior de la migración 2: el índice no único sobra
+    existing = {idx['name'] for idx in inspector.get_indexes('anonymous_usage')}
+    if 'ix_anonymous_usage_ip_address' in existing:
+        on_table = " ON anonymous_usage" if conn.dialect.name == 'mysql' else ""
+        conn.execute(text(f"DROP INDEX ix_anonymous_usage_ip_address{on_table}"))
+    _create_indexes(conn, 'ux_anonymous_usage_ip_address')
+
+# (versión, descripción, función) — siempre en orden y sin reutilizar números
+MIGRATIONS = [
+    (1, 'Columnas legacy de users/posts/social_tokens', _m001_legacy_columns),
+    (2, 'Índices secundarios de posts/social', _m002_secondary_indexes),
+    (3, 'Índice keyset de posts (user_id, updated_at, codigo)', _m003_posts_keyset_index),
+    (4, 'Tabla post_code_counters', _m004_post_code_counters),
+    (5, 'Checkboxes de posts como máscaras de bits', _m005_post_flag_masks),
+    (6, 'Índice único anonymous_usage.ip_address', _m006_anonymous_usage_unique_ip),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# ==============================
+# Runner
+# ==============================
+def get_schema_version(engine: Engine) -> int:
+    """Versión actual del esquema (0 si nunca se ha migrado)"""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table('schema_version'):
+            return 0
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+@contextmanager
+def migration_lock(engine: Engine):
+    """
+    Lock entre procesos mientras se migra
+    MySQL: GET_LOCK en una conexión propia. SQLite: flock exclusivo sobre
+    un archivo junto a la BD. Otros motores o SQLite en memoria: sin lock.
+    """
+    if engine.dialect.name == 'mysql':
+        with engine.connect() as conn:
+            acquired = conn.execute(
+                text("SELECT GET_LOCK(:name, :timeout)"),
+                {'name': MIGRATION_LOCK_NAME, 'timeout': MIGRATION_LOCK_TIMEOUT}
+            ).scalar()
+            if acquired != 1:
+                raise TimeoutError(f"Lock de migraciones ocupado más de {MIGRATION_LOCK_TIMEOUT}s")
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': MIGRATION_LOCK_NAME})
+        return
+
+    database = engine.url.database if engine.dialect.name == 'sqlite' else None
+    if not database or database == ':memory:':
+        yield
+        return
+
+    import fcntl
+    with open(f"{database}.migrations.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def run_migrations(engine: Engine) -> int:
+    """
+    Aplica las migraciones pendientes, cada una en su propia transacción
+    Si una falla se detiene (no bloquea el arranque) y se reintenta en el próximo.
+    Devuelve la versión final del esquema.
+    """
+    try:
+        # Camino rápido sin lock: esquema al día
+        current = get_schema_version(engine)
+        if current >= LATEST_VERSION:
+            return current
+
+        with migration_lock(engine):
+            # Otro proceso pudo migrar mientras esperábamos el lock
+            current = get_schema_version(engine)
+            if current >= LATEST_VERSION:
+                return current
+            _version_metadata.create_all(bind=engine)
+            return _apply_pending(engine, current)
+    except Exception as e:
+        print(f"⚠️ No se pudieron aplicar las migraciones: {e}")
+        return 0
+
+def _apply_pending(engine: Engine, current: int) -> int:
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            with engine.begin() as conn:
+                print(f"🔧 Migración {version}: {description}")
+                migrate(conn)
+                conn.execute(schema_version.insert().values(version=version, description=description))
+            current = version
+        except Exception as e:
+            print(f"⚠️ Migración {version} fallida: {e}")
+            break
+
+    return current
+
+if __name__ == '__main__':
+    from database import engine
+    print(f"✅ Esquema en versión {run_migrations(engine)} (última: {LATEST_VERSION})")
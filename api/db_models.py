@@ -2,8 +2,9 @@
 Modelos SQLAlchemy para Lavelo Blog
 Replica exacta de la estructura de Google Sheets
 """
-from sqlalchemy import Column, String, Text, DateTime, Boolean, Integer, Date
+from sqlalchemy import Column, String, Text, DateTime, Integer, Date, Index
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime
 
 Base = declarative_base()
@@ -14,6 +15,10 @@ class Post(Base):
     Replica exacta de las columnas A-AJ de Google Sheets
     """
     __tablename__ = 'posts'
+    __table_args__ = (
+        Index('ix_posts_user_id', 'user_id'),
+        Index('ix_posts_user_id_updated_at_codigo', 'user_id', 'updated_at', 'codigo'),
+    )
     
     # COLUMNAS PRINCIPALES (A-H)
     codigo = Column(String(50), primary_key=True)  # C: Código Post
@@ -25,45 +30,11 @@ class Post(Base):
     drive_folder_id = Column(String(100))  # G: Drive Folder ID
     urls = Column(Text)  # H: URLs (separadas por comas)
     
-    # TEXTOS - Checkboxes (I-O)
-    base_txt = Column(Boolean, default=False)  # I: base.txt
-    instagram_txt = Column(Boolean, default=False)  # J: instagram.txt
-    linkedin_txt = Column(Boolean, default=False)  # K: linkedin.txt
-    twitter_txt = Column(Boolean, default=False)  # L: twitter.txt
-    facebook_txt = Column(Boolean, default=False)  # M: facebook.txt
-    tiktok_txt = Column(Boolean, default=False)  # N: tiktok.txt
-    prompt_imagen_base_txt = Column(Boolean, default=False)  # O: prompt_imagen_base.txt
-    
-    # IMÁGENES - Checkboxes (P-U)
-    imagen_base_png = Column(Boolean, default=False)  # P: imagen_base.png
-    instagram_1x1_png = Column(Boolean, default=False)  # Q: instagram_1x1.png
-    instagram_stories_9x16_png = Column(Boolean, default=False)  # R: instagram_stories_9x16.png
-    linkedin_16x9_png = Column(Boolean, default=False)  # S: linkedin_16x9.png
-    twitter_16x9_png = Column(Boolean, default=False)  # T: twitter_16x9.png
-    facebook_16x9_png = Column(Boolean, default=False)  # U: facebook_16x9.png
-    
-    # VIDEOS - Checkboxes (V-AA)
-    script_video_base_txt = Column(Boolean, default=False)  # V: script_video_base.txt
-    video_base_mp4 = Column(Boolean, default=False)  # W: video_base.mp4
-    feed_16x9_mp4 = Column(Boolean, default=False)  # X: feed_16x9.mp4
-    stories_9x16_mp4 = Column(Boolean, default=False)  # Y: stories_9x16.mp4
-    shorts_9x16_mp4 = Column(Boolean, default=False)  # Z: shorts_9x16.mp4
-    tiktok_9x16_mp4 = Column(Boolean, default=False)  # AA: tiktok_9x16.mp4
-    
-    # REDES SELECCIONADAS - Persistir qué redes eligió el usuario para este post
-    redes_instagram = Column(Boolean, default=False)
-    redes_linkedin = Column(Boolean, default=False)
-    redes_twitter = Column(Boolean, default=False)
-    redes_facebook = Column(Boolean, default=False)
-    redes_tiktok = Column(Boolean, default=False)
-
-    # PUBLICACIÓN - Checkboxes (AB-AG)
-    blog_published = Column(Boolean, default=False)  # AB: Blog
-    instagram_published = Column(Boolean, default=False)  # AC: Instagram
-    linkedin_published = Column(Boolean, default=False)  # AD: LinkedIn
-    twitter_published = Column(Boolean, default=False)  # AE: Twitter
-    facebook_published = Column(Boolean, default=False)  # AF: Facebook
-    tiktok_published = Column(Boolean, default=False)  # AG: TikTok
+    # ESTADO DE ARTEFACTOS / REDES / PUBLICACIÓN (I-AG) - Un bit por checkbox (ver POST_FLAGS)
+    # Los checkboxes siguen accesibles como atributos (post.base_txt, Post.base_txt == True)
+    artefactos_mask = Column(Integer, nullable=False, default=0)  # I-AA: textos, imágenes, videos
+    redes_mask = Column(Integer, nullable=False, default=0)  # Redes seleccionadas para este post
+    publicacion_mask = Column(Integer, nullable=False, default=0)  # AB-AG: publicado en cada red
     
     # CONTROL (AH-AJ)
     fecha_real_publicacion = Column(DateTime)  # AH: Fecha Real Publicación
@@ -139,9 +110,62 @@ class Post(Base):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+# ==============================
+# Checkboxes de Post como bits
+# ==============================
+# Orden = bit (no reordenar: los valores guardados dependen de la posición)
+POST_FLAG_GROUPS = {
+    'artefactos_mask': [
+        # Textos (I-O)
+        'base_txt', 'instagram_txt', 'linkedin_txt', 'twitter_txt', 'facebook_txt', 'tiktok_txt',
+        'prompt_imagen_base_txt',
+        # Imágenes (P-U)
+        'imagen_base_png', 'instagram_1x1_png', 'instagram_stories_9x16_png',
+        'linkedin_16x9_png', 'twitter_16x9_png', 'facebook_16x9_png',
+        # Videos (V-AA)
+        'script_video_base_txt', 'video_base_mp4', 'feed_16x9_mp4', 'stories_9x16_mp4',
+        'shorts_9x16_mp4', 'tiktok_9x16_mp4'
+    ],
+    'redes_mask': [
+        'redes_instagram', 'redes_linkedin', 'redes_twitter', 'redes_facebook', 'redes_tiktok'
+    ],
+    'publicacion_mask': [
+        'blog_published', 'instagram_published', 'linkedin_published',
+        'twitter_published', 'facebook_published', 'tiktok_published'
+    ]
+}
+
+# checkbox → (columna máscara, bit)
+POST_FLAGS = {
+    name: (mask, 1 << bit)
+    for mask, names in POST_FLAG_GROUPS.items()
+    for bit, name in enumerate(names)
+}
+
+def _post_flag(mask: str, bit: int) -> hybrid_property:
+    """Checkbox booleano respaldado por un bit de la columna máscara"""
+    def getter(self):
+        return bool((getattr(self, mask) or 0) & bit)
+
+    def setter(self, value):
+        current = getattr(self, mask) or 0
+        setattr(self, mask, current | bit if value else current & ~bit)
+
+    def expression(cls):
+        return getattr(cls, mask).bitwise_and(bit) != 0
+
+    return hybrid_property(getter, setter, expr=expression)
+
+for _name, (_mask, _bit) in POST_FLAGS.items():
+    setattr(Post, _name, _post_flag(_mask, _bit))
+
 class SocialPage(Base):
     """Modelo para páginas autorizadas (Facebook/Instagram)"""
     __tablename__ = 'social_pages'
+    __table_args__ = (
+        Index('ix_social_pages_page_id', 'page_id'),
+        Index('ix_social_pages_instagram_account_id', 'instagram_account_id'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, nullable=True)
@@ -215,6 +239,9 @@ class User(Base):
 class AnonymousUsage(Base):
     """Modelo para tracking de usuarios anónimos por IP"""
     __tablename__ = 'anonymous_usage'
+    __table_args__ = (
+        Index('ux_anonymous_usage_ip_address', 'ip_address', unique=True),  # Una fila de cupo por IP/usuario
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     ip_address = Column(String(45), nullable=False)  # IPv4 o IPv6
@@ -235,6 +262,9 @@ class AnonymousUsage(Base):
 class SocialToken(Base):
     """Modelo de Tokens de Redes Sociales (por usuario)"""
     __tablename__ = 'social_tokens'
+    __table_args__ = (
+        Index('ix_social_tokens_platform_user_id', 'platform', 'user_id'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, nullable=False)  # Relación con User
@@ -263,3 +293,10 @@ class SocialToken(Base):
             'connected_at': self.connected_at.isoformat() if self.connected_at else None,
             'last_used': self.last_used.isoformat() if self.last_used else None
         }
+
+class PostCodeCounter(Base):
+    """Último número de post asignado por día (códigos YYYYMMDD-n)"""
+    __tablename__ = 'post_code_counters'
+    
+    fecha = Column(String(8), primary_key=True)  # YYYYMMDD
+    ultimo_numero = Column(Integer, nullable=False, default=0)
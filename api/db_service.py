@@ -3,10 +3,102 @@
 Servicio de base de datos MySQL para reemplazar sheets_service.py
 Proporciona las mismas funciones pero usando MySQL en lugar de Google Sheets
 """
+from sqlalchemy import select, insert, update, and_, or_, Date, DateTime
+from sqlalchemy.exc import IntegrityError
 from database import SessionLocal
-from db_models import Post, SocialToken, SocialPage, User
-from datetime import datetime, timedelta
+from db_writer import run_write
+from db_models import Post, SocialToken, SocialPage, User, PostCodeCounter, POST_FLAGS, POST_FLAG_GROUPS
+from datetime import date, datetime, timedelta
 from typing import List, Dict, Optional
+from collections import OrderedDict
+from functools import partial
+import threading
+import time
+import os
+
+# ==============================
+# Cachés de filas (LRU en proceso)
+# ==============================
+class RowCache:
+    """
+    Caché LRU acotada de filas (dicts) por (clave, user_id), compartida por db_service y async_db_service
+    Instancias: post_cache (clave = codigo) y user_cache (clave = user_id)
+    
+    - Las escrituras invalidan la clave afectada (todas sus variantes de user_id)
+    - TTL corto: el MCP server escribe en la misma BD desde otro proceso
+    - Devuelve copias: los llamadores pueden modificar el dict (ej: post['archivos'])
+    """
+    
+    def __init__(self, max_size: int = 512, ttl: float = 10):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()  # (codigo, user_id) → (expira, post)
+        self._version = 0  # Evita cachear lecturas que empezaron antes de una invalidación
+        self._lock = threading.Lock()
+    
+    def version(self) -> int:
+        return self._version
+    
+    def get(self, codigo, user_id: Optional[int] = None) -> Optional[Dict]:
+        key = (codigo, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+    
+    def put(self, codigo, user_id: Optional[int], post: Dict, version: int):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[(codigo, user_id)] = (time.monotonic() + self.ttl, dict(post))
+            self._entries.move_to_end((codigo, user_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, *codigos):
+        """Descarta las entradas de esas claves (con cualquier user_id)"""
+        with self._lock:
+            self._version += 1
+            for key in [key for key in self._entries if key[0] in codigos]:
+                del self._entries[key]
+    
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+# Instancias globales (POST_CACHE_SIZE=0 / USER_CACHE_SIZE=0 las desactivan)
+post_cache = RowCache(
+    max_size=int(os.getenv('POST_CACHE_SIZE', '512')),
+    ttl=float(os.getenv('POST_CACHE_TTL', '10'))
+)
+
+# Perfil y tier de usuario (to_dict, sin password_hash) por user_id
+user_cache = RowCache(
+    max_size=int(os.getenv('USER_CACHE_SIZE', '256')),
+    ttl=float(os.getenv('USER_CACHE_TTL', '30'))
+)
 
 def get_all_posts(user_id: Optional[int] = None) -> List[Dict]:
     """Obtiene todos los posts de MySQL (opcionalmente filtrados por usuario)"""
@@ -22,206 +114,352 @@ def get_all_posts(user_id: Optional[int] = None) -> List[Dict]:
 
 def get_post_by_codigo(codigo: str, user_id: Optional[int] = None) -> Optional[Dict]:
     """Obtiene un post por su código (opcionalmente verificando ownership)"""
+    cached = post_cache.get(codigo, user_id)
+    if cached is not None:
+        return cached
+    
+    version = post_cache.version()
     db = SessionLocal()
     try:
         query = db.query(Post).filter(Post.codigo == codigo)
         if user_id is not None:
             query = query.filter(Post.user_id == user_id)
         post = query.first()
-        return post.to_dict() if post else None
+        if not post:
+            return None
+        post = post.to_dict()
+        post_cache.put(codigo, user_id, post, version)
+        return post
     finally:
         db.close()
 
-def create_post(data: Dict) -> Dict:
-    """Crea un nuevo post en MySQL"""
+# Columnas de la proyección resumen (selector del panel, herramientas del chat)
+POST_SUMMARY_COLUMNS = [
+    Post.codigo, Post.titulo, Post.estado, Post.fecha_programada,
+    Post.hora_programada, Post.created_at, Post.updated_at
+]
+
+def _summary_dict(row) -> Dict:
+    """Fila de POST_SUMMARY_COLUMNS → dict (mismo formato de fechas que Post.to_dict)"""
+    return {
+        key: value.isoformat() if isinstance(value, (date, datetime)) else value
+        for key, value in row._mapping.items()
+    }
+
+def get_posts_summary(user_id: Optional[int] = None) -> List[Dict]:
+    """Resumen de todos los posts (solo POST_SUMMARY_COLUMNS, sin construir objetos ORM)"""
     db = SessionLocal()
     try:
-        # Parsear fecha si viene como string
-        fecha_prog = None
-        if data.get('fecha_programada'):
-            if isinstance(data['fecha_programada'], str):
-                try:
-                    fecha_prog = datetime.strptime(data['fecha_programada'], '%Y-%m-%d').date()
-                except:
-                    pass
-            else:
-                fecha_prog = data['fecha_programada']
-        
-        post = Post(
-            codigo=data['codigo'],
-            fecha_programada=fecha_prog,
-            hora_programada=data.get('hora_programada'),
-            titulo=data.get('titulo', ''),
-            idea=data.get('idea', ''),
-            estado=data.get('estado', 'DRAFT'),
-            drive_folder_id=data.get('drive_folder_id'),
-            urls=data.get('urls'),
-            user_id=data.get('user_id')
-        )
-        
-        db.add(post)
-        db.commit()
-        db.refresh(post)
-        
-        return post.to_dict()
-    except Exception as e:
-        db.rollback()
-        raise e
+        stmt = select(*POST_SUMMARY_COLUMNS)
+        if user_id is not None:
+            stmt = stmt.where(Post.user_id == user_id)
+        return [_summary_dict(row) for row in db.execute(stmt)]
     finally:
         db.close()
 
-def update_post(codigo: str, data: Dict, user_id: Optional[int] = None) -> Dict:
-    """Actualiza un post existente (opcionalmente verificando ownership)"""
+# Lo que lee el GC de storage (FileService._stale_files): código y checkboxes de formatos de video
+POST_GC_COLUMNS = [Post.codigo] + [
+    getattr(Post, name).label(name)
+    for name in ('feed_16x9_mp4', 'stories_9x16_mp4', 'shorts_9x16_mp4', 'tiktok_9x16_mp4')
+]
+
+def _gc_dict(row) -> Dict:
+    """Fila de POST_GC_COLUMNS → dict (los bits de la máscara llegan como 0/1)"""
+    return {key: value if key == 'codigo' else bool(value) for key, value in row._mapping.items()}
+
+def get_posts_for_gc(user_id: Optional[int] = None) -> List[Dict]:
+    """Posts para el GC de storage (solo POST_GC_COLUMNS, sin construir objetos ORM)"""
     db = SessionLocal()
     try:
-        query = db.query(Post).filter(Post.codigo == codigo)
+        stmt = select(*POST_GC_COLUMNS)
         if user_id is not None:
-            query = query.filter(Post.user_id == user_id)
-        post = query.first()
-        
-        if not post:
-            raise ValueError(f"Post {codigo} no encontrado")
-        
-        # Actualizar campos básicos
-        if 'titulo' in data:
-            post.titulo = data['titulo']
-        if 'idea' in data:
-            post.idea = data['idea']
-        if 'estado' in data:
-            post.estado = data['estado']
-        if 'drive_folder_id' in data:
-            post.drive_folder_id = data['drive_folder_id']
-        if 'urls' in data:
-            post.urls = data['urls']
-        if 'hora_programada' in data:
-            post.hora_programada = data['hora_programada']
-        if 'notas' in data:
-            post.notas = data['notas']
-        if 'feedback' in data:
-            post.feedback = data['feedback']
-        
-        # Actualizar fecha programada
-        if 'fecha_programada' in data:
-            if isinstance(data['fecha_programada'], str):
-                try:
-                    post.fecha_programada = datetime.strptime(data['fecha_programada'], '%Y-%m-%d').date()
-                except:
-                    pass
-            else:
-                post.fecha_programada = data['fecha_programada']
-        
-        # Actualizar checkboxes de textos
-        if 'base_txt' in data:
-            post.base_txt = data['base_txt']
-        if 'instagram_txt' in data:
-            post.instagram_txt = data['instagram_txt']
-        if 'linkedin_txt' in data:
-            post.linkedin_txt = data['linkedin_txt']
-        if 'twitter_txt' in data:
-            post.twitter_txt = data['twitter_txt']
-        if 'facebook_txt' in data:
-            post.facebook_txt = data['facebook_txt']
-        if 'tiktok_txt' in data:
-            post.tiktok_txt = data['tiktok_txt']
-        if 'prompt_imagen_base_txt' in data:
-            post.prompt_imagen_base_txt = data['prompt_imagen_base_txt']
-        
-        # Actualizar checkboxes de imágenes
-        if 'imagen_base_png' in data:
-            post.imagen_base_png = data['imagen_base_png']
-        if 'instagram_1x1_png' in data:
-            post.instagram_1x1_png = data['instagram_1x1_png']
-        if 'instagram_stories_9x16_png' in data:
-            post.instagram_stories_9x16_png = data['instagram_stories_9x16_png']
-        if 'linkedin_16x9_png' in data:
-            post.linkedin_16x9_png = data['linkedin_16x9_png']
-        if 'twitter_16x9_png' in data:
-            post.twitter_16x9_png = data['twitter_16x9_png']
-        if 'facebook_16x9_png' in data:
-            post.facebook_16x9_png = data['facebook_16x9_png']
-        
-        # Actualizar checkboxes de videos
-        if 'script_video_base_txt' in data:
-            post.script_video_base_txt = data['script_video_base_txt']
-        if 'video_base_mp4' in data:
-            post.video_base_mp4 = data['video_base_mp4']
-        if 'feed_16x9_mp4' in data:
-            post.feed_16x9_mp4 = data['feed_16x9_mp4']
-        if 'stories_9x16_mp4' in data:
-            post.stories_9x16_mp4 = data['stories_9x16_mp4']
-        if 'shorts_9x16_mp4' in data:
-            post.shorts_9x16_mp4 = data['shorts_9x16_mp4']
-        if 'tiktok_9x16_mp4' in data:
-            post.tiktok_9x16_mp4 = data['tiktok_9x16_mp4']
-        
-        # Actualizar selección de redes sociales (persiste qué redes eligió el usuario)
-        if 'redes_instagram' in data:
-            post.redes_instagram = data['redes_instagram']
-        if 'redes_linkedin' in data:
-            post.redes_linkedin = data['redes_linkedin']
-        if 'redes_twitter' in data:
-            post.redes_twitter = data['redes_twitter']
-        if 'redes_facebook' in data:
-            post.redes_facebook = data['redes_facebook']
-        if 'redes_tiktok' in data:
-            post.redes_tiktok = data['redes_tiktok']
-
-        # Actualizar checkboxes de publicación
-        if 'blog_published' in data:
-            post.blog_published = data['blog_published']
-        if 'instagram_published' in data:
-            post.instagram_published = data['instagram_published']
-        if 'linkedin_published' in data:
-            post.linkedin_published = data['linkedin_published']
-        if 'twitter_published' in data:
-            post.twitter_published = data['twitter_published']
-        if 'facebook_published' in data:
-            post.facebook_published = data['facebook_published']
-        if 'tiktok_published' in data:
-            post.tiktok_published = data['tiktok_published']
-        
-        # Actualizar fecha real de publicación
-        if 'fecha_real_publicacion' in data:
-            if isinstance(data['fecha_real_publicacion'], str):
-                try:
-                    post.fecha_real_publicacion = datetime.fromisoformat(data['fecha_real_publicacion'])
-                except:
-                    pass
-            else:
-                post.fecha_real_publicacion = data['fecha_real_publicacion']
-        
-        db.commit()
-        db.refresh(post)
-        
-        return post.to_dict()
-    except Exception as e:
-        db.rollback()
-        raise e
+            stmt = stmt.where(Post.user_id == user_id)
+        return [_gc_dict(row) for row in db.execute(stmt)]
     finally:
         db.close()
 
-def delete_post(codigo: str, user_id: Optional[int] = None) -> bool:
-    """Elimina un post (opcionalmente verificando ownership)"""
+def _encode_cursor(post: Dict) -> str:
+    """Cursor opaco de paginación: 'updated_at|codigo' del último post de la página"""
+    return f"{post['updated_at']}|{post['codigo']}"
+
+def _decode_cursor(cursor: str):
+    """Inverso de _encode_cursor. Lanza ValueError si el cursor no es válido"""
+    updated_at, sep, codigo = cursor.partition('|')
+    if not sep or not codigo:
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return datetime.fromisoformat(updated_at), codigo
+
+def _require_fecha(value):
+    """Como _parse_fecha_programada pero lanza ValueError si la fecha no es válida"""
+    fecha = _parse_fecha_programada(value)
+    if fecha is None:
+        raise ValueError(f"Fecha inválida: {value} (formato YYYY-MM-DD)")
+    return fecha
+
+def _posts_page_stmt(user_id: Optional[int] = None, limit: Optional[int] = None,
+                     cursor: Optional[str] = None, estado: Optional[str] = None,
+                     fecha_desde=None, fecha_hasta=None, summary: bool = False):
+    """
+    SELECT de una página de posts (compartido con async_db_service)
+    Orden estable updated_at DESC, codigo DESC; el cursor continúa tras el último
+    post visto (keyset: no usa OFFSET). Pide limit+1 filas para saber si hay más.
+    summary=True selecciona solo POST_SUMMARY_COLUMNS.
+    """
+    stmt = select(*POST_SUMMARY_COLUMNS) if summary else select(Post)
+    if user_id is not None:
+        stmt = stmt.where(Post.user_id == user_id)
+    if estado:
+        stmt = stmt.where(Post.estado == estado)
+    if fecha_desde:
+        stmt = stmt.where(Post.fecha_programada >= _require_fecha(fecha_desde))
+    if fecha_hasta:
+        stmt = stmt.where(Post.fecha_programada <= _require_fecha(fecha_hasta))
+    if cursor:
+        updated_at, codigo = _decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            Post.updated_at < updated_at,
+            and_(Post.updated_at == updated_at, Post.codigo < codigo)
+        ))
+    stmt = stmt.order_by(Post.updated_at.desc(), Post.codigo.desc())
+    if limit:
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+def _posts_page(posts: List[Dict], limit: Optional[int]) -> Dict:
+    """Recorta la fila extra y calcula next_cursor"""
+    if limit and len(posts) > limit:
+        posts = posts[:limit]
+        return {'posts': posts, 'next_cursor': _encode_cursor(posts[-1])}
+    return {'posts': posts, 'next_cursor': None}
+
+def get_posts_page(user_id: Optional[int] = None, limit: Optional[int] = 50,
+                   cursor: Optional[str] = None, estado: Optional[str] = None,
+                   fecha_desde=None, fecha_hasta=None, summary: bool = False) -> Dict:
+    """
+    Obtiene una página de posts filtrada en SQL (estado, rango de fecha_programada)
+    Devuelve {'posts': [...], 'next_cursor': str | None}
+    """
     db = SessionLocal()
     try:
-        query = db.query(Post).filter(Post.codigo == codigo)
-        if user_id is not None:
-            query = query.filter(Post.user_id == user_id)
-        post = query.first()
-        
-        if not post:
-            return False
-        
-        db.delete(post)
-        db.commit()
-        
-        return True
-    except Exception as e:
-        db.rollback()
-        raise e
+        stmt = _posts_page_stmt(user_id, limit, cursor, estado, fecha_desde, fecha_hasta, summary)
+        if summary:
+            posts = [_summary_dict(row) for row in db.execute(stmt)]
+        else:
+            posts = [post.to_dict() for post in db.execute(stmt).scalars().all()]
+        return _posts_page(posts, limit)
     finally:
         db.close()
 
+def _parse_fecha_programada(value):
+    """Normaliza fecha_programada (string YYYY-MM-DD o date). Devuelve None si no es válida"""
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except:
+            return None
+    return value
+
+def _build_post(data: Dict) -> Post:
+    """Construye el objeto Post a partir del dict de creación (compartido con async_db_service)"""
+    fecha_prog = None
+    if data.get('fecha_programada'):
+        fecha_prog = _parse_fecha_programada(data['fecha_programada'])
+    
+    return Post(
+        codigo=data['codigo'],
+        fecha_programada=fecha_prog,
+        hora_programada=data.get('hora_programada'),
+        titulo=data.get('titulo', ''),
+        idea=data.get('idea', ''),
+        estado=data.get('estado', 'DRAFT'),
+        drive_folder_id=data.get('drive_folder_id'),
+        urls=data.get('urls'),
+        user_id=data.get('user_id')
+    )
+
+def _create_post_tx(data: Dict, db) -> Dict:
+    """Escritura de create_post (compartida con async_db_service en modo escritor único)"""
+    post = _build_post(data)
+    db.add(post)
+    db.flush()
+    return post.to_dict()
+
+def create_post(data: Dict) -> Dict:
+    """Crea un nuevo post en MySQL"""
+    post = run_write(partial(_create_post_tx, data))
+    post_cache.invalidate(post['codigo'])
+    return post
+
+def _post_code_increment_stmt(fecha: str):
+    """UPDATE atómico del contador del día (la fila queda bloqueada hasta el commit)"""
+    return (
+        update(PostCodeCounter)
+        .where(PostCodeCounter.fecha == fecha)
+        .values(ultimo_numero=PostCodeCounter.ultimo_numero + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def _allocate_post_code_tx(fecha: str, db) -> str:
+    """Escritura de allocate_post_code (compartida con async_db_service en modo escritor único)"""
+    if db.execute(_post_code_increment_stmt(fecha)).rowcount == 0:
+        # Primer post del día (savepoint: el rollback no deshace otras escrituras del lote)
+        try:
+            with db.begin_nested():
+                db.execute(insert(PostCodeCounter).values(fecha=fecha, ultimo_numero=1))
+        except IntegrityError:
+            # Otro proceso creó la fila a la vez: incrementar la suya
+            db.execute(_post_code_increment_stmt(fecha))
+    
+    numero = db.execute(
+        select(PostCodeCounter.ultimo_numero).where(PostCodeCounter.fecha == fecha)
+    ).scalar_one()
+    return f"{fecha}-{numero}"
+
+def allocate_post_code(fecha: Optional[str] = None) -> str:
+    """
+    Reserva el siguiente código YYYYMMDD-n (O(1), sin escanear posts)
+    Un único UPDATE ultimo_numero+1: dos creaciones simultáneas, aunque sean
+    de procesos distintos, nunca obtienen el mismo número.
+    """
+    fecha = fecha or datetime.now().strftime('%Y%m%d')
+    return run_write(partial(_allocate_post_code_tx, fecha))
+
+# Columnas de posts actualizables vía update_post (derivado del metadata de la tabla)
+# (las máscaras de checkboxes se actualizan por bits, vía sus claves: base_txt, redes_instagram...)
+_POST_READONLY_COLUMNS = {'codigo', 'user_id', 'created_at', 'updated_at'} | set(POST_FLAG_GROUPS)
+_POST_UPDATABLE_COLUMNS = {
+    column.key: column for column in Post.__table__.columns
+    if column.key not in _POST_READONLY_COLUMNS
+}
+
+def _post_changes(data: Dict) -> Dict:
+    """
+    Filtra y normaliza el dict de cambios contra las columnas de posts (compartido con async_db_service)
+    - Ignora claves que no son columnas actualizables ni checkboxes (POST_FLAGS)
+    - Convierte strings a date/datetime según el tipo de la columna (si no es válida se ignora)
+    """
+    changes = {}
+    for key, value in data.items():
+        if key in POST_FLAGS:
+            changes[key] = bool(value)
+            continue
+        column = _POST_UPDATABLE_COLUMNS.get(key)
+        if column is None:
+            continue
+        if isinstance(value, str) and isinstance(column.type, DateTime):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                continue
+        elif isinstance(value, str) and isinstance(column.type, Date):
+            value = _parse_fecha_programada(value)
+            if value is None:
+                continue
+        changes[key] = value
+    return changes
+
+def _post_flag_values(changes: Dict) -> Dict:
+    """
+    Checkboxes cambiados → SET mask = (mask & ~apagar) | encender, una expresión por máscara
+    Un reset de fases con 12 checkboxes es una sola operación sobre artefactos_mask.
+    """
+    turn_on: Dict[str, int] = {}
+    turn_off: Dict[str, int] = {}
+    for key, value in changes.items():
+        if key in POST_FLAGS:
+            mask, bit = POST_FLAGS[key]
+            target = turn_on if value else turn_off
+            target[mask] = target.get(mask, 0) | bit
+    
+    values = {}
+    for mask in turn_on.keys() | turn_off.keys():
+        all_bits = (1 << len(POST_FLAG_GROUPS[mask])) - 1
+        expr = getattr(Post, mask)
+        if turn_off.get(mask):
+            expr = expr.bitwise_and(all_bits & ~turn_off[mask])
+        if turn_on.get(mask):
+            expr = expr.bitwise_or(turn_on[mask])
+        values[mask] = expr
+    return values
+
+def _post_update_stmt(codigo: str, data: Dict, user_id: Optional[int] = None):
+    """
+    UPDATE posts SET <solo columnas cambiadas> WHERE codigo=? [AND user_id=?]
+    Los checkboxes se aplican con operaciones de bits sobre su máscara.
+    updated_at se fija siempre (así el SET nunca queda vacío)
+    """
+    stmt = update(Post).where(Post.codigo == codigo)
+    if user_id is not None:
+        stmt = stmt.where(Post.user_id == user_id)
+    changes = _post_changes(data)
+    values = {key: value for key, value in changes.items() if key not in POST_FLAGS}
+    values.update(_post_flag_values(changes))
+    values['updated_at'] = datetime.utcnow()
+    return stmt.values(**values).execution_options(synchronize_session=False)
+
+def _update_post_tx(codigo: str, data: Dict, user_id: Optional[int], return_row: bool, db):
+    """Escritura de update_post (compartida con async_db_service en modo escritor único)"""
+    result = db.execute(_post_update_stmt(codigo, data, user_id))
+    if result.rowcount == 0:
+        raise ValueError(f"Post {codigo} no encontrado")
+    
+    if return_row:
+        return db.query(Post).filter(Post.codigo == codigo).first().to_dict()
+    return True
+
+def update_post(codigo: str, data: Dict, user_id: Optional[int] = None, return_row: bool = False):
+    """
+    Actualiza un post existente (opcionalmente verificando ownership)
+    Un único UPDATE con las columnas cambiadas. Devuelve True, o el dict
+    del post si return_row=True. Lanza ValueError si no existe.
+    """
+    result = run_write(partial(_update_post_tx, codigo, data, user_id, return_row))
+    post_cache.invalidate(codigo)
+    return result
+
+def _update_posts_tx(updates: Dict[str, Dict], user_id: Optional[int], db) -> int:
+    """Escritura de update_posts (compartida con async_db_service en modo escritor único)"""
+    updated = 0
+    for codigo, data in updates.items():
+        updated += db.execute(_post_update_stmt(codigo, data, user_id)).rowcount
+    return updated
+
+def _update_each_post_tx(updates: Dict[str, Dict], user_id: Optional[int], db) -> List[str]:
+    """Como _update_posts_tx, pero devuelve los códigos que ya no existían (rowcount 0)"""
+    return [
+        codigo for codigo, data in updates.items()
+        if db.execute(_post_update_stmt(codigo, data, user_id)).rowcount == 0
+    ]
+
+def update_posts(updates: Dict[str, Dict], user_id: Optional[int] = None) -> int:
+    """
+    Actualiza varios posts en una sola transacción
+    updates: {codigo: {campo: valor}}. Devuelve cuántos posts se actualizaron.
+    """
+    updated = run_write(partial(_update_posts_tx, updates, user_id))
+    post_cache.invalidate(*updates)
+    return updated
+
+def _delete_post_tx(codigo: str, user_id: Optional[int], db) -> bool:
+    """Escritura de delete_post (compartida con async_db_service en modo escritor único)"""
+    query = db.query(Post).filter(Post.codigo == codigo)
+    if user_id is not None:
+        query = query.filter(Post.user_id == user_id)
+    post = query.first()
+    
+    if not post:
+        return False
+    
+    db.delete(post)
+    return True
+
+def delete_post(codigo: str, user_id: Optional[int] = None) -> bool:
+    """Elimina un post (opcionalmente verificando ownership)"""
+    deleted = run_write(partial(_delete_post_tx, codigo, user_id))
+    if deleted:
+        post_cache.invalidate(codigo)
+    return deleted
+
 def get_social_token(platform: str, user_id: Optional[int] = None) -> Optional[Dict]:
     """Obtiene el token de una red social (opcionalmente por usuario)"""
     db = SessionLocal()
@@ -275,24 +513,24 @@ def save_social_token(platform: str, token_data: Dict = None,
     """
     Guarda o actualiza un token de red social.
     """
-    db = SessionLocal()
-    try:
-        # NORMALIZAR token_data
-        if token_data:
-            access_token = token_data.get('access_token')
-            refresh_token = token_data.get('refresh_token')
-            username = token_data.get('username')
-            page_id = token_data.get('page_id')
-            instagram_account_id = token_data.get('instagram_account_id')
-            user_id = token_data.get('user_id')
-
-            # Calcular expires_at
-            expires_in = token_data.get('expires_in')
-            if expires_in:
-                expires_at = datetime.now() + timedelta(seconds=int(expires_in))
-            elif isinstance(token_data.get('expires_at'), str):
-                expires_at = datetime.fromisoformat(token_data.get('expires_at'))
-
+    user_id = None
+    # NORMALIZAR token_data
+    if token_data:
+        access_token = token_data.get('access_token')
+        refresh_token = token_data.get('refresh_token')
+        username = token_data.get('username')
+        page_id = token_data.get('page_id')
+        instagram_account_id = token_data.get('instagram_account_id')
+        user_id = token_data.get('user_id')
+
+        # Calcular expires_at
+        expires_in = token_data.get('expires_in')
+        if expires_in:
+            expires_at = datetime.now() + timedelta(seconds=int(expires_in))
+        elif isinstance(token_data.get('expires_at'), str):
+            expires_at = datetime.fromisoformat(token_data.get('expires_at'))
+
+    def write(db):
         # --- GUARDAR (por plataforma y usuario) ---
         # Nota: SocialToken.user_id es NOT NULL, por lo que debemos persistirlo siempre
         rec = None
@@ -327,23 +565,20 @@ def save_social_token(platform: str, token_data: Dict = None,
             )
             db.add(rec)
 
-        db.commit()
+        db.flush()
         db.refresh(rec)
-
         return rec.to_dict()
 
+    try:
+        return run_write(write)
     except Exception as e:
-        db.rollback()
         print(f"❌ Error guardando token: {e}")
         raise
-    finally:
-        db.close()
 
 
 def delete_social_token(platform: str, user_id: Optional[int] = None) -> bool:
     """Elimina un token de red social (opcionalmente por usuario)"""
-    db = SessionLocal()
-    try:
+    def write(db):
         query = db.query(SocialToken).filter(SocialToken.platform == platform)
         if user_id is not None:
             query = query.filter(SocialToken.user_id == user_id)
@@ -353,14 +588,9 @@ def delete_social_token(platform: str, user_id: Optional[int] = None) -> bool:
             return False
         
         db.delete(token)
-        db.commit()
-        
         return True
-    except Exception as e:
-        db.rollback()
-        raise e
-    finally:
-        db.close()
+    
+    return run_write(write)
 
 def get_social_tokens(user_id: Optional[int] = None) -> Dict:
     """Obtiene todos los tokens organizados por plataforma"""
@@ -398,8 +628,7 @@ def upsert_social_page(page: Dict) -> Dict:
         'user_id': int | None
     }
     """
-    db = SessionLocal()
-    try:
+    def write(db):
         rec = db.query(SocialPage).filter(SocialPage.page_id == page['page_id']).first()
 
         if rec:
@@ -424,16 +653,15 @@ def upsert_social_page(page: Dict) -> Dict:
             )
             db.add(rec)
 
-        db.commit()
+        db.flush()
         db.refresh(rec)
         return rec.to_dict()
 
+    try:
+        return run_write(write)
     except Exception as e:
-        db.rollback()
         print(f"❌ Error guardando página: {e}")
         raise
-    finally:
-        db.close()
 
 
 def list_social_pages(platform: str = None, user_id: Optional[int] = None) -> List[Dict]:
@@ -470,6 +698,23 @@ def get_user_by_id(user_id: int) -> Optional[User]:
     finally:
         db.close()
 
+def get_user_profile(user_id: int) -> Optional[Dict]:
+    """
+    Perfil del usuario (User.to_dict: tier, system_prompt, contadores...) desde user_cache
+    Para límites, chat y /me; se invalida en update_user y al contar publicaciones.
+    """
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    version = user_cache.version()
+    user = get_user_by_id(user_id)
+    if not user:
+        return None
+    profile = user.to_dict()
+    user_cache.put(user_id, None, profile, version)
+    return profile
+
 def get_user_by_email(email: str) -> Optional[User]:
     db = SessionLocal()
     try:
@@ -484,50 +729,43 @@ def get_user_count() -> int:
     finally:
         db.close()
 
+def _create_user_tx(email: str, password_hash: str, name: Optional[str], db) -> User:
+    """Escritura de create_user (compartida con async_db_service en modo escritor único)"""
+    user = User(email=email, password_hash=password_hash, name=name)
+    db.add(user)
+    db.flush()
+    db.refresh(user)
+    return user
+
 def create_user(email: str, password_hash: str, name: Optional[str] = None) -> User:
-    db = SessionLocal()
-    try:
-        user = User(email=email, password_hash=password_hash, name=name)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-        return user
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    return run_write(partial(_create_user_tx, email, password_hash, name))
+
+def _update_user_tx(user_id: int, updates: Dict, db) -> Optional[User]:
+    """Escritura de update_user (compartida con async_db_service en modo escritor único)"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        return None
+    for key, value in updates.items():
+        if hasattr(user, key):
+            setattr(user, key, value)
+    db.flush()
+    db.refresh(user)
+    return user
 
 def update_user(user_id: int, updates: Dict) -> Optional[User]:
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return None
-        for key, value in updates.items():
-            if hasattr(user, key):
-                setattr(user, key, value)
-        db.commit()
-        db.refresh(user)
-        return user
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    """Actualiza campos del usuario (incluido el tier de la suscripción) e invalida su perfil cacheado"""
+    user = run_write(partial(_update_user_tx, user_id, updates))
+    user_cache.invalidate(user_id)
+    return user
 
 def claim_unowned_posts(user_id: int) -> int:
     """Asigna posts sin owner al usuario indicado (para migración inicial)."""
-    db = SessionLocal()
-    try:
-        updated = db.query(Post).filter(Post.user_id == None).update({Post.user_id: user_id})
-        db.commit()
-        return updated or 0
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    updated = run_write(
+        lambda db: db.query(Post).filter(Post.user_id == None).update({Post.user_id: user_id})
+    )
+    if updated:
+        post_cache.clear()
+    return updated or 0
 
 def get_social_page_by_instagram_id(instagram_account_id: str, user_id: Optional[int] = None) -> Optional[Dict]:
     db = SessionLocal()
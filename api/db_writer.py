@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Escrituras a BD: transacción directa o cola de un único escritor (group commit)
+
+Cada escritura es una función fn(db) que trabaja sobre la sesión recibida
+sin hacer commit (run_write lo hace). Con DB_SINGLE_WRITER=1 todas las
+escrituras del proceso se encolan a un solo hilo escritor, que agrupa las
+pendientes y las confirma en un único commit: en SQLite desaparecen los
+"database is locked" entre escritores del mismo proceso. Las lecturas
+siguen usando el pool normal.
+
+Solo serializa dentro de un proceso: la API, el MCP server y cada worker
+de uvicorn tienen su propio hilo escritor. Entre procesos siguen
+compitiendo por el lock de SQLite (busy_timeout).
+
+Desde código async usar run_write_async: run_write bloquea hasta el commit.
+"""
+from database import WriteSessionLocal
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class WriteQueue:
+    """
+    Hilo escritor único con group commit
+
+    - Toma todas las escrituras pendientes (hasta max_batch) y las ejecuta en una transacción
+    - Si una falla, deshace el lote y reintenta cada escritura por separado
+      (así el error solo llega a quien lo causó)
+    - Las funciones deben ser solo de BD: pueden reejecutarse tras un rollback
+    """
+
+    def __init__(self, session_factory=WriteSessionLocal, max_batch: int = 64):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self.largest_batch = 0
+        self.retried_batches = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable) -> Future:
+        """Encola fn(db); el Future se resuelve tras el commit del lote"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Escritura anidada dentro del hilo escritor")
+        future = Future()
+        # Copiar el contexto: las queries cuentan en el track_db_stats() del llamador
+        self._queue.put((fn, future, contextvars.copy_context()))
+        return future
+
+    def run(self, fn: Callable[..., T]) -> T:
+        """Encola fn(db) y espera su resultado (bloqueante)"""
+        return self.submit(fn).result()
+
+    async def run_async(self, fn: Callable[..., T]) -> T:
+        """Encola fn(db) y espera su resultado sin bloquear el event loop"""
+        return await asyncio.wrap_future(self.submit(fn))
+
+    def close(self):
+        """Termina el hilo tras confirmar lo ya encolado"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict:
+        return {
+            'pending': self._queue.qsize(),
+            'batches': self.batches,
+            'writes': self.writes,
+            'avg_batch': round(self.writes / self.batches, 2) if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'retried_batches': self.retried_batches
+        }
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+
+            batch = [job for job in batch if job[1].set_running_or_notify_cancel()]
+            if batch:
+                self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch: List[Tuple[Callable, Future, contextvars.Context]]):
+        db = self.session_factory()
+        try:
+            results = []
+            for fn, _, ctx in batch:
+                results.append(ctx.run(fn, db))
+                db.flush()  # Errores de constraint → se atribuyen a esta escritura
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            else:
+                logger.warning(f"⚠️ Lote de {len(batch)} escrituras falló ({e}); reintentando una a una")
+                self.retried_batches += 1
+                for job in batch:
+                    self._commit_batch([job])
+            return
+        finally:
+            db.close()
+
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+# Modo escritor único (opcional): DB_SINGLE_WRITER=1
+write_queue: Optional[WriteQueue] = None
+if os.getenv('DB_SINGLE_WRITER', '0') == '1':
+    write_queue = WriteQueue(max_batch=int(os.getenv('DB_WRITER_MAX_BATCH', '64')))
+    logger.info(f"✍️ Escritor único de BD activo (lotes de hasta {write_queue.max_batch})")
+
+def run_write(fn: Callable[..., T]) -> T:
+    """
+    Ejecuta fn(db) como escritura y devuelve su resultado
+    Con escritor único va a la cola; si no, en su propia transacción.
+    fn no debe hacer commit ni rollback.
+    """
+    if write_queue is not None:
+        return write_queue.run(fn)
+
+    db = WriteSessionLocal()
+    try:
+        result = fn(db)
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_write_async(fn: Callable[..., T]) -> T:
+    """Como run_write, sin bloquear el event loop (cola del escritor único o un hilo del pool)"""
+    if write_queue is not None:
+        return await write_queue.run_async(fn)
+    return await asyncio.to_thread(run_write, fn)
+
+def writer_stats() -> Optional[Dict]:
+    """Estadísticas del escritor único (None si está desactivado)"""
+    return write_queue.stats() if write_queue is not None else None
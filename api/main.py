@@ -1,10 +1,11 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from starlette.middleware.sessions import SessionMiddleware
 from dotenv import load_dotenv
 import os
+import asyncio
 import logging
 import time
 
@@ -26,6 +27,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+from database import track_db_stats, engine, async_engine
+from db_migrations import run_migrations, DB_MIGRATE_ON_STARTUP
+from db_service import post_cache, user_cache
+from db_writer import write_queue, writer_stats
+import async_db_service
+from services.limits_service import limits_service
+from services.file_service import file_service, STORAGE_GC_INTERVAL_HOURS, STORAGE_RECONCILE_ON_STARTUP
+from services.thumbnail_service import thumbnail_service
+from services.fal_upload_service import fal_upload_service
+
 app = FastAPI(
     title="Lavelo Blog API",
     description="API para gestión automatizada de contenido de triatlón",
@@ -67,16 +78,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Middleware para logging de requests
+# Middleware para logging de requests (incluye queries/commits a BD del request)
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start_time = time.time()
     logger.info(f"📥 {request.method} {request.url.path}")
     
-    response = await call_next(request)
+    with track_db_stats() as db_stats:
+        response = await call_next(request)
     
     process_time = time.time() - start_time
-    logger.info(f"📤 {request.method} {request.url.path} → {response.status_code} ({process_time:.2f}s)")
+    response.headers['X-DB-Queries'] = str(db_stats['queries'])
+    response.headers['X-DB-Commits'] = str(db_stats['commits'])
+    logger.info(f"📤 {request.method} {request.url.path} → {response.status_code} ({process_time:.2f}s, {db_stats['queries']} queries, {db_stats['commits']} commits)")
     
     return response
 
@@ -136,7 +150,41 @@ async def serve_html(filename: str):
         return FileResponse(file_path)
     raise HTTPException(status_code=404, detail="File not found")
 
-# Health check
+# Migraciones pendientes antes de servir (lock entre procesos: con varios workers migra uno)
+@app.on_event("startup")
+async def migrate_schema():
+    if DB_MIGRATE_ON_STARTUP:
+        await asyncio.to_thread(run_migrations, engine)
+
+# GC de storage en segundo plano (STORAGE_GC_INTERVAL_HOURS > 0):
+# borra carpetas de posts eliminados y archivos obsoletos, en lotes
+storage_gc_task = None
+
+@app.on_event("startup")
+async def start_storage_gc():
+    global storage_gc_task
+    # Manifiestos y agregado de uso al día antes de servir (no se hace dentro de las peticiones)
+    if STORAGE_RECONCILE_ON_STARTUP:
+        await file_service.reconcile_index_async()
+    if STORAGE_GC_INTERVAL_HOURS > 0:
+        storage_gc_task = asyncio.create_task(file_service.gc_loop(async_db_service.get_posts_for_gc))
+        logger.info(f"🧹 GC de storage cada {STORAGE_GC_INTERVAL_HOURS}h")
+
+# Cerrar conexiones async (aiosqlite usa un hilo por conexión),
+# volcar el cupo anónimo, terminar las escrituras de disco pendientes,
+# parar los procesos de miniaturas y confirmar lo que quede en la cola del escritor único
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    if storage_gc_task is not None:
+        storage_gc_task.cancel()
+    limits_service.anonymous_limiter.close()
+    file_service.close()
+    thumbnail_service.close()
+    if write_queue is not None:
+        write_queue.close()
+    await async_engine.dispose()
+
+# Health check (liveness: sin datos internos, sin autenticación)
 @app.get("/health")
 async def health():
     return {
@@ -145,6 +193,20 @@ async def health():
         "framework": "FastAPI"
     }
 
+# Contadores de cachés, escritor de BD, cupo anónimo y subidas (solo usuarios logueados)
+@app.get("/api/stats")
+async def stats(request: Request):
+    if not request.session.get('user_id'):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+    return {
+        "post_cache": post_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "db_writer": writer_stats(),
+        "anonymous_limiter": limits_service.anonymous_limiter.stats(),
+        "thumbnails": thumbnail_service.stats(),
+        "fal_uploads": fal_upload_service.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -11,6 +11,7 @@ import os
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 import db_service
+import async_db_service
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -47,7 +48,7 @@ class SettingsRequest(BaseModel):
 
 @router.post("/register")
 async def register(req: RegisterRequest, request: Request):
-    existing = db_service.get_user_by_email(req.email)
+    existing = await async_db_service.get_user_by_email(req.email)
     if existing:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -56,8 +57,8 @@ async def register(req: RegisterRequest, request: Request):
 
     _ensure_password_length(req.password)
     password_hash = pwd_context.hash(req.password)
-    user = db_service.create_user(req.email, password_hash, req.name)
-    db_service.update_user(user.id, {"last_login": datetime.utcnow()})
+    user = await async_db_service.create_user(req.email, password_hash, req.name)
+    await async_db_service.update_user(user.id, {"last_login": datetime.utcnow()})
 
     # Si es el primer usuario, asignar posts existentes sin owner
     try:
@@ -71,7 +72,7 @@ async def register(req: RegisterRequest, request: Request):
 
 @router.post("/login")
 async def login(req: LoginRequest, request: Request):
-    user = db_service.get_user_by_email(req.email)
+    user = await async_db_service.get_user_by_email(req.email)
     if not user or not user.password_hash:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -85,7 +86,7 @@ async def login(req: LoginRequest, request: Request):
             detail="Credenciales incorrectas"
         )
 
-    db_service.update_user(user.id, {"last_login": datetime.utcnow()})
+    await async_db_service.update_user(user.id, {"last_login": datetime.utcnow()})
     request.session['user_id'] = user.id
     return {"success": True, "user": user.to_dict()}
 
@@ -99,27 +100,27 @@ async def me(request: Request):
     user_id = request.session.get('user_id')
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-    user = db_service.get_user_by_id(user_id)
+    user = await async_db_service.get_user_profile(user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-    return {"success": True, "user": user.to_dict()}
+    return {"success": True, "user": user}
 
 @router.get("/settings")
 async def get_settings(request: Request):
     user_id = request.session.get('user_id')
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-    user = db_service.get_user_by_id(user_id)
+    user = await async_db_service.get_user_profile(user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-    return {"success": True, "system_prompt": user.system_prompt or ""}
+    return {"success": True, "system_prompt": user['system_prompt'] or ""}
 
 @router.post("/settings")
 async def update_settings(req: SettingsRequest, request: Request):
     user_id = request.session.get('user_id')
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-    user = db_service.update_user(user_id, {"system_prompt": req.system_prompt or ""})
+    user = await async_db_service.update_user(user_id, {"system_prompt": req.system_prompt or ""})
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
     return {"success": True}
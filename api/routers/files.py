@@ -2,67 +2,236 @@
 Router de Files para FastAPI
 Endpoints para leer/escribir archivos (reemplaza Drive)
 """
-from fastapi import APIRouter, HTTPException, status, UploadFile, File, Request
-from fastapi.responses import Response, FileResponse
-from typing import Optional
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Request, Query
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+import mimetypes
 import sys
 import os
 
 # Agregar path para importar servicios
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from services.file_service import file_service
-import db_service
+from services.file_service import file_service, entry_written, iter_upload, UploadTooLarge
+from services.thumbnail_service import thumbnail_service, THUMB_MIN_WIDTH, THUMB_MAX_WIDTH
+import async_db_service
 
 router = APIRouter(
     prefix="/api/files",
     tags=["Files"]
 )
 
+# Política de caché del navegador por carpeta (siempre privada: los archivos van por sesión)
+# - textos: se editan a menudo → revalidar siempre (304 si no cambiaron)
+# - imagenes/videos: se regeneran menos → reusar un rato y luego revalidar
+FOLDER_CACHE_CONTROL = {
+    'textos': 'private, no-cache',
+    'imagenes': 'private, max-age=60, must-revalidate',
+    'videos': 'private, max-age=300, must-revalidate'
+}
+DEFAULT_CACHE_CONTROL = 'private, no-cache'
+
+def _cache_headers(folder: str, entry: Dict) -> Dict[str, str]:
+    """ETag fuerte (hash del contenido, del manifiesto), Last-Modified y Cache-Control de la carpeta"""
+    return {
+        'etag': f'"{entry["hash"][:32]}"',
+        'last-modified': formatdate(entry_written(entry), usegmt=True),
+        'cache-control': FOLDER_CACHE_CONTROL.get(folder, DEFAULT_CACHE_CONTROL)
+    }
+
+def _not_modified(request: Request, headers: Dict[str, str], entry: Dict) -> bool:
+    """
+    True si la copia del navegador sigue siendo válida
+    If-None-Match tiene prioridad; If-Modified-Since solo se mira si no viene (RFC 9110)
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return headers['etag'] in tags
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(entry_written(entry)) <= since
+    return False
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Rango único 'bytes=a-b' | 'bytes=a-' | 'bytes=-n' → (start, end) inclusivo
+    None si no se entiende o pide varios rangos (se sirve entero);
+    ValueError si no es satisfacible (416)
+    """
+    unit, _, spec = range_header.partition('=')
+    start_text, dash, end_text = spec.strip().partition('-')
+    if unit.strip() != 'bytes' or ',' in spec or not dash:
+        return None
+    if not all(part == '' or part.isdigit() for part in (start_text, end_text)):
+        return None
+    if start_text == '':
+        if end_text == '':
+            return None
+        if int(end_text) == 0:
+            raise ValueError("Rango no satisfacible")
+        return max(size - int(end_text), 0), size - 1
+    start = int(start_text)
+    end = min(int(end_text), size - 1) if end_text else size - 1
+    if start >= size or start > end:
+        raise ValueError("Rango no satisfacible")
+    return start, end
+
+def _remote_file_response(request: Request, codigo: str, folder: str, filename: str,
+                          entry: Dict, headers: Dict[str, str], media_type: str):
+    """Streaming desde un backend remoto (S3) con soporte de Range/If-Range → 206"""
+    size = entry['size']
+    headers = {**headers, 'accept-ranges': 'bytes'}
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if range_header and (if_range is None or if_range == headers['etag']):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                            headers={**headers, 'content-range': f'bytes */{size}'})
+        if byte_range is not None:
+            start, end = byte_range
+            return StreamingResponse(
+                file_service.iter_file(codigo, folder, filename, start, end),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=media_type,
+                headers={**headers, 'content-range': f'bytes {start}-{end}/{size}',
+                         'content-length': str(end - start + 1)}
+            )
+    return StreamingResponse(
+        file_service.iter_file(codigo, folder, filename),
+        media_type=media_type,
+        headers={**headers, 'content-length': str(size)}
+    )
+
+# Rutas /storage/* antes de /{codigo}/{folder}: si no, "storage" se toma como código de post
+@router.get("/storage/gc")
+async def get_storage_gc_report(request: Request):
+    """
+    Informe en seco del GC de storage para los posts del usuario: archivos
+    obsoletos (variaciones antiguas, videos reemplazados) con los bytes recuperables.
+    Sin carpetas huérfanas: sin fila en BD no tienen dueño ni se muestran a nadie.
+    No borra nada (el borrado lo hace el GC en segundo plano, STORAGE_GC_INTERVAL_HOURS).
+    
+    Usado por: Panel web (estadísticas)
+    """
+    try:
+        user_id = request.session.get('user_id')
+        if not user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+        posts = {post['codigo']: post for post in await async_db_service.get_posts_for_gc(user_id=user_id)}
+        report = await file_service.collect_garbage_async(posts, dry_run=True, orphans=False)
+        return {
+            'success': True,
+            'gc': report
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/storage/info")
+async def get_storage_info(request: Request):
+    """
+    Obtiene información del storage
+    
+    Usado por: Panel web (estadísticas)
+    """
+    try:
+        user_id = request.session.get('user_id')
+        if not user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+        info = await file_service.get_storage_info_async()
+        return {
+            'success': True,
+            'storage': info
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.get("/{codigo}/{folder}/{filename}")
-async def get_file(codigo: str, folder: str, filename: str, request: Request):
+async def get_file(
+    codigo: str,
+    folder: str,
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=THUMB_MIN_WIDTH, le=THUMB_MAX_WIDTH),
+    fmt: Optional[str] = Query(None, pattern="^(webp|jpeg|png)$")
+):
     """
     Obtiene un archivo (texto o binario)
+    Los binarios se sirven en streaming (FileResponse desde disco, o por rangos
+    desde S3): Content-Length, Accept-Ranges y respuestas 206 para que el
+    <video> del panel pueda saltar sin cargar el archivo entero en memoria.
+    Texto y binarios llevan ETag/Last-Modified (del manifiesto) y Cache-Control
+    por carpeta; If-None-Match / If-Modified-Since válidos → 304 sin cuerpo.
+    
+    Imágenes con ?w=320&fmt=webp → derivado redimensionado (ver thumbnail_service),
+    cacheado en disco; el ETag incluye los parámetros.
     
-    Usado por: Panel web (cargar textos, imágenes)
+    Usado por: Panel web (cargar textos, imágenes, previews de video)
     """
     try:
         user_id = request.session.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
 
         # Detectar si es texto o binario por extensión
         is_text = filename.endswith(('.txt', '.md', '.json', '.html', '.css', '.js'))
         
+        # Del manifiesto; un archivo copiado a mano tras el arranque se indexa aquí (solo ese)
+        entry = await file_service.index_file_async(codigo, folder, filename)
+        if entry is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Archivo {filename} no encontrado"
+            )
+        headers = _cache_headers(folder, entry)
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        derivative = w is not None or fmt is not None
+        if derivative:
+            if is_text or not content_type.startswith('image/'):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="w/fmt solo aplican a imágenes")
+            fmt = fmt or 'webp'
+            headers['etag'] = f'"{entry["hash"][:32]}-w{w or 0}.{fmt}"'
+        if _not_modified(request, headers, entry):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        if derivative:
+            thumb_path = await thumbnail_service.get_thumbnail(codigo, folder, filename, entry, w, fmt)
+            return FileResponse(thumb_path, media_type=f'image/{fmt}', headers=headers)
+
         if is_text:
-            content = file_service.read_file(codigo, folder, filename)
+            content = await file_service.read_file_async(codigo, folder, filename)
             if content is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Archivo {filename} no encontrado"
                 )
-            return {'success': True, 'content': content}
+            return JSONResponse({'success': True, 'content': content}, headers=headers)
         else:
             # Archivo binario (imagen, video)
-            data = file_service.read_binary_file(codigo, folder, filename)
-            if data is None:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Archivo {filename} no encontrado"
-                )
-            
-            # Detectar content type
-            content_type = 'application/octet-stream'
-            if filename.endswith('.png'):
-                content_type = 'image/png'
-            elif filename.endswith(('.jpg', '.jpeg')):
-                content_type = 'image/jpeg'
-            elif filename.endswith('.mp4'):
-                content_type = 'video/mp4'
-            
-            return Response(content=data, media_type=content_type)
+            file_path = file_service.get_file_path(codigo, folder, filename)
+            if file_path is not None:
+                return FileResponse(file_path, media_type=content_type, headers=headers)
+            return _remote_file_response(request, codigo, folder, filename, entry, headers, content_type)
     
     except HTTPException:
         raise
@@ -85,13 +254,13 @@ async def save_file(codigo: str, folder: str, filename: str, content: dict, requ
         user_id = request.session.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
 
         text_content = content.get('content', '')
         
-        success = file_service.save_file(codigo, folder, filename, text_content)
+        success = await file_service.save_file_async(codigo, folder, filename, text_content)
         
         if not success:
             raise HTTPException(
@@ -102,11 +271,11 @@ async def save_file(codigo: str, folder: str, filename: str, content: dict, requ
         # Si es prompt de imagen, resetear fases dependientes
         if 'prompt_imagen' in filename:
             print(f"🔄 Prompt de imagen modificado, reseteando fases dependientes...")
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             
             if post and post.get('estado') not in ['DRAFT', 'BASE_TEXT_AWAITING', 'ADAPTED_TEXTS_AWAITING', 'IMAGE_PROMPT_AWAITING']:
                 # Resetear checkboxes de imagen
-                db_service.update_post(codigo, {
+                await async_db_service.update_post(codigo, {
                     'imagen_base_png': False,
                     'instagram_1x1_png': False,
                     'instagram_stories_9x16_png': False,
@@ -119,12 +288,12 @@ async def save_file(codigo: str, folder: str, filename: str, content: dict, requ
 
             # Limpiar imágenes y metadata de variaciones anteriores
             try:
-                imagenes = file_service.list_files(codigo, 'imagenes')
+                imagenes = await file_service.list_files_async(codigo, 'imagenes')
                 for fname in imagenes:
                     if fname.startswith(f"{codigo}_imagen_base") and fname.endswith(".png"):
-                        file_service.delete_file(codigo, 'imagenes', fname)
+                        await file_service.delete_file_async(codigo, 'imagenes', fname)
                 # Borrar metadata de variaciones
-                file_service.delete_file(codigo, 'textos', f"{codigo}_imagen_variations.json")
+                await file_service.delete_file_async(codigo, 'textos', f"{codigo}_imagen_variations.json")
                 print("🧹 Variaciones anteriores eliminadas")
             except Exception as e:
                 print(f"⚠️ No se pudieron limpiar variaciones: {e}")
@@ -153,26 +322,22 @@ async def upload_file(codigo: str, folder: str, file: UploadFile = File(...), re
         user_id = request.session.get('user_id') if request else None
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
 
-        # Leer contenido del archivo
-        data = await file.read()
-        
-        # Guardar
-        success = file_service.save_binary_file(codigo, folder, file.filename, data)
-        
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error guardando archivo"
-            )
+        # Copiar por trozos al almacén (tope MAX_UPLOAD_MB)
+        try:
+            entry = await file_service.save_upload_async(codigo, folder, file.filename, iter_upload(file))
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
         
         return {
             'success': True,
             'filename': file.filename,
-            'size': len(data),
+            'size': entry['size'],
             'url': file_service.get_file_url(codigo, folder, file.filename),
             'message': f"✅ Archivo {file.filename} subido"
         }
@@ -196,10 +361,10 @@ async def list_files(codigo: str, folder: str, request: Request):
         user_id = request.session.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
-        files = file_service.list_files(codigo, folder)
+        files = await file_service.list_files_async(codigo, folder)
         return {
             'success': True,
             'files': files,
@@ -222,10 +387,10 @@ async def delete_file(codigo: str, folder: str, filename: str, request: Request)
         user_id = request.session.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
-        success = file_service.delete_file(codigo, folder, filename)
+        success = await file_service.delete_file_async(codigo, folder, filename)
         
         if not success:
             raise HTTPException(
@@ -244,25 +409,3 @@ async def delete_file(codigo: str, folder: str, filename: str, request: Request)
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
-
-@router.get("/storage/info")
-async def get_storage_info(request: Request):
-    """
-    Obtiene información del storage
-    
-    Usado por: Panel web (estadísticas)
-    """
-    try:
-        user_id = request.session.get('user_id')
-        if not user_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        info = file_service.get_storage_info()
-        return {
-            'success': True,
-            'storage': info
-        }
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e)
-        )
@@ -11,8 +11,8 @@ import json
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from services.image_service import image_service
-from services.file_service import file_service
-import db_service
+from services.file_service import file_service, iter_upload, UploadTooLarge
+import async_db_service
 
 router = APIRouter(
     prefix="/api",
@@ -42,7 +42,7 @@ async def generate_image(request: GenerateImageRequest, http_request: Request):
         user_id = http_request.session.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(request.codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(request.codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
         result = await image_service.generate_image(request.codigo, request.num_images, user_id=user_id)
@@ -64,7 +64,7 @@ async def format_images(request: FormatImagesRequest, http_request: Request):
         user_id = http_request.session.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(request.codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(request.codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
         result = await image_service.format_images(request.codigo, user_id=user_id)
@@ -83,17 +83,18 @@ async def upload_image(codigo: str, file: UploadFile = File(...), http_request:
     Usado por: Panel web (subir imagen manual)
     """
     try:
-        # Leer contenido del archivo
-        image_bytes = await file.read()
-        
         user_id = http_request.session.get('user_id') if http_request else None
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
-        result = await image_service.upload_manual_image(codigo, file.filename, image_bytes, user_id=user_id)
+        result = await image_service.upload_manual_image(codigo, file.filename, iter_upload(file), user_id=user_id)
         return result
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -113,35 +114,31 @@ async def select_base_image(request: SelectBaseImageRequest, http_request: Reque
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
         codigo = request.codigo
         filename = request.filename
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
 
         if not filename or not filename.endswith(".png"):
             raise Exception("Filename inválido")
 
-        # Leer variación
-        image_bytes = file_service.read_binary_file(codigo, "imagenes", filename)
-        if not image_bytes:
-            raise Exception("Imagen no encontrada")
-
-        # Guardar como imagen base
+        # Enlazar la variación como imagen base (mismo blob, sin copiar bytes)
         base_filename = f"{codigo}_imagen_base.png"
-        file_service.save_binary_file(codigo, "imagenes", base_filename, image_bytes)
+        if not await file_service.copy_file_async(codigo, "imagenes", filename, "imagenes", base_filename):
+            raise Exception("Imagen no encontrada")
 
         # Actualizar metadata de variaciones
         metadata_filename = f"{codigo}_imagen_variations.json"
-        metadata_text = file_service.read_file(codigo, "textos", metadata_filename)
+        metadata_text = await file_service.read_file_async(codigo, "textos", metadata_filename)
         if metadata_text:
             try:
                 metadata = json.loads(metadata_text)
                 metadata["selected"] = filename
-                file_service.save_file(codigo, "textos", metadata_filename, json.dumps(metadata, indent=2))
+                await file_service.save_file_async(codigo, "textos", metadata_filename, json.dumps(metadata, indent=2))
             except Exception:
                 pass
 
         # Al cambiar imagen base, resetear formatos y fases posteriores
-        db_service.update_post(codigo, {
+        await async_db_service.update_post(codigo, {
             "imagen_base_png": True,
             "instagram_1x1_png": False,
             "instagram_stories_9x16_png": False,
@@ -183,12 +180,12 @@ async def improve_prompt_visual(
     try:
         from services.content_service import ContentService
         from services.file_service import file_service
-        import db_service
+        import async_db_service
         
         user_id = http_request.session.get('user_id') if http_request else None
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
         content_service = ContentService()
@@ -205,12 +202,9 @@ async def improve_prompt_visual(
         
         for ref_num, (ref_file, influence) in enumerate([(ref1, ref1_influence), (ref2, ref2_influence)], 1):
             if ref_file and ref_file.filename:
-                # Leer imagen
-                ref_bytes = await ref_file.read()
-                
-                # Guardar en storage local
+                # Guardar en storage por trozos (sin leerla entera)
                 ref_filename = f"{codigo}_referencia_{ref_num}.png"
-                file_service.save_binary_file(codigo, 'imagenes', ref_filename, ref_bytes)
+                await file_service.save_upload_async(codigo, 'imagenes', ref_filename, iter_upload(ref_file))
                 
                 influence_labels = {
                     0.5: 'Inspiración (mood/colores)',
@@ -235,16 +229,16 @@ async def improve_prompt_visual(
         
         # Guardar prompt mejorado
         prompt_filename = f"{codigo}_prompt_imagen.txt"
-        file_service.save_file(codigo, 'textos', prompt_filename, improved_prompt)
+        await file_service.save_file_async(codigo, 'textos', prompt_filename, improved_prompt)
         print(f"💾 Prompt mejorado guardado: {prompt_filename}")
 
         # Limpiar imágenes/variaciones anteriores al cambiar prompt
         try:
-            imagenes = file_service.list_files(codigo, 'imagenes')
+            imagenes = await file_service.list_files_async(codigo, 'imagenes')
             for fname in imagenes:
                 if fname.startswith(f"{codigo}_imagen_base") and fname.endswith(".png"):
-                    file_service.delete_file(codigo, 'imagenes', fname)
-            file_service.delete_file(codigo, 'textos', f"{codigo}_imagen_variations.json")
+                    await file_service.delete_file_async(codigo, 'imagenes', fname)
+            await file_service.delete_file_async(codigo, 'textos', f"{codigo}_imagen_variations.json")
             print("🧹 Variaciones anteriores eliminadas")
         except Exception as e:
             print(f"⚠️ No se pudieron limpiar variaciones: {e}")
@@ -256,15 +250,15 @@ async def improve_prompt_visual(
                 'selections': selections_dict
             }
             metadata_filename = f"{codigo}_referencias_metadata.json"
-            file_service.save_file(codigo, 'textos', metadata_filename, json.dumps(metadata, indent=2))
+            await file_service.save_file_async(codigo, 'textos', metadata_filename, json.dumps(metadata, indent=2))
             print(f"💾 Metadata guardada: {metadata_filename}")
         
         # Resetear fases de imagen para regenerar con nuevo prompt
         print(f"🔄 Reseteando fases de imagen para regenerar...")
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         
         if post and post.get('estado') not in ['DRAFT', 'BASE_TEXT_AWAITING', 'ADAPTED_TEXTS_AWAITING', 'IMAGE_PROMPT_AWAITING']:
-            db_service.update_post(codigo, {
+            await async_db_service.update_post(codigo, {
                 'imagen_base_png': False,
                 'instagram_1x1_png': False,
                 'instagram_stories_9x16_png': False,
@@ -282,6 +276,10 @@ async def improve_prompt_visual(
             'metadata': reference_info
         }
         
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
     except Exception as e:
         print(f"❌ Error mejorando prompt: {e}")
         raise HTTPException(
@@ -2,8 +2,14 @@
 Router de Posts para FastAPI
 Endpoints HTTP para el panel web
 """
-from fastapi import APIRouter, HTTPException, status, Request
+from fastapi import APIRouter, HTTPException, status, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from typing import List, Optional
+from datetime import date
+import base64
+import binascii
+import json
 import sys
 import os
 
@@ -12,6 +18,7 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from models.post import Post, PostCreate, PostUpdate
 from services.post_service import PostService
 from services.limits_service import limits_service
+from services.file_service import file_service, iter_upload, MAX_UPLOAD_BYTES, UploadTooLarge, EXPORT_FORMATS
 
 router = APIRouter(
     prefix="/api/posts",
@@ -22,9 +29,25 @@ router = APIRouter(
 post_service = PostService()
 
 @router.get("/", response_model=dict)
-async def list_posts(limit: Optional[int] = None, request: Request = None):
+async def list_posts(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    # YYYY-MM-DD: se validan en la capa de BD (400 si no es una fecha, como el cursor)
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    fields: Optional[str] = Query(None, pattern="^(summary|full)$"),
+    all_posts: bool = Query(False, alias='all'),
+    request: Request = None
+):
     """
-    Lista todos los posts
+    Lista los posts
+    
+    Siempre una página (más recientes primero, limit=50 por defecto) y
+    next_cursor para la siguiente (None en la última). Filtros: estado y fechas.
+    fields=summary devuelve solo codigo, titulo, estado y fechas (el post
+    completo sigue en GET /api/posts/{codigo}).
+    all=1 devuelve todos sin paginar (modo antiguo, sin filtros): solo para scripts.
     
     Usado por: Panel web (selector de posts)
     """
@@ -32,11 +55,81 @@ async def list_posts(limit: Optional[int] = None, request: Request = None):
         user_id = request.session.get('user_id') if request else None
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        posts = await post_service.list_posts(limit=limit, user_id=user_id)
+        summary = fields == 'summary'
+        
+        if all_posts:
+            if any([cursor, estado, fecha_desde, fecha_hasta]):
+                raise ValueError("all=1 no admite cursor ni filtros")
+            posts = await post_service.list_posts(user_id=user_id, summary=summary)
+            return {
+                'success': True,
+                'posts': posts,
+                'next_cursor': None
+            }
+        
+        page = await post_service.list_posts_page(
+            limit=limit, user_id=user_id, cursor=cursor, estado=estado,
+            fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, summary=summary
+        )
         return {
             'success': True,
-            'posts': posts
+            'posts': page['posts'],
+            'next_cursor': page['next_cursor']
         }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+def _export_response(posts: List[dict], fmt: str, name: str) -> StreamingResponse:
+    """Descarga zip/tar generada al vuelo (sin Content-Length: el tamaño final no se conoce)"""
+    return StreamingResponse(
+        file_service.iter_export(posts, fmt),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={'content-disposition': f'attachment; filename="{name}.{fmt}"'}
+    )
+
+# Antes de /{codigo}: si no, "export" se toma como código de post
+@router.get("/export")
+async def export_posts(
+    codigos: Optional[str] = None,
+    estado: Optional[str] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    fmt: str = Query('zip', alias='format', pattern="^(zip|tar)$"),
+    request: Request = None
+):
+    """
+    Exporta varios posts en un solo zip/tar (ej: export semanal)
+    codigos=a,b,c o rango fecha_desde/fecha_hasta (opcionalmente con estado)
+    
+    Usado por: Panel web / scripts de archivo
+    """
+    try:
+        user_id = request.session.get('user_id') if request else None
+        if not user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+        codigo_list = [codigo.strip() for codigo in codigos.split(',') if codigo.strip()] if codigos else None
+        posts = await post_service.get_posts_for_export(
+            user_id=user_id, codigos=codigo_list, estado=estado,
+            fecha_desde=fecha_desde, fecha_hasta=fecha_hasta
+        )
+        if fecha_desde or fecha_hasta:
+            name = f"lavelo_{fecha_desde or 'inicio'}_{fecha_hasta or 'hoy'}"
+        else:
+            name = f"lavelo_{len(posts)}_posts"
+        return _export_response(posts, fmt, name)
+    except HTTPException:
+        raise
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -74,6 +167,75 @@ async def get_post(codigo: str, request: Request):
             detail=str(e)
         )
 
+@router.get("/{codigo}/bundle")
+async def get_post_bundle(codigo: str, request: Request):
+    """
+    Post + manifiesto de archivos + contenido de los textos pequeños en una
+    sola respuesta (una comprobación de ownership en vez de una por archivo).
+    ETag del bundle completo: If-None-Match válido → 304 sin cuerpo.
+    
+    Usado por: Panel web (abrir detalles de un post)
+    """
+    try:
+        user_id = request.session.get('user_id')
+        if not user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+        bundle = await post_service.get_post_bundle(
+            codigo, user_id=user_id, if_none_match=request.headers.get('if-none-match')
+        )
+        
+        if not bundle:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Post {codigo} no encontrado"
+            )
+        
+        headers = {'etag': bundle['etag'], 'cache-control': 'private, no-cache'}
+        if bundle.get('not_modified'):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return JSONResponse(jsonable_encoder({
+            'success': True,
+            'post': bundle['post'],
+            'manifest': bundle['manifest'],
+            'textos': bundle['textos']
+        }), headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/{codigo}/export")
+async def export_post(codigo: str, request: Request, fmt: str = Query('zip', alias='format', pattern="^(zip|tar)$")):
+    """
+    Descarga el post completo en un zip/tar: textos, imágenes, videos y
+    post.json con la fila de BD. Se genera en streaming (sin temporal).
+    
+    Usado por: Panel web (entregar / archivar un post)
+    """
+    try:
+        user_id = request.session.get('user_id')
+        if not user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+        post = await post_service.get_post(codigo, user_id=user_id)
+        
+        if not post:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Post {codigo} no encontrado"
+            )
+        
+        return _export_response([post], fmt, codigo)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.post("/", response_model=dict)
 async def create_post(post: PostCreate, request: Request):
     """
@@ -91,7 +253,7 @@ async def create_post(post: PostCreate, request: Request):
         client_ip = None
         
         # Verificar límite de creación
-        limit_check = limits_service.check_create_limit(user_id=user_id, client_ip=client_ip)
+        limit_check = await limits_service.check_create_limit_async(user_id=user_id, client_ip=client_ip)
         
         if not limit_check['allowed']:
             raise HTTPException(
@@ -195,7 +357,7 @@ async def update_networks(codigo: str, networks: dict, request: Request):
         import sys
         import os
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-        import db_service
+        import async_db_service
         
         user_id = request.session.get('user_id')
         if not user_id:
@@ -210,7 +372,7 @@ async def update_networks(codigo: str, networks: dict, request: Request):
             field_name = f'redes_{network}'
             updates[field_name] = bool(active)
         
-        success = db_service.update_post(codigo, updates, user_id=user_id)
+        success = await async_db_service.update_post(codigo, updates, user_id=user_id)
         
         if not success:
             raise Exception(f"Error actualizando redes para {codigo}")
@@ -236,7 +398,7 @@ async def reset_phases(codigo: str, data: dict, request: Request):
         import sys
         import os
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-        import db_service
+        import async_db_service
         
         user_id = request.session.get('user_id')
         if not user_id:
@@ -293,7 +455,7 @@ async def reset_phases(codigo: str, data: dict, request: Request):
         for checkbox in checkboxes_to_reset:
             updates[checkbox] = False
         
-        success = db_service.update_post(codigo, updates, user_id=user_id)
+        success = await async_db_service.update_post(codigo, updates, user_id=user_id)
         
         if not success:
             raise Exception(f"Error reseteando fases para {codigo}")
@@ -309,65 +471,85 @@ async def reset_phases(codigo: str, data: dict, request: Request):
             detail=str(e)
         )
 
+async def _decode_image_json(codigo: str, request: Request):
+    """(filename, bytes) del body JSON {image_data, filename} con la imagen en base64"""
+    try:
+        data = json.loads(await request.body())
+        image_data = data.get('image_data', '')
+        filename = data.get('filename') or f'{codigo}_imagen_base.png'
+    except (ValueError, AttributeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body JSON inválido")
+    if not image_data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No se proporcionó imagen")
+    
+    # Remover prefijo data:image/...;base64, si existe
+    if ',' in image_data:
+        image_data = image_data.split(',', 1)[1]
+    try:
+        return filename, base64.b64decode(image_data, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error decodificando base64: {e}")
+
+async def _single_chunk(data: bytes):
+    yield data
+
+async def _save_image(codigo: str, filename: str, chunks):
+    """Copia la imagen al almacén (ruta inválida → 400; UploadTooLarge lo traduce upload_image)"""
+    try:
+        await file_service.save_upload_async(codigo, 'imagenes', filename, chunks)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 @router.post("/{codigo}/upload-image", response_model=dict)
 async def upload_image(codigo: str, request: Request):
     """
     Sube una imagen manualmente para reemplazar la generada
     
+    Acepta:
+    - multipart/form-data con 'file' (y 'filename' opcional): se copia por
+      trozos al almacén sin tenerla entera en memoria
+    - JSON {image_data, filename} con la imagen en base64 (formato anterior,
+      sigue funcionando para clientes que no se han actualizado)
+    Tope MAX_UPLOAD_MB en ambos casos.
+    
     Usado por: Panel web (Fase 4 - reemplazar imagen)
     """
     try:
-        import sys
-        import os
-        import base64
-        import json
-        sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-        from services.file_service import FileService
-        import db_service
+        import async_db_service
         
         user_id = request.session.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
         # Verificar ownership
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
 
-        file_service = FileService()
-        
-        # Leer body como texto (no como dict para evitar validación)
-        body_bytes = await request.body()
-        body_text = body_bytes.decode('utf-8')
-        data = json.loads(body_text)
-        
-        # Decodificar imagen base64
-        image_data = data.get('image_data', '')
-        filename = data.get('filename', f'{codigo}_imagen_base.png')
-        
-        if not image_data:
-            raise Exception("No se proporcionó imagen")
-        
-        # Remover prefijo data:image/...;base64, si existe
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
+        # Rechazar antes de recibir nada si el tamaño declarado ya no vale
+        # (margen para el base64 del JSON y las cabeceras del multipart)
+        content_length = request.headers.get('content-length')
+        if content_length == '0':
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No se proporcionó imagen")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES * 4 // 3 + 64 * 1024:
+            raise UploadTooLarge(f"La imagen supera el máximo de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
         
-        # Decodificar y guardar
-        try:
-            image_bytes = base64.b64decode(image_data)
-        except Exception as decode_error:
-            raise Exception(f"Error decodificando base64: {decode_error}")
-        
-        # Guardar archivo binario usando el método privado
-        file_path = file_service._get_file_path(codigo, 'imagenes', filename)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        with open(file_path, 'wb') as f:
-            f.write(image_bytes)
-        
-        print(f"💾 Imagen guardada: {file_path} ({len(image_bytes) / 1024:.2f} KB)")
+        # Guardar en el almacén de blobs (no escribir encima: el archivo puede ser un enlace compartido)
+        if request.headers.get('content-type', '').startswith('multipart/form-data'):
+            form = await request.form()
+            try:
+                upload = form.get('file')
+                if upload is None or isinstance(upload, str):
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No se proporcionó imagen")
+                filename = form.get('filename') or f'{codigo}_imagen_base.png'
+                await _save_image(codigo, filename, iter_upload(upload))
+            finally:
+                await form.close()
+        else:
+            filename, image_bytes = await _decode_image_json(codigo, request)
+            await _save_image(codigo, filename, _single_chunk(image_bytes))
         
         # Al cambiar imagen base, resetear formatos y fases posteriores
-        db_service.update_post(codigo, {
+        await async_db_service.update_post(codigo, {
             'imagen_base_png': True,
             'instagram_1x1_png': False,
             'instagram_stories_9x16_png': False,
@@ -388,6 +570,10 @@ async def upload_image(codigo: str, request: Request):
             'message': f'Imagen {filename} subida correctamente',
             'filename': filename
         }
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
     except Exception as e:
         print(f"❌ Error subiendo imagen: {e}")
         raise HTTPException(
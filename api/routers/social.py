@@ -6,6 +6,7 @@ from fastapi import APIRouter, HTTPException, status, Request
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from typing import Dict
+import asyncio
 import sys
 import os
 
@@ -13,6 +14,7 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from services.social_service import social_service
 from services.publish_service import PublishService
 import db_service
+import async_db_service
 from database import DATABASE_URL, IS_PRODUCTION
 
 # Instancia del servicio de publicación
@@ -40,10 +42,10 @@ async def get_current_user(request: Request):
     user_id = request.session.get('user_id')
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-    user = db_service.get_user_by_id(user_id)
+    user = await async_db_service.get_user_profile(user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-    return {'success': True, 'user': user.to_dict()}
+    return {'success': True, 'user': user}
 
 @router.get("/pages")
 async def list_social_pages(platform: str | None = None, request: Request = None):
@@ -195,12 +197,12 @@ async def social_callback(platform: str, code: str, state: str = None, request:
 
         # Actualizar metadata de usuario (opcional)
         if platform == 'instagram':
-            db_service.update_user(user_id, {
+            await async_db_service.update_user(user_id, {
                 'instagram_id': user_info.get('id'),
                 'instagram_username': user_info.get('username') or user_info.get('name')
             })
         elif platform == 'facebook':
-            db_service.update_user(user_id, {
+            await async_db_service.update_user(user_id, {
                 'facebook_id': user_info.get('id'),
                 'facebook_name': user_info.get('username') or user_info.get('name')
             })
@@ -337,23 +339,26 @@ async def publish_to_social_networks(request: Request):
         for network in networks:
             try:
                 # Llamar al método específico de cada red
+                # (en un hilo: hace peticiones HTTP y escrituras de BD bloqueantes, como la reserva del cupo)
                 if network == 'instagram':
-                    result = publish_service.publish_to_instagram(
+                    result = await asyncio.to_thread(
+                        publish_service.publish_to_instagram,
                         codigo, user_id=user_id,
                         page_id=page_id,
                         instagram_account_id=instagram_account_id
                     )
                 elif network == 'linkedin':
-                    result = publish_service.publish_to_linkedin(codigo, user_id=user_id)
+                    result = await asyncio.to_thread(publish_service.publish_to_linkedin, codigo, user_id=user_id)
                 elif network == 'twitter':
-                    result = publish_service.publish_to_twitter(codigo, user_id=user_id)
+                    result = await asyncio.to_thread(publish_service.publish_to_twitter, codigo, user_id=user_id)
                 elif network == 'facebook':
-                    result = publish_service.publish_to_facebook(
+                    result = await asyncio.to_thread(
+                        publish_service.publish_to_facebook,
                         codigo, user_id=user_id,
                         page_id=page_id
                     )
                 elif network == 'tiktok':
-                    result = publish_service.publish_to_tiktok(codigo, user_id=user_id)
+                    result = await asyncio.to_thread(publish_service.publish_to_tiktok, codigo, user_id=user_id)
                 else:
                     result = {'success': False, 'error': f'Red social no soportada: {network}'}
                 
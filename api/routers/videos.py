@@ -9,7 +9,7 @@ import os
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from services.video_service import video_service
-import db_service
+import async_db_service
 
 router = APIRouter(
     prefix="/api",
@@ -126,7 +126,7 @@ async def generate_video_base(request: GenerateVideoBaseRequest, http_request: R
         user_id = http_request.session.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(request.codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(request.codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
         result = await video_service.generate_video_base(request.codigo, user_id=user_id)
@@ -148,7 +148,7 @@ async def format_videos(request: FormatVideosRequest, http_request: Request):
         user_id = http_request.session.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
-        post = db_service.get_post_by_codigo(request.codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(request.codigo, user_id=user_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado")
         result = await video_service.format_videos(request.codigo, user_id=user_id)
@@ -10,7 +10,7 @@ import asyncio
 import json
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-import db_service
+import async_db_service
 from services.file_service import file_service
 
 import logging
@@ -135,7 +135,7 @@ class ContentService:
             },
             {
                 "name": "list_posts",
-                "description": "Lista todos los posts existentes con su estado actual",
+                "description": "Lista los 50 posts más recientes con su estado actual",
                 "input_schema": {"type": "object", "properties": {}}
             }
         ]
@@ -160,9 +160,9 @@ Categorías disponibles:
         system_prompt = default_system_prompt
         if user_id is not None:
             try:
-                user = db_service.get_user_by_id(user_id)
-                if user and user.system_prompt:
-                    system_prompt = user.system_prompt
+                user = await async_db_service.get_user_profile(user_id)
+                if user and user['system_prompt']:
+                    system_prompt = user['system_prompt']
             except Exception:
                 pass
         
@@ -241,9 +241,8 @@ Categorías disponibles:
                         post_info = result.get("post")
 
                 elif tool_name == "list_posts":
-                    logger.info("   ➡️ Calling db_service.get_all_posts...")
-                    posts = db_service.get_all_posts(user_id=user_id)
-                    result = {'posts': posts}
+                    logger.info("   ➡️ Calling async_db_service.get_posts_page...")
+                    result = await async_db_service.get_posts_page(user_id=user_id, limit=50, summary=True)
                     tool_results.append({"tool": tool_name, "result": result})
 
             post_created_result = next((r for r in tool_results if r['tool'] == 'create_post' and r['result'].get('success')), None)
@@ -354,12 +353,12 @@ Categorías disponibles:
         """
         # Verificar ownership si aplica
         if user_id is not None:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             if not post:
                 raise Exception("Post no encontrado")
 
         # Leer base.txt
-        base_text = self.file_service.read_file(codigo, 'textos', f"{codigo}_base.txt")
+        base_text = await self.file_service.read_file_async(codigo, 'textos', f"{codigo}_base.txt")
         
         if not base_text:
             raise Exception(f"No se encontró {codigo}_base.txt")
@@ -462,10 +461,10 @@ Reglas:
 
             try:
                 filename = f"{codigo}_{platform}.txt"
-                self.file_service.save_file(codigo, 'textos', filename, adapted_text)
+                await self.file_service.save_file_async(codigo, 'textos', filename, adapted_text)
 
                 checkbox_field = f'{platform}_txt'
-                db_service.update_post(codigo, {checkbox_field: True}, user_id=user_id)
+                await async_db_service.update_post(codigo, {checkbox_field: True}, user_id=user_id)
 
                 generated.append(filename)
                 logger.info(f"  ✅ {filename} generado")
@@ -489,12 +488,12 @@ Reglas:
         - MCP: generate_instructions_from_post
         """
         if user_id is not None:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             if not post:
                 raise Exception("Post no encontrado")
 
         # Leer base.txt
-        base_text = self.file_service.read_file(codigo, 'textos', f"{codigo}_base.txt")
+        base_text = await self.file_service.read_file_async(codigo, 'textos', f"{codigo}_base.txt")
         
         if not base_text:
             raise Exception(f"No se encontró {codigo}_base.txt")
@@ -536,10 +535,10 @@ Genera SOLO el prompt de imagen."""
         
         # Guardar archivo
         filename = f"{codigo}_prompt_imagen.txt"
-        self.file_service.save_file(codigo, 'textos', filename, image_prompt)
+        await self.file_service.save_file_async(codigo, 'textos', filename, image_prompt)
         
         # Actualizar checkbox en BD
-        db_service.update_post(codigo, {'prompt_imagen_base_txt': True}, user_id=user_id)
+        await async_db_service.update_post(codigo, {'prompt_imagen_base_txt': True}, user_id=user_id)
         
         return {
             'success': True,
@@ -556,12 +555,12 @@ Genera SOLO el prompt de imagen."""
         - Panel Web: Validar Fase 5 (IMAGE_FORMATS_AWAITING)
         """
         if user_id is not None:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             if not post:
                 raise Exception("Post no encontrado")
 
         # Leer base.txt
-        base_text = self.file_service.read_file(codigo, 'textos', f"{codigo}_base.txt")
+        base_text = await self.file_service.read_file_async(codigo, 'textos', f"{codigo}_base.txt")
         
         if not base_text:
             raise Exception(f"No se encontró {codigo}_base.txt")
@@ -612,10 +611,10 @@ Genera SOLO el script."""
         
         # Guardar archivo
         filename = f"{codigo}_script_video.txt"
-        self.file_service.save_file(codigo, 'textos', filename, video_script)
+        await self.file_service.save_file_async(codigo, 'textos', filename, video_script)
         
         # Actualizar checkbox en BD
-        db_service.update_post(codigo, {'script_video_base_txt': True}, user_id=user_id)
+        await async_db_service.update_post(codigo, {'script_video_base_txt': True}, user_id=user_id)
         
         return {
             'success': True,
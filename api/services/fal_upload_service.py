@@ -0,0 +1,149 @@
+"""
+Subidas de imágenes de referencia a Fal.ai storage, con caché por contenido
+Cada referencia se sube una vez (fal_client.upload) y la URL devuelta se
+guarda en .fal_uploads.json indexada por el hash del manifiesto, con
+caducidad. Las regeneraciones reutilizan la URL en vez de mandar la imagen
+en base64 (un ~33% más grande) dentro de cada petición a SeaDream.
+"""
+import asyncio
+import base64
+import logging
+import mimetypes
+import os
+import time
+from typing import Callable, Dict, Optional
+from services.file_service import FileService, file_service
+
+logger = logging.getLogger(__name__)
+
+# Vida de una URL en caché (por debajo de lo que Fal conserva las subidas)
+FAL_UPLOAD_TTL_HOURS = float(os.getenv('FAL_UPLOAD_TTL_HOURS', '24'))
+
+# Índice hash → {url, uploaded} en la raíz del storage (compartido por API, MCP y réplicas)
+FAL_UPLOADS_NAME = '.fal_uploads.json'
+
+def _fal_upload(data: bytes, content_type: str) -> str:
+    """Sube a Fal storage y devuelve la URL pública (bloqueante)"""
+    import fal_client
+    return fal_client.upload(data, content_type)
+
+class FalUploadService:
+    """
+    URLs de Fal storage para las imágenes de los posts
+
+    - Clave: sha256 del archivo (del manifiesto): si la referencia cambia,
+      cambia el hash y se vuelve a subir
+    - Se guarda cuándo se subió (no la caducidad): bajar FAL_UPLOAD_TTL_HOURS
+      afecta también a las URLs ya guardadas. Las caducadas se descartan al
+      escribir el índice
+    - Peticiones simultáneas de la misma imagen esperan a la misma subida
+    - Si la subida falla, get_reference_url manda la imagen en base64 como antes
+      (una caída de Fal storage no deja la generación sin referencias)
+    - uploader(data, content_type) → url es inyectable (bench_fal_uploads.py
+      usa un endpoint local falso)
+    """
+
+    def __init__(self, files: FileService, uploader: Optional[Callable[[bytes, str], str]] = None,
+                 ttl_hours: float = FAL_UPLOAD_TTL_HOURS):
+        self.files = files
+        self.uploader = uploader or _fal_upload
+        self.ttl = ttl_hours * 3600
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.uploads = 0
+        self.bytes_uploaded = 0
+        self.fallbacks = 0
+
+    async def get_url(self, codigo: str, folder: str, filename: str) -> Optional[str]:
+        """
+        URL de Fal para el archivo (lo sube si no está en caché o caducó)
+
+        Returns:
+            URL o None si el archivo no existe
+        """
+        entry = (await self.files.get_manifest_async(codigo)).get(f"{folder}/{filename}")
+        if entry is None:
+            return None
+        digest = entry['hash']
+        url = await self.files._run_io(self._lookup, digest)
+        if url:
+            self.hits += 1
+            return url
+
+        pending = self._inflight.get(digest)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        loop = asyncio.get_running_loop()
+        pending = self._inflight[digest] = loop.create_future()
+        try:
+            data = await self.files.read_binary_file_async(codigo, folder, filename)
+            if data is None:
+                raise FileNotFoundError(f"{codigo}/{folder}/{filename}")
+            content_type = mimetypes.guess_type(filename)[0] or 'image/png'
+            url = await asyncio.to_thread(self.uploader, data, content_type)
+            self.uploads += 1
+            self.bytes_uploaded += len(data)
+            await self.files._run_io(self._store, digest, url)
+            pending.set_result(url)
+            return url
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # Marcada como leída aunque nadie más espere
+            raise
+        finally:
+            del self._inflight[digest]
+
+    async def get_reference_url(self, codigo: str, folder: str, filename: str) -> Optional[str]:
+        """
+        URL para mandar la imagen a Fal: la de storage (get_url) o, si la
+        subida falla, un data URL en base64
+
+        Returns:
+            URL o None si el archivo no existe
+        """
+        try:
+            return await self.get_url(codigo, folder, filename)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Subida a Fal fallida ({codigo}/{folder}/{filename}), se manda en base64: {e}")
+
+        data = await self.files.read_binary_file_async(codigo, folder, filename)
+        if data is None:
+            return None
+        self.fallbacks += 1
+        content_type = mimetypes.guess_type(filename)[0] or 'image/png'
+        return f"data:{content_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+    def _lookup(self, digest: str) -> Optional[str]:
+        uploads = self.files.backend.read_json(FAL_UPLOADS_NAME) or {}
+        cached = uploads.get(digest)
+        if cached and cached['uploaded'] + self.ttl > time.time():
+            return cached['url']
+        return None
+
+    def _store(self, digest: str, url: str):
+        now = time.time()
+
+        def apply(current):
+            uploads = {key: value for key, value in (current or {}).items()
+                       if value['uploaded'] + self.ttl > now}
+            uploads[digest] = {'url': url, 'uploaded': now}
+            return uploads
+        self.files.backend.update_json(FAL_UPLOADS_NAME, apply)
+
+    def stats(self) -> Dict:
+        return {
+            'hits': self.hits,
+            'uploads': self.uploads,
+            'uploaded_mb': round(self.bytes_uploaded / (1024 * 1024), 2),
+            'fallbacks': self.fallbacks,
+            'ttl_hours': round(self.ttl / 3600, 2)
+        }
+
+# Instancia global
+fal_upload_service = FalUploadService(file_service)
@@ -1,11 +1,25 @@
 """
 Servicio de archivos local - Reemplaza Google Drive
 Guarda archivos en sistema de archivos local (desarrollo) o servidor (producción)
+o en un bucket S3 compatible (STORAGE_BACKEND=s3) compartido entre réplicas
 """
 import os
-from typing import Optional, List, Dict
+import asyncio
+import hashlib
+import io
+import json
+import re
+import tarfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional, List, Dict, Tuple, TypeVar
 from pathlib import Path
 from dotenv import load_dotenv
+from services.storage_backends import StorageBackend, create_storage_backend
 
 # Cargar variables de entorno (producción primero, luego fallback local)
 default_env = os.path.join(os.path.dirname(__file__), '..', '..', '.env')
@@ -15,32 +29,298 @@ if os.path.exists(env_file):
 else:
     load_dotenv(dotenv_path=default_env)
 
-# Path base de storage
+# Path base de storage (con backend S3 solo se usa para temporales)
 STORAGE_PATH = os.getenv('STORAGE_PATH', os.path.join(os.path.dirname(__file__), '..', '..', 'storage'))
 
-class FileService:
-    """Servicio para gestionar archivos localmente (reemplaza Drive)"""
+# Hilos del pool de I/O de disco (separado del pool por defecto de asyncio.to_thread,
+# que ya usan las llamadas a Fal.ai/OpenAI/requests)
+FILE_IO_WORKERS = int(os.getenv('FILE_IO_WORKERS', '4'))
+
+# Tamaño máximo de una subida (panel/API) y trozo con el que se copia a disco
+MAX_UPLOAD_MB = int(os.getenv('MAX_UPLOAD_MB', '200'))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Recolector de basura del almacenamiento (ver collect_garbage_async)
+# - Intervalo del GC en segundo plano (0 = desactivado; el informe en seco siempre está disponible)
+# - Margen: nada modificado hace menos de GC_GRACE_HOURS se toca (escrituras en curso)
+# - Borrado en lotes con pausa entre ellos para no saturar el disco / la API de S3
+STORAGE_GC_INTERVAL_HOURS = float(os.getenv('STORAGE_GC_INTERVAL_HOURS', '0'))
+GC_GRACE_HOURS = float(os.getenv('STORAGE_GC_GRACE_HOURS', '24'))
+GC_BATCH_SIZE = int(os.getenv('STORAGE_GC_BATCH_SIZE', '50'))
+GC_BATCH_PAUSE = float(os.getenv('STORAGE_GC_BATCH_PAUSE', '1'))
+
+# Formatos de video derivados de <codigo>_video_base.mp4 (checkbox <formato>_mp4 en BD)
+VIDEO_FORMATS = ('feed_16x9', 'stories_9x16', 'shorts_9x16', 'tiktok_9x16')
+
+# Exportación de posts en streaming: formato → Content-Type
+EXPORT_FORMATS = {'zip': 'application/zip', 'tar': 'application/x-tar'}
+
+T = TypeVar('T')
+
+# Manifiesto por post (posts/<codigo>/.manifest.json) y agregado global (.usage.json)
+# Reconciliarlos con el almacenamiento al arrancar (0 = no: con varias réplicas basta una)
+STORAGE_RECONCILE_ON_STARTUP = os.getenv('STORAGE_RECONCILE_ON_STARTUP', '1') == '1'
+MANIFEST_NAME = '.manifest.json'
+USAGE_NAME = '.usage.json'
+KIND_BY_FOLDER = {'textos': 'text', 'imagenes': 'image', 'videos': 'video'}
+
+class UploadTooLarge(Exception):
+    """La subida supera el tamaño máximo permitido (MAX_UPLOAD_MB)"""
+
+def entry_written(entry: Dict) -> float:
+    """Cuándo se escribió el archivo según su entrada del manifiesto (manifiestos antiguos: mtime)"""
+    return entry.get('written', entry['mtime'])
+
+async def iter_upload(upload, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Trozos de un UploadFile (o cualquier objeto con read(size) asíncrono)"""
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+class _ArchiveSink(io.RawIOBase):
+    """
+    Destino de zipfile que no guarda nada: acumula lo escrito hasta que
+    iter_export lo recoge con drain() (memoria acotada a un trozo)
+    """
     
     def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._offset
+    
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+class FileService:
+    """
+    Servicio para gestionar archivos de los posts (reemplaza Drive)
+    
+    Los bytes van a un StorageBackend (ver storage_backends.py): disco local
+    con deduplicación por hardlinks a blobs, o S3 compatible.
+    
+    Cada post tiene un manifiesto (nombre, tamaño, hash, mtime, written, tipo por archivo)
+    que se actualiza en cada escritura/borrado hecho por este servicio, y
+    .usage.json agrega el uso total. Existencia, listados y estadísticas
+    salen de ahí sin listar el almacenamiento. Los manifiestos que falten, los
+    archivos escritos por fuera del servicio y el agregado se reconcilian al
+    arrancar (reconcile_index), nunca dentro de una petición.
+    """
+    
+    def __init__(self, backend: Optional[StorageBackend] = None):
         self.storage_path = Path(STORAGE_PATH)
         self._ensure_storage_exists()
+        self.backend = backend or create_storage_backend(STORAGE_PATH)
+        self._io_executor = ThreadPoolExecutor(max_workers=FILE_IO_WORKERS, thread_name_prefix='file-io')
+        # codigo → (versión del manifiesto en el backend, entradas)
+        self._manifest_cache: Dict[str, Tuple[str, Dict[str, Dict]]] = {}
     
     def _ensure_storage_exists(self):
         """Crear carpeta storage si no existe"""
         self.storage_path.mkdir(parents=True, exist_ok=True)
         print(f"📁 Storage path: {self.storage_path}")
     
-    def _get_post_path(self, codigo: str) -> Path:
-        """Obtener path de un post"""
-        return self.storage_path / 'posts' / codigo
+    def _key(self, codigo: str, folder: str, filename: str) -> str:
+        """Clave de un archivo en el backend (rechaza segmentos que salgan de la carpeta del post)"""
+        for part in (codigo, folder, filename):
+            if not part or part in ('.', '..') or '/' in part or '\\' in part:
+                raise ValueError(f"Ruta de archivo inválida: {codigo}/{folder}/{filename}")
+        return f"posts/{codigo}/{folder}/{filename}"
+    
+    def _manifest_key(self, codigo: str) -> str:
+        return f"posts/{codigo}/{MANIFEST_NAME}"
+    
+    def _digests(self, codigo: str, files: Optional[Dict[str, Dict]] = None) -> Optional[Dict[str, str]]:
+        """Clave → sha256 según el manifiesto, para que el backend no relea archivos al soltar blobs"""
+        if not self.backend.needs_digests:
+            return None
+        if files is None:
+            files = self.get_manifest(codigo)
+        return {f"posts/{codigo}/{name}": entry['hash'] for name, entry in files.items()}
+    
+    def scratch_path(self, suffix: str = '') -> Path:
+        """Archivo temporal local (ej: salida de FFmpeg antes de ingest_file)"""
+        tmp_dir = self.storage_path / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir / f"{uuid.uuid4().hex}{suffix}"
+    
+    # ========================================
+    # MANIFIESTO POR POST + USO GLOBAL
+    # ========================================
+    
+    def _entry(self, codigo: str, folder: str, filename: str, digest: str, scanned: bool = False) -> Dict:
+        """
+        Entrada del manifiesto
+        - mtime: el del archivo en el backend (reconcile lo compara para no rehashear)
+        - written: cuándo se escribió la clave. No sale del mtime: en local, escribir
+          un contenido ya visto enlaza el blob existente y conserva su mtime antiguo.
+          Archivos encontrados al escanear (scanned): su mtime es lo único que hay
+        """
+        size, mtime = self.backend.stat(self._key(codigo, folder, filename))
+        return {
+            'name': filename,
+            'folder': folder,
+            'size': size,
+            'hash': digest,
+            'mtime': mtime,
+            'written': mtime if scanned else time.time(),
+            'kind': KIND_BY_FOLDER.get(folder, 'file')
+        }
+    
+    def _scan_post(self, codigo: str, known: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """
+        Entradas del manifiesto leyendo el almacenamiento (reconcile o rebuild)
+        known: entradas actuales; las de archivos con el mismo tamaño y mtime no se rehashean
+        """
+        known = known or {}
+        files = {}
+        prefix = f"posts/{codigo}/"
+        for key in self.backend.list(prefix):
+            parts = key[len(prefix):].split('/')
+            if len(parts) != 2 or parts[1].startswith('.'):
+                continue
+            name = f"{parts[0]}/{parts[1]}"
+            stat = self.backend.stat(key)
+            if stat is None:
+                continue
+            entry = known.get(name)
+            if entry and (entry['size'], entry['mtime']) == stat:
+                files[name] = entry
+                continue
+            sha = hashlib.sha256()
+            for chunk in self.backend.iter_range(key):
+                sha.update(chunk)
+            files[name] = self._entry(codigo, parts[0], parts[1], sha.hexdigest(), scanned=True)
+        return files
+    
+    def _usage_apply(self, usage: Dict, entry: Dict, sign: int):
+        usage['file_count'] += sign
+        usage['total_bytes'] += sign * entry['size']
+        kind = usage['by_kind'].setdefault(entry['kind'], {'count': 0, 'bytes': 0})
+        kind['count'] += sign
+        kind['bytes'] += sign * entry['size']
+    
+    def _load_files(self, codigo: str) -> Dict[str, Dict]:
+        """Entradas del manifiesto del post ({} si aún no tiene: post nuevo o sin reconciliar)"""
+        manifest = self.backend.read_json(self._manifest_key(codigo))
+        return manifest['files'] if manifest else {}
+    
+    def _load_usage(self) -> Dict:
+        """Agregado global (a cero si falta: lo crea reconcile_index al arrancar)"""
+        return self.backend.read_json(USAGE_NAME) or {'file_count': 0, 'total_bytes': 0, 'by_kind': {}}
+    
+    def _update_usage(self, deltas: List[Tuple[Dict, int]]):
+        if not deltas:
+            return
+        
+        def apply(current):
+            if current is None:
+                return None  # Sin agregado no hay base a la que sumar: lo rehace el próximo arranque
+            for entry, sign in deltas:
+                self._usage_apply(current, entry, sign)
+            return current
+        self.backend.update_json(USAGE_NAME, apply)
+    
+    def reconcile_index(self) -> Dict:
+        """
+        Paso de arranque (main.py, mcp_server.py): manifiestos y agregado al día
+        con lo que hay en el almacenamiento
+        - Crea los manifiestos que falten (datos anteriores al manifiesto)
+        - Añade archivos escritos por fuera del servicio y quita entradas de archivos que ya no están
+        - Rehace .usage.json con el total
+        Solo se hashean archivos nuevos o cambiados (tamaño o mtime distinto).
+        
+        Returns:
+            {'posts': revisados, 'updated': manifiestos reescritos, 'file_count', 'total_bytes'}
+        """
+        usage = {'file_count': 0, 'total_bytes': 0, 'by_kind': {}}
+        codigos = self._stored_codigos()
+        updated = 0
+        for codigo in codigos:
+            current = self.backend.read_json(self._manifest_key(codigo))
+            known = current['files'] if current else None
+            files = self._scan_post(codigo, known)
+            if files != known and (files or known is not None):
+                
+                def replace(latest):
+                    # Si otro proceso escribió mientras tanto, se respeta su manifiesto
+                    return None if (latest['files'] if latest else None) != known else {'codigo': codigo, 'files': files}
+                manifest = self.backend.update_json(self._manifest_key(codigo), replace)
+                if manifest is not None and manifest['files'] is files:
+                    updated += 1
+                    self._manifest_cache.pop(codigo, None)
+                else:
+                    files = manifest['files'] if manifest else {}
+            for entry in files.values():
+                self._usage_apply(usage, entry, 1)
+        self.backend.update_json(USAGE_NAME, lambda current: usage)
+        print(f"📋 Índice de storage reconciliado: {len(codigos)} posts, {updated} manifiestos actualizados, "
+              f"{usage['file_count']} archivos ({usage['total_bytes'] / (1024 * 1024):.1f} MB)")
+        return {'posts': len(codigos), 'updated': updated,
+                'file_count': usage['file_count'], 'total_bytes': usage['total_bytes']}
+    
+    def _record(self, codigo: str, changes: Dict[str, Optional[Dict]]):
+        """Aplica cambios al manifiesto del post ('folder/filename' → entrada, o None si se borró)"""
+        replaced = []
+        
+        def apply(current):
+            replaced.clear()
+            files = dict(current['files']) if current else {}
+            for key, entry in changes.items():
+                old = files.pop(key, None)
+                if old:
+                    replaced.append(old)
+                if entry:
+                    files[key] = entry
+            return {'codigo': codigo, 'files': files}
+        self.backend.update_json(self._manifest_key(codigo), apply)
+        self._manifest_cache.pop(codigo, None)
+        self._update_usage([(entry, -1) for entry in replaced] +
+                           [(entry, 1) for entry in changes.values() if entry])
     
-    def _get_folder_path(self, codigo: str, folder: str) -> Path:
-        """Obtener path de una carpeta dentro de un post"""
-        return self._get_post_path(codigo) / folder
+    def get_manifest(self, codigo: str) -> Dict[str, Dict]:
+        """
+        Manifiesto del post: 'folder/filename' → {name, folder, size, hash, mtime, written, kind}
+        Sale de memoria si el manifiesto no cambió (un stat / HEAD). No modificar el dict.
+        """
+        version = self.backend.version(self._manifest_key(codigo))
+        if version is None:
+            return {}
+        cached = self._manifest_cache.get(codigo)
+        if cached and cached[0] == version:
+            return cached[1]
+        manifest = self.backend.read_json(self._manifest_key(codigo))
+        files = manifest['files'] if manifest else {}
+        self._manifest_cache[codigo] = (version, files)
+        return files
     
-    def _get_file_path(self, codigo: str, folder: str, filename: str) -> Path:
-        """Obtener path completo de un archivo"""
-        return self._get_folder_path(codigo, folder) / filename
+    def rebuild_manifest(self, codigo: str) -> Dict[str, Dict]:
+        """Rehace el manifiesto desde el almacenamiento (archivos escritos por fuera del servicio)"""
+        files = self._scan_post(codigo, self._load_files(codigo))
+        previous = []
+        
+        def replace(current):
+            previous[:] = list(current['files'].values()) if current else []
+            return {'codigo': codigo, 'files': files}
+        self.backend.update_json(self._manifest_key(codigo), replace)
+        self._manifest_cache.pop(codigo, None)
+        self._update_usage([(entry, -1) for entry in previous] + [(entry, 1) for entry in files.values()])
+        print(f"📋 Manifiesto reconstruido: {codigo} ({len(files)} archivos)")
+        return files
     
     def create_post_folders(self, codigo: str) -> Dict[str, str]:
         """
@@ -49,15 +329,11 @@ class FileService:
         Returns:
             Dict con paths creados
         """
-        post_path = self._get_post_path(codigo)
-        
         folders = ['textos', 'imagenes', 'videos']
         created = {}
         
         for folder in folders:
-            folder_path = post_path / folder
-            folder_path.mkdir(parents=True, exist_ok=True)
-            created[folder] = str(folder_path)
+            created[folder] = self.backend.make_dirs(f"posts/{codigo}/{folder}")
         
         print(f"✅ Carpetas creadas para post {codigo}")
         return created
@@ -76,13 +352,10 @@ class FileService:
             True si se guardó correctamente
         """
         try:
-            file_path = self._get_file_path(codigo, folder, filename)
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            print(f"💾 Guardado: {file_path}")
+            key = self._key(codigo, folder, filename)
+            digest = self.backend.write(key, content.encode('utf-8'), self._digests(codigo))
+            self._record(codigo, {f"{folder}/{filename}": self._entry(codigo, folder, filename, digest)})
+            print(f"💾 Guardado: {key}")
             return True
         except Exception as e:
             print(f"❌ Error guardando {filename}: {e}")
@@ -96,16 +369,15 @@ class FileService:
             Contenido del archivo o None si no existe
         """
         try:
-            file_path = self._get_file_path(codigo, folder, filename)
+            key = self._key(codigo, folder, filename)
+            data = self.backend.read(key)
             
-            if not file_path.exists():
-                print(f"⚠️ Archivo no existe: {file_path}")
+            if data is None:
+                print(f"⚠️ Archivo no existe: {key}")
                 return None
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            print(f"📖 Leído: {file_path} ({len(content)} chars)")
+            content = data.decode('utf-8')
+            print(f"📖 Leído: {key} ({len(content)} chars)")
             return content
         except Exception as e:
             print(f"❌ Error leyendo {filename}: {e}")
@@ -119,19 +391,77 @@ class FileService:
             data: Bytes del archivo
         """
         try:
-            file_path = self._get_file_path(codigo, folder, filename)
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(file_path, 'wb') as f:
-                f.write(data)
+            key = self._key(codigo, folder, filename)
+            digest = self.backend.write(key, data, self._digests(codigo))
+            self._record(codigo, {f"{folder}/{filename}": self._entry(codigo, folder, filename, digest)})
             
             size_mb = len(data) / (1024 * 1024)
-            print(f"💾 Guardado: {file_path} ({size_mb:.2f} MB)")
+            print(f"💾 Guardado: {key} ({size_mb:.2f} MB)")
             return True
         except Exception as e:
             print(f"❌ Error guardando {filename}: {e}")
             return False
     
+    def save_stream(self, codigo: str, folder: str, filename: str, chunks: Iterable[bytes]) -> Optional[Dict]:
+        """
+        Guarda un binario a partir de trozos sin tenerlo entero en memoria
+        
+        Returns:
+            Entrada del manifiesto del archivo guardado (None si falló)
+        """
+        try:
+            key = self._key(codigo, folder, filename)
+            digest = self.backend.write_stream(key, chunks, self._digests(codigo))
+            entry = self._entry(codigo, folder, filename, digest)
+            self._record(codigo, {f"{folder}/{filename}": entry})
+            print(f"💾 Guardado: {key} ({entry['size'] / (1024 * 1024):.2f} MB)")
+            return entry
+        except Exception as e:
+            print(f"❌ Error guardando {filename}: {e}")
+            return None
+    
+    def ingest_file(self, codigo: str, folder: str, filename: str, source_path: Path) -> bool:
+        """
+        Guarda un archivo ya escrito en disco local (ej: salida de FFmpeg)
+        como codigo/folder/filename. source_path desaparece.
+        """
+        try:
+            key = self._key(codigo, folder, filename)
+            digest = self.backend.write_from_path(key, Path(source_path), digests=self._digests(codigo))
+            self._record(codigo, {f"{folder}/{filename}": self._entry(codigo, folder, filename, digest)})
+            print(f"💾 Guardado: {key} (sha256 {digest[:12]})")
+            return True
+        except Exception as e:
+            print(f"❌ Error guardando {filename}: {e}")
+            return False
+    
+    def copy_file(self, codigo: str, src_folder: str, src_filename: str,
+                  dst_folder: str, dst_filename: str) -> bool:
+        """
+        Copia un archivo dentro del post sin pasar los bytes por la API
+        (local: nuevo enlace al mismo blob; S3: copia server-side)
+        """
+        try:
+            src_key = self._key(codigo, src_folder, src_filename)
+            dst_key = self._key(codigo, dst_folder, dst_filename)
+            if not self.backend.copy(src_key, dst_key, self._digests(codigo)):
+                print(f"⚠️ Archivo no existe: {src_key}")
+                return False
+            src_entry = self.get_manifest(codigo).get(f"{src_folder}/{src_filename}")
+            if src_entry:
+                digest = src_entry['hash']
+            else:
+                sha = hashlib.sha256()
+                for chunk in self.backend.iter_range(dst_key):
+                    sha.update(chunk)
+                digest = sha.hexdigest()
+            self._record(codigo, {f"{dst_folder}/{dst_filename}": self._entry(codigo, dst_folder, dst_filename, digest)})
+            print(f"🔗 Copiado: {src_filename} → {dst_key}")
+            return True
+        except Exception as e:
+            print(f"❌ Error copiando {src_filename}: {e}")
+            return False
+    
     def read_binary_file(self, codigo: str, folder: str, filename: str) -> Optional[bytes]:
         """
         Lee un archivo binario
@@ -140,41 +470,89 @@ class FileService:
             Bytes del archivo o None si no existe
         """
         try:
-            file_path = self._get_file_path(codigo, folder, filename)
+            key = self._key(codigo, folder, filename)
+            data = self.backend.read(key)
             
-            if not file_path.exists():
-                print(f"⚠️ Archivo no existe: {file_path}")
+            if data is None:
+                print(f"⚠️ Archivo no existe: {key}")
                 return None
             
-            with open(file_path, 'rb') as f:
-                data = f.read()
-            
             size_mb = len(data) / (1024 * 1024)
-            print(f"📖 Leído: {file_path} ({size_mb:.2f} MB)")
+            print(f"📖 Leído: {key} ({size_mb:.2f} MB)")
             return data
         except Exception as e:
             print(f"❌ Error leyendo {filename}: {e}")
             return None
     
+    def iter_file(self, codigo: str, folder: str, filename: str, start: int = 0,
+                  end: Optional[int] = None):
+        """Bytes [start, end] de un archivo en trozos (respuestas 206 con backend remoto)"""
+        return self.backend.iter_range(self._key(codigo, folder, filename), start, end)
+    
+    def get_file_path(self, codigo: str, folder: str, filename: str) -> Optional[Path]:
+        """
+        Path local de un archivo existente para servirlo en streaming (sin leerlo)
+        
+        Returns:
+            Path del archivo, o None si no existe, la ruta es inválida
+            o el backend no es local (usar iter_file)
+        """
+        try:
+            return self.backend.local_path(self._key(codigo, folder, filename))
+        except ValueError:
+            return None
+    
+    @asynccontextmanager
+    async def local_file_async(self, codigo: str, folder: str, filename: str):
+        """
+        Path local para herramientas externas (FFmpeg)
+        Con backend remoto se descarga a un temporal que se borra al salir.
+        """
+        key = self._key(codigo, folder, filename)
+        file_path = self.backend.local_path(key)
+        if file_path is not None:
+            yield file_path
+            return
+        tmp_path = self.scratch_path(Path(filename).suffix)
+        try:
+            await self._run_io(self.backend.download, key, tmp_path)
+            yield tmp_path
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    
+    def index_file(self, codigo: str, folder: str, filename: str) -> Optional[Dict]:
+        """
+        Entrada del manifiesto del archivo; si no está pero existe en el
+        almacenamiento (copiado a mano tras el arranque) se hashea y se añade.
+        None si no existe. Solo lee ese archivo, nunca el post entero.
+        """
+        entry = self.get_manifest(codigo).get(f"{folder}/{filename}")
+        if entry is not None:
+            return entry
+        key = self._key(codigo, folder, filename)
+        if self.backend.stat(key) is None:
+            return None
+        sha = hashlib.sha256()
+        for chunk in self.backend.iter_range(key):
+            sha.update(chunk)
+        entry = self._entry(codigo, folder, filename, sha.hexdigest(), scanned=True)
+        self._record(codigo, {f"{folder}/{filename}": entry})
+        print(f"📋 Indexado (escrito por fuera del servicio): {key}")
+        return entry
+    
     def file_exists(self, codigo: str, folder: str, filename: str) -> bool:
-        """Verifica si un archivo existe"""
-        file_path = self._get_file_path(codigo, folder, filename)
-        return file_path.exists()
+        """Verifica si un archivo existe (según el manifiesto)"""
+        return f"{folder}/{filename}" in self.get_manifest(codigo)
     
     def list_files(self, codigo: str, folder: str) -> List[str]:
         """
-        Lista archivos en una carpeta
+        Lista archivos en una carpeta (según el manifiesto)
         
         Returns:
             Lista de nombres de archivos
         """
         try:
-            folder_path = self._get_folder_path(codigo, folder)
-            
-            if not folder_path.exists():
-                return []
-            
-            files = [f.name for f in folder_path.iterdir() if f.is_file()]
+            files = [entry['name'] for entry in self.get_manifest(codigo).values() if entry['folder'] == folder]
             return sorted(files)
         except Exception as e:
             print(f"❌ Error listando archivos: {e}")
@@ -183,11 +561,11 @@ class FileService:
     def delete_file(self, codigo: str, folder: str, filename: str) -> bool:
         """Elimina un archivo"""
         try:
-            file_path = self._get_file_path(codigo, folder, filename)
+            key = self._key(codigo, folder, filename)
             
-            if file_path.exists():
-                file_path.unlink()
-                print(f"🗑️ Eliminado: {file_path}")
+            if self.backend.delete(key, self._digests(codigo)):
+                self._record(codigo, {f"{folder}/{filename}": None})
+                print(f"🗑️ Eliminado: {key}")
                 return True
             return False
         except Exception as e:
@@ -197,18 +575,363 @@ class FileService:
     def delete_post_folder(self, codigo: str) -> bool:
         """Elimina toda la carpeta de un post"""
         try:
-            post_path = self._get_post_path(codigo)
+            # Sin manifiesto no hay nada que restar del agregado (y no hace falta escanear)
+            manifest = self.backend.read_json(self._manifest_key(codigo))
+            files = manifest['files'] if manifest else {}
+            removed = self.backend.delete_prefix(f"posts/{codigo}/", self._digests(codigo, files))
+            self._manifest_cache.pop(codigo, None)
+            self._update_usage([(entry, -1) for entry in files.values()])
             
-            if post_path.exists():
-                import shutil
-                shutil.rmtree(post_path)
-                print(f"🗑️ Carpeta eliminada: {post_path}")
+            if removed:
+                print(f"🗑️ Carpeta eliminada: posts/{codigo} ({removed} archivos)")
                 return True
             return False
         except Exception as e:
             print(f"❌ Error eliminando carpeta: {e}")
             return False
     
+    def prune_blobs(self) -> int:
+        """Borra datos sin referencias del backend (local: blobs sin enlaces). Devuelve cuántos"""
+        removed = self.backend.prune()
+        if removed:
+            print(f"🧹 {removed} blobs sin referencias eliminados")
+        return removed
+    
+    # ========================================
+    # RECOLECTOR DE BASURA (storage vs tabla posts)
+    # ========================================
+    
+    def _stored_codigos(self) -> List[str]:
+        """Códigos de post con algo en el almacenamiento"""
+        return sorted({key.split('/')[1] for key in self.backend.list('posts/') if key.count('/') >= 2})
+    
+    def _stale_files(self, codigo: str, post: Dict, cutoff: float) -> List[Dict]:
+        """
+        Archivos de un post vivo que ya no se usan:
+        - Variaciones <codigo>_imagen_base_N.png que no están en <codigo>_imagen_variations.json
+          (el panel solo muestra las del JSON: las demás son de generaciones anteriores)
+        - Formatos de video con el checkbox a False y más antiguos que el video base actual
+          (se generaron a partir de un video base ya reemplazado)
+        Las edades salen de written, no del mtime del blob (ver _entry).
+        """
+        files = self.get_manifest(codigo)
+        stale = []
+        
+        referenced = set()
+        try:
+            metadata = self.backend.read_json(self._key(codigo, 'textos', f"{codigo}_imagen_variations.json"))
+        except (ValueError, KeyError):
+            metadata = None
+        if metadata:
+            referenced.update(metadata.get('generated') or [])
+            referenced.add(metadata.get('selected'))
+        variation = re.compile(rf"{re.escape(codigo)}_imagen_base_\d+\.png")
+        for entry in files.values():
+            if entry['folder'] == 'imagenes' and variation.fullmatch(entry['name']) and entry['name'] not in referenced:
+                stale.append({**entry, 'reason': 'variation'})
+        
+        base = files.get(f"videos/{codigo}_video_base.mp4")
+        for name in VIDEO_FORMATS:
+            entry = files.get(f"videos/{codigo}_{name}.mp4")
+            if (entry and base and post.get(f"{name}_mp4") is False
+                    and entry_written(entry) < entry_written(base)):
+                stale.append({**entry, 'reason': 'superseded_video'})
+        
+        return [{**entry, 'codigo': codigo} for entry in stale if entry_written(entry) < cutoff]
+    
+    def plan_garbage(self, posts: Dict[str, Dict], now: Optional[float] = None, orphans: bool = True) -> Dict:
+        """
+        Informe en seco: qué borraría el GC y cuánto se recupera
+        
+        Args:
+            posts: codigo → fila del post (todas las de la tabla posts, o las
+                   de un usuario con orphans=False)
+            orphans: buscar carpetas sin fila en BD (False: solo los posts dados)
+        
+        Returns:
+            Dict con orphan_posts (carpetas sin fila en BD), stale_files y reclaimable_bytes
+        """
+        cutoff = (now or time.time()) - GC_GRACE_HOURS * 3600
+        orphan_posts = []
+        stale_files = []
+        stored = self._stored_codigos()
+        
+        for codigo in stored:
+            if codigo in posts:
+                stale_files.extend(self._stale_files(codigo, posts[codigo], cutoff))
+                continue
+            if not orphans:
+                continue
+            # Huérfano: tamaños por stat (no se crea manifiesto ni se hashea nada)
+            sizes = [self.backend.stat(key) for key in self.backend.list(f"posts/{codigo}/")]
+            sizes = [size for size in sizes if size is not None]
+            if any(mtime >= cutoff for _, mtime in sizes):
+                continue
+            # Un enlace a un blob ya existente conserva su mtime: mirar también written
+            if any(entry_written(entry) >= cutoff for entry in self._load_files(codigo).values()):
+                continue
+            orphan_posts.append({
+                'codigo': codigo,
+                'files': len(sizes),
+                'size': sum(size for size, _ in sizes)
+            })
+        
+        if orphans and stored and not posts:
+            # Tabla posts vacía con storage lleno: casi seguro BD equivocada → no borrar carpetas
+            print("⚠️ GC: la tabla posts está vacía; se ignoran las carpetas huérfanas")
+            orphan_posts = []
+        
+        reclaimable = sum(item['size'] for item in orphan_posts) + sum(item['size'] for item in stale_files)
+        return {
+            'orphan_posts': orphan_posts,
+            'stale_files': [
+                {key: item[key] for key in ('codigo', 'folder', 'name', 'size', 'reason')}
+                for item in stale_files
+            ],
+            'reclaimable_bytes': reclaimable,
+            'reclaimable_mb': round(reclaimable / (1024 * 1024), 2)
+        }
+    
+    # ========================================
+    # EXPORTACIÓN (zip/tar en streaming)
+    # ========================================
+    
+    def _export_members(self, posts: List[Dict]) -> Iterator[Tuple[str, int, float, bool, Callable[[], Iterable[bytes]]]]:
+        """(nombre en el archivo, tamaño, fecha de escritura, comprimible, trozos) de cada archivo de los posts"""
+        for post in posts:
+            codigo = post['codigo']
+            row = json.dumps(post, ensure_ascii=False, indent=2, default=str).encode('utf-8')
+            yield f"{codigo}/post.json", len(row), time.time(), True, lambda row=row: [row]
+            manifest = self.get_manifest(codigo)
+            for path in sorted(manifest):
+                entry = manifest[path]
+                key = self._key(codigo, entry['folder'], entry['name'])
+                stat = self.backend.stat(key)
+                if stat is None:
+                    continue
+                size = stat[0]
+                yield (f"{codigo}/{path}", size, entry_written(entry), entry['kind'] == 'text',
+                       lambda key=key, size=size: self.backend.iter_range(key, 0, size - 1) if size else [])
+    
+    def iter_export(self, posts: List[Dict], fmt: str = 'zip') -> Iterator[bytes]:
+        """
+        Archivo zip o tar con todos los archivos de los posts + post.json (fila de BD)
+        
+        Se genera mientras se envía: sin temporal y con memoria constante
+        (un trozo de lectura del backend). Estructura: <codigo>/post.json,
+        <codigo>/textos/..., <codigo>/imagenes/..., <codigo>/videos/...
+        
+        Args:
+            posts: Filas de los posts a exportar (ya con ownership comprobado)
+            fmt: 'zip' (textos comprimidos, media tal cual) o 'tar'
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Formato de exportación no soportado: {fmt}")
+        if fmt == 'tar':
+            yield from self._iter_tar(posts)
+            return
+        
+        sink = _ArchiveSink()
+        with zipfile.ZipFile(sink, 'w') as archive:
+            for name, size, mtime, compress, chunks in self._export_members(posts):
+                info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+                info.file_size = size  # Solo para decidir ZIP64 (> 4 GB)
+                with archive.open(info, 'w') as member:
+                    for chunk in chunks():
+                        member.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                data = sink.drain()
+                if data:
+                    yield data
+        yield sink.drain()
+    
+    def _iter_tar(self, posts: List[Dict]) -> Iterator[bytes]:
+        """tar a mano (cabecera + datos + relleno a 512): tarfile.addfile copia el archivo entero de golpe"""
+        for name, size, mtime, _, chunks in self._export_members(posts):
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = int(mtime)
+            info.mode = 0o644
+            yield info.tobuf(tarfile.PAX_FORMAT)
+            sent = 0
+            for chunk in chunks():
+                chunk = chunk[:size - sent]
+                sent += len(chunk)
+                yield chunk
+            if sent < size:
+                # El archivo encogió mientras se exportaba: rellenar para que el tar siga siendo válido
+                yield b'\0' * (size - sent)
+            yield b'\0' * (-size % tarfile.BLOCKSIZE)
+        yield b'\0' * (2 * tarfile.BLOCKSIZE)
+    
+    # ========================================
+    # VERSIONES ASYNC (pool de I/O acotado)
+    # ========================================
+    # Mismo comportamiento que los métodos síncronos, pero la lectura/escritura
+    # (y sus print) corren en el pool de I/O: un archivo de varios MB no
+    # bloquea el event loop ni compite con to_thread por hilos.
+    
+    async def _run_io(self, fn: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, partial(fn, *args))
+    
+    async def create_post_folders_async(self, codigo: str) -> Dict[str, str]:
+        return await self._run_io(self.create_post_folders, codigo)
+    
+    async def save_file_async(self, codigo: str, folder: str, filename: str, content: str) -> bool:
+        return await self._run_io(self.save_file, codigo, folder, filename, content)
+    
+    async def read_file_async(self, codigo: str, folder: str, filename: str) -> Optional[str]:
+        return await self._run_io(self.read_file, codigo, folder, filename)
+    
+    async def save_binary_file_async(self, codigo: str, folder: str, filename: str, data: bytes) -> bool:
+        return await self._run_io(self.save_binary_file, codigo, folder, filename, data)
+    
+    async def read_binary_file_async(self, codigo: str, folder: str, filename: str) -> Optional[bytes]:
+        return await self._run_io(self.read_binary_file, codigo, folder, filename)
+    
+    async def copy_file_async(self, codigo: str, src_folder: str, src_filename: str,
+                              dst_folder: str, dst_filename: str) -> bool:
+        return await self._run_io(self.copy_file, codigo, src_folder, src_filename, dst_folder, dst_filename)
+    
+    async def ingest_file_async(self, codigo: str, folder: str, filename: str, source_path: Path) -> bool:
+        return await self._run_io(self.ingest_file, codigo, folder, filename, source_path)
+    
+    async def save_upload_async(self, codigo: str, folder: str, filename: str,
+                                chunks: AsyncIterable[bytes], max_bytes: int = MAX_UPLOAD_BYTES) -> Dict:
+        """
+        Guarda una subida HTTP sin tenerla entera en memoria
+        
+        Los trozos se escriben (en el pool de I/O) a un temporal de storage/tmp
+        calculando el sha256 por el camino; al terminar, el temporal entra al
+        almacén con un rename atómico. Memoria por subida: ~UPLOAD_CHUNK_SIZE.
+        
+        Returns:
+            Entrada del manifiesto del archivo guardado
+        
+        Raises:
+            UploadTooLarge: si pasa de max_bytes (el temporal se borra)
+            ValueError: ruta de archivo inválida
+        """
+        self._key(codigo, folder, filename)  # Valida la ruta antes de recibir nada
+        tmp_path = self.scratch_path()
+        sha = hashlib.sha256()
+        buffer = bytearray()
+        size = 0
+        f = await self._run_io(open, tmp_path, 'wb')
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{filename} supera el máximo de {max_bytes // (1024 * 1024)} MB")
+                buffer.extend(chunk)
+                if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                    await self._run_io(self._write_chunk, f, sha, buffer)
+                    buffer.clear()
+            if buffer:
+                await self._run_io(self._write_chunk, f, sha, buffer)
+            await self._run_io(f.close)
+        except BaseException:
+            f.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return await self._run_io(self._store_upload, codigo, folder, filename, tmp_path, sha.hexdigest())
+    
+    def _write_chunk(self, f, sha, chunk: bytearray):
+        sha.update(chunk)
+        f.write(chunk)
+    
+    def _store_upload(self, codigo: str, folder: str, filename: str, tmp_path: Path, digest: str) -> Dict:
+        key = self._key(codigo, folder, filename)
+        try:
+            self.backend.write_from_path(key, tmp_path, digest, self._digests(codigo))
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        entry = self._entry(codigo, folder, filename, digest)
+        self._record(codigo, {f"{folder}/{filename}": entry})
+        print(f"💾 Subido: {key} ({entry['size'] / (1024 * 1024):.2f} MB)")
+        return entry
+    
+    async def get_manifest_async(self, codigo: str) -> Dict[str, Dict]:
+        return await self._run_io(self.get_manifest, codigo)
+    
+    async def index_file_async(self, codigo: str, folder: str, filename: str) -> Optional[Dict]:
+        return await self._run_io(self.index_file, codigo, folder, filename)
+    
+    async def reconcile_index_async(self) -> Dict:
+        return await self._run_io(self.reconcile_index)
+    
+    async def file_exists_async(self, codigo: str, folder: str, filename: str) -> bool:
+        return await self._run_io(self.file_exists, codigo, folder, filename)
+    
+    async def get_storage_info_async(self) -> Dict:
+        return await self._run_io(self.get_storage_info)
+    
+    async def list_files_async(self, codigo: str, folder: str) -> List[str]:
+        return await self._run_io(self.list_files, codigo, folder)
+    
+    async def delete_file_async(self, codigo: str, folder: str, filename: str) -> bool:
+        return await self._run_io(self.delete_file, codigo, folder, filename)
+    
+    async def delete_post_folder_async(self, codigo: str) -> bool:
+        return await self._run_io(self.delete_post_folder, codigo)
+    
+    async def collect_garbage_async(self, posts: Dict[str, Dict], dry_run: bool = True,
+                                    batch_size: int = GC_BATCH_SIZE, pause: float = GC_BATCH_PAUSE,
+                                    orphans: bool = True) -> Dict:
+        """
+        Reconcilia el almacenamiento con la tabla posts
+        
+        Borra carpetas de posts que ya no existen en BD y archivos obsoletos de
+        posts vivos (ver _stale_files), en lotes de batch_size con una pausa
+        entre lotes. Con dry_run solo devuelve el informe. Con orphans=False
+        solo mira los posts dados (informe de un usuario: ver plan_garbage).
+        """
+        report = await self._run_io(partial(self.plan_garbage, posts, orphans=orphans))
+        report['dry_run'] = dry_run
+        if dry_run:
+            return report
+        
+        jobs = [partial(self.delete_post_folder, item['codigo']) for item in report['orphan_posts']]
+        jobs += [partial(self.delete_file, item['codigo'], item['folder'], item['name'])
+                 for item in report['stale_files']]
+        removed = 0
+        for start in range(0, len(jobs), batch_size):
+            if start:
+                await asyncio.sleep(pause)
+            for job in jobs[start:start + batch_size]:
+                removed += bool(await self._run_io(job))
+        report['removed'] = removed
+        report['pruned_blobs'] = await self._run_io(self.prune_blobs)
+        print(f"🧹 GC de storage: {removed}/{len(jobs)} elementos eliminados ({report['reclaimable_mb']} MB)")
+        return report
+    
+    async def gc_loop(self, load_posts: Callable[[], Awaitable[List[Dict]]],
+                      interval_hours: float = STORAGE_GC_INTERVAL_HOURS):
+        """
+        GC en segundo plano: cada interval_hours lee los posts con load_posts()
+        y ejecuta collect_garbage_async. Pensado para asyncio.create_task al arrancar.
+        load_posts solo necesita devolver codigo y los checkboxes *_mp4
+        (async_db_service.get_posts_for_gc).
+        """
+        while True:
+            await asyncio.sleep(interval_hours * 3600)
+            try:
+                posts = {post['codigo']: post for post in await load_posts()}
+                await self.collect_garbage_async(posts, dry_run=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error en el GC de storage: {e}")
+    
+    def close(self):
+        """Espera a que terminen las escrituras en curso y cierra el pool de I/O"""
+        self._io_executor.shutdown(wait=True)
+    
     def get_file_url(self, codigo: str, folder: str, filename: str) -> str:
         """
         Obtiene URL para servir un archivo
@@ -219,26 +942,24 @@ class FileService:
         return f"/api/files/{codigo}/{folder}/{filename}"
     
     def get_storage_info(self) -> Dict:
-        """Obtiene información del storage"""
+        """
+        Obtiene información del storage (agregado global, sin recorrer el almacenamiento)
+        total_size_mb es el tamaño lógico: un blob enlazado desde varios archivos cuenta por cada uno.
+        """
         try:
-            total_size = 0
-            file_count = 0
-            
-            for root, dirs, files in os.walk(self.storage_path):
-                for file in files:
-                    file_path = Path(root) / file
-                    total_size += file_path.stat().st_size
-                    file_count += 1
+            usage = self._load_usage()
             
             return {
-                'path': str(self.storage_path),
-                'total_size_mb': round(total_size / (1024 * 1024), 2),
-                'file_count': file_count,
-                'exists': self.storage_path.exists()
+                'path': self.backend.location,
+                'backend': self.backend.name,
+                'total_size_mb': round(usage['total_bytes'] / (1024 * 1024), 2),
+                'file_count': usage['file_count'],
+                'by_kind': usage['by_kind'],
+                'exists': True
             }
         except Exception as e:
             return {
-                'path': str(self.storage_path),
+                'path': self.backend.location,
                 'error': str(e)
             }
 
@@ -2,11 +2,10 @@
 Servicio de generación y formateo de imágenes
 Usado por: MCP Server, Panel Web, API REST
 """
-from typing import List, Optional, Dict
+from typing import AsyncIterable, List, Optional, Dict
 import sys
 import os
 import json
-import base64
 import requests
 import fal_client
 import cloudinary
@@ -30,8 +29,9 @@ cloudinary.config(
 )
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-import db_service
+import async_db_service
 from services.file_service import file_service
+from services.fal_upload_service import fal_upload_service
 
 class ImageService:
     """Servicio para generar y formatear imágenes"""
@@ -55,13 +55,13 @@ class ImageService:
         print(f"\n🎨 === GENERANDO IMAGEN BASE PARA {codigo} ===")
         
         if user_id:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             if not post:
                 raise Exception("Post no encontrado")
 
         # 1. Leer prompt
         prompt_filename = f"{codigo}_prompt_imagen.txt"
-        prompt = self.file_service.read_file(codigo, 'textos', prompt_filename)
+        prompt = await self.file_service.read_file_async(codigo, 'textos', prompt_filename)
         
         if not prompt:
             raise Exception('Prompt no encontrado. Completa Fase 3 primero.')
@@ -70,7 +70,7 @@ class ImageService:
         
         # 2. Leer metadata de referencias (si existen)
         metadata_filename = f"{codigo}_referencias_metadata.json"
-        metadata_text = self.file_service.read_file(codigo, 'textos', metadata_filename)
+        metadata_text = await self.file_service.read_file_async(codigo, 'textos', metadata_filename)
         
         reference_images = []
         if metadata_text:
@@ -79,19 +79,14 @@ class ImageService:
             
             print(f"📸 Referencias encontradas: {len(referencias)}")
             
-            # 3. Cargar imágenes de referencia y convertir a base64
+            # 3. URLs de las referencias en Fal storage (subidas una vez por contenido; base64 si falla la subida)
             for ref in referencias:
                 try:
-                    # Leer imagen
-                    image_bytes = self.file_service.read_binary_file(codigo, 'imagenes', ref['filename'])
+                    image_url = await fal_upload_service.get_reference_url(codigo, 'imagenes', ref['filename'])
                     
-                    if image_bytes:
-                        # Convertir a base64 data URL
-                        base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                        data_url = f"data:image/png;base64,{base64_image}"
-                        
+                    if image_url:
                         reference_images.append({
-                            'image_url': data_url,
+                            'image_url': image_url,
                             'weight': ref.get('influence', 0.3)
                         })
                         print(f"  ✅ Referencia cargada: {ref['filename']} (peso: {ref.get('influence', 0.3)})")
@@ -145,7 +140,7 @@ class ImageService:
                 else:
                     filename = f"{codigo}_imagen_base_{idx}.png"
                 
-                self.file_service.save_binary_file(codigo, 'imagenes', filename, image_bytes)
+                await self.file_service.save_binary_file_async(codigo, 'imagenes', filename, image_bytes)
                 
                 generated_images.append({
                     'filename': filename,
@@ -156,23 +151,22 @@ class ImageService:
                 print(f"  💾 Guardada: {filename}")
 
         # Copiar la primera variación como imagen base si se generaron variaciones
+        # (mismo blob: no ocupa disco extra)
         if generated_images and num_images > 1:
             try:
                 first_filename = f"{codigo}_imagen_base_1.png"
-                first_bytes = self.file_service.read_binary_file(codigo, 'imagenes', first_filename)
-                if first_bytes:
-                    self.file_service.save_binary_file(codigo, 'imagenes', f"{codigo}_imagen_base.png", first_bytes)
+                await self.file_service.copy_file_async(codigo, 'imagenes', first_filename, 'imagenes', f"{codigo}_imagen_base.png")
             except Exception as e:
                 print(f"⚠️ No se pudo copiar imagen base: {e}")
 
         # Si solo se generó imagen base, limpiar metadata/variaciones anteriores
         if num_images == 1:
             try:
-                imagenes = self.file_service.list_files(codigo, 'imagenes')
+                imagenes = await self.file_service.list_files_async(codigo, 'imagenes')
                 for fname in imagenes:
                     if fname.startswith(f"{codigo}_imagen_base_") and fname.endswith(".png"):
-                        self.file_service.delete_file(codigo, 'imagenes', fname)
-                self.file_service.delete_file(codigo, 'textos', f"{codigo}_imagen_variations.json")
+                        await self.file_service.delete_file_async(codigo, 'imagenes', fname)
+                await self.file_service.delete_file_async(codigo, 'textos', f"{codigo}_imagen_variations.json")
             except Exception as e:
                 print(f"⚠️ No se pudieron limpiar variaciones anteriores: {e}")
         
@@ -185,13 +179,13 @@ class ImageService:
             }
             metadata_filename = f"{codigo}_imagen_variations.json"
             try:
-                file_service.save_file(codigo, "textos", metadata_filename, json.dumps(metadata, indent=2))
+                await file_service.save_file_async(codigo, "textos", metadata_filename, json.dumps(metadata, indent=2))
             except Exception as e:
                 print(f"⚠️ No se pudo guardar metadata de variaciones: {e}")
 
         # 8. Actualizar checkbox en BD y resetear fases posteriores
         if generated_images:
-            db_service.update_post(codigo, {
+            await async_db_service.update_post(codigo, {
                 'imagen_base_png': True,
                 'instagram_1x1_png': False,
                 'instagram_stories_9x16_png': False,
@@ -232,13 +226,13 @@ class ImageService:
         print(f"\n🖼️ === FORMATEANDO IMÁGENES CON CLOUDINARY AI ===")
         
         if user_id:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             if not post:
                 raise Exception("Post no encontrado")
 
         # 1. Leer imagen base
         base_filename = f"{codigo}_imagen_base.png"
-        image_bytes = self.file_service.read_binary_file(codigo, 'imagenes', base_filename)
+        image_bytes = await self.file_service.read_binary_file_async(codigo, 'imagenes', base_filename)
         
         if not image_bytes:
             raise Exception(f'Imagen base no encontrada: {base_filename}')
@@ -318,11 +312,11 @@ class ImageService:
                     
                     # Guardar en storage
                     filename = f"{codigo}_{name}.png"
-                    self.file_service.save_binary_file(codigo, 'imagenes', filename, transformed_bytes)
+                    await self.file_service.save_binary_file_async(codigo, 'imagenes', filename, transformed_bytes)
                     
                     # Actualizar checkbox en BD
                     checkbox_field = f'{name}_png'
-                    db_service.update_post(codigo, {checkbox_field: True}, user_id=user_id)
+                    await async_db_service.update_post(codigo, {checkbox_field: True}, user_id=user_id)
                     
                     formatted.append(filename)
                     print(f"    ✅ {filename} ({specs['width']}x{specs['height']})")
@@ -346,29 +340,31 @@ class ImageService:
                 os.unlink(tmp_path)
             raise Exception(f'Error en Cloudinary: {str(e)}')
     
-    async def upload_manual_image(self, codigo: str, filename: str, image_bytes: bytes, user_id: int = None) -> Dict:
+    async def upload_manual_image(self, codigo: str, filename: str, chunks: AsyncIterable[bytes], user_id: int = None) -> Dict:
         """
         Sube una imagen manualmente (alternativa a generación con IA)
+        La imagen llega por trozos y se copia al almacén sin leerla entera
+        (UploadTooLarge si supera MAX_UPLOAD_MB).
         
         Usado por:
         - Panel Web: Botón "Subir Imagen"
         """
         if user_id:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             if not post:
                 raise Exception("Post no encontrado")
 
         # Guardar imagen
-        self.file_service.save_binary_file(codigo, 'imagenes', filename, image_bytes)
+        entry = await self.file_service.save_upload_async(codigo, 'imagenes', filename, chunks)
         
         # Si es imagen_base, actualizar checkbox
         if 'imagen_base' in filename:
-            db_service.update_post(codigo, {'imagen_base_png': True}, user_id=user_id)
+            await async_db_service.update_post(codigo, {'imagen_base_png': True}, user_id=user_id)
         
         return {
             'success': True,
             'filename': filename,
-            'size': len(image_bytes),
+            'size': entry['size'],
             'message': f'✅ Imagen {filename} subida'
         }
 
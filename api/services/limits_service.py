@@ -2,14 +2,240 @@
 Servicio de verificación de límites por tier de usuario
 Usado por: Endpoints de creación y publicación
 """
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import Optional, Dict
+from collections import OrderedDict
+from sqlalchemy import select, insert, update, delete, case, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+import asyncio
+import logging
+import threading
+import time
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from database import SessionLocal
+from db_writer import run_write, run_write_async
 from db_models import User, AnonymousUsage
+import async_db_service
+import db_service
+
+logger = logging.getLogger(__name__)
+
+def _usage_increment_stmt(key: str, today: date, amount: int = 1, limit: Optional[int] = None):
+    """
+    UPDATE anonymous_usage: suma amount al contador de hoy (si la fila es de otro día empieza en amount)
+    Con limit solo actualiza si aún queda cupo. Compartido por el consumo atómico y el volcado del limitador.
+    """
+    is_today = AnonymousUsage.last_post_date == today
+    count = func.coalesce(AnonymousUsage.posts_created_today, 0)
+    
+    stmt = update(AnonymousUsage).where(AnonymousUsage.ip_address == key)
+    if limit is not None:
+        stmt = stmt.where(or_(~is_today, AnonymousUsage.last_post_date.is_(None), count < limit))
+    # ordered_values: MySQL evalúa el SET en orden (el CASE debe ver la fecha anterior)
+    return stmt.ordered_values(
+        (AnonymousUsage.posts_created_today, case((is_today, count + amount), else_=amount)),
+        (AnonymousUsage.last_post_date, today)
+    ).execution_options(synchronize_session=False)
+
+class AnonymousCreateLimiter:
+    """
+    Cupo diario de creaciones anónimas por IP, en memoria
+    
+    - Cada IP se lee de anonymous_usage la primera vez; después el check es en memoria
+      (las ráfagas denegadas no tocan la BD). Desde el event loop usar consume_async
+    - Los incrementos se vuelcan cada flush_interval segundos sumándolos a la fila, y tras
+      volcar se releen los contadores de hoy: el cupo se comparte entre procesos con un
+      retraso de como mucho un intervalo
+    - El mismo hilo olvida las IPs de días pasados y borra sus filas de la BD
+    Tras un reinicio se pierden como mucho los incrementos de un intervalo.
+    """
+    
+    def __init__(self, flush_interval: float = 30, max_ips: int = 10000,
+                 retention_days: int = 2, sweep_interval: float = 3600):
+        self.flush_interval = flush_interval
+        self.max_ips = max_ips
+        self.retention_days = retention_days
+        self.sweep_interval = sweep_interval
+        self.loads = 0
+        self.flushes = 0
+        self.denied = 0
+        self._entries: OrderedDict = OrderedDict()  # ip → [día, usados, pendientes de volcar]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def consume(self, ip: str, limit: int) -> Optional[int]:
+        """Consume un post del cupo de hoy. Devuelve los usados tras consumir, o None si no queda cupo"""
+        self._start()
+        today = date.today()
+        with self._lock:
+            cached = ip in self._entries
+        return self._consume(ip, limit, today, None if cached else self._load(ip, today))
+    
+    async def consume_async(self, ip: str, limit: int) -> Optional[int]:
+        """Como consume, pero la primera lectura de la IP va a un hilo (no bloquea el event loop)"""
+        self._start()
+        today = date.today()
+        with self._lock:
+            cached = ip in self._entries
+        loaded = None if cached else await asyncio.to_thread(self._load, ip, today)
+        return self._consume(ip, limit, today, loaded)
+    
+    def _consume(self, ip: str, limit: int, today: date, loaded: Optional[int]) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is None:
+                # Descartada por el LRU tras la comprobación: cuenta desde 0 hasta el próximo volcado
+                entry = self._entries[ip] = [today, loaded or 0, 0]
+            if entry[0] != today:
+                # Nuevo día: lo pendiente del día anterior ya no cuenta para el cupo
+                entry[:] = [today, 0, 0]
+            self._entries.move_to_end(ip)
+            if entry[1] >= limit:
+                self.denied += 1
+                return None
+            entry[1] += 1
+            entry[2] += 1
+            used = entry[1]
+            self._evict()
+        return used
+    
+    def flush(self):
+        """
+        Vuelca los incrementos pendientes (un UPDATE por IP, en una transacción)
+        y relee de la BD los contadores de hoy (lo que han consumido otros procesos)
+        """
+        with self._lock:
+            batch = [(ip, entry[0], entry[2]) for ip, entry in self._entries.items() if entry[2]]
+            for ip, _, _ in batch:
+                self._entries[ip][2] = 0
+        
+        if batch:
+            try:
+                run_write(lambda db: self._write(db, batch))
+                self.flushes += 1
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo volcar el cupo anónimo ({len(batch)} IPs): {e}")
+                with self._lock:
+                    for ip, day, pending in batch:
+                        entry = self._entries.get(ip)
+                        if entry is not None and entry[0] == day:
+                            entry[2] += pending
+        
+        try:
+            self._refresh(date.today())
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo releer el cupo anónimo: {e}")
+    
+    def sweep(self):
+        """Olvida IPs de días pasados y borra de la BD las filas sin uso en retention_days"""
+        self.flush()
+        today = date.today()
+        with self._lock:
+            for ip in [ip for ip, entry in self._entries.items() if entry[0] != today and not entry[2]]:
+                del self._entries[ip]
+        cutoff = today - timedelta(days=self.retention_days)
+        run_write(lambda db: db.execute(
+            delete(AnonymousUsage).where(AnonymousUsage.last_post_date < cutoff)
+        ))
+    
+    def close(self):
+        """Detiene el hilo y vuelca lo pendiente"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = sum(entry[2] for entry in self._entries.values())
+        return {
+            'ips': len(self._entries),
+            'pending': pending,
+            'loads': self.loads,
+            'flushes': self.flushes,
+            'denied': self.denied
+        }
+    
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='anon-limiter', daemon=True)
+                    self._thread.start()
+    
+    def _run(self):
+        next_sweep = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            try:
+                if time.monotonic() >= next_sweep:
+                    self.sweep()
+                    next_sweep = time.monotonic() + self.sweep_interval
+                else:
+                    self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ Error en el limitador anónimo: {e}")
+    
+    def _load(self, ip: str, today: date) -> int:
+        """Usados hoy según la BD (para mantener el cupo tras un reinicio)"""
+        self.loads += 1
+        db = SessionLocal()
+        try:
+            row = db.execute(
+                select(AnonymousUsage.posts_created_today, AnonymousUsage.last_post_date)
+                .where(AnonymousUsage.ip_address == ip)
+            ).first()
+        finally:
+            db.close()
+        if row is None or row.last_post_date != today:
+            return 0
+        return row.posts_created_today or 0
+    
+    def _refresh(self, today: date, chunk: int = 500):
+        """Usados = lo que dice la BD + lo pendiente de volcar de este proceso"""
+        with self._lock:
+            ips = [ip for ip, entry in self._entries.items() if entry[0] == today]
+        
+        for start in range(0, len(ips), chunk):
+            keys = ips[start:start + chunk]
+            db = SessionLocal()
+            try:
+                rows = db.execute(
+                    select(AnonymousUsage.ip_address, AnonymousUsage.posts_created_today)
+                    .where(AnonymousUsage.ip_address.in_(keys), AnonymousUsage.last_post_date == today)
+                ).all()
+            finally:
+                db.close()
+            stored = {row.ip_address: row.posts_created_today or 0 for row in rows}
+            with self._lock:
+                for ip in keys:
+                    entry = self._entries.get(ip)
+                    if entry is not None and entry[0] == today:
+                        entry[1] = stored.get(ip, 0) + entry[2]
+    
+    def _write(self, db, batch):
+        for ip, day, pending in batch:
+            stmt = _usage_increment_stmt(ip, day, pending)
+            if db.execute(stmt).rowcount:
+                continue
+            try:
+                with db.begin_nested():
+                    db.execute(insert(AnonymousUsage).values(
+                        ip_address=ip, posts_created_today=pending, last_post_date=day
+                    ))
+            except IntegrityError:
+                db.execute(stmt)
+    
+    def _evict(self):
+        """LRU: descarta IPs ya volcadas si se supera max_ips (se releerán de la BD)"""
+        excess = len(self._entries) - self.max_ips
+        if excess <= 0:
+            return
+        for ip in [ip for ip, entry in self._entries.items() if not entry[2]][:excess]:
+            del self._entries[ip]
 
 class LimitsService:
     """Servicio para verificar límites de uso"""
@@ -30,6 +256,13 @@ class LimitsService:
         }
     }
     
+    def __init__(self):
+        self.anonymous_limiter = AnonymousCreateLimiter(
+            flush_interval=float(os.getenv('ANON_LIMIT_FLUSH_SECONDS', '30')),
+            max_ips=int(os.getenv('ANON_LIMIT_MAX_IPS', '10000')),
+            retention_days=int(os.getenv('ANON_USAGE_RETENTION_DAYS', '2'))
+        )
+    
     def check_create_limit(self, user_id: Optional[int] = None, client_ip: Optional[str] = None) -> Dict:
         """
         Verifica si el usuario puede crear un post
@@ -41,24 +274,35 @@ class LimitsService:
         Returns:
             Dict con 'allowed' (bool) y 'message' (str)
         """
-        db = SessionLocal()
-        try:
-            # Usuario anónimo (por IP)
-            if not user_id and client_ip:
-                return self._check_anonymous_create(db, client_ip)
-            
-            # Usuario registrado
-            elif user_id:
-                return self._check_user_create(db, user_id)
-            
-            # Sin identificación
-            else:
-                return {
-                    'allowed': False,
-                    'message': '❌ No se pudo identificar al usuario'
-                }
-        finally:
-            db.close()
+        # Usuario anónimo (por IP)
+        if not user_id and client_ip:
+            return self._check_anonymous_create(client_ip)
+        
+        # Usuario registrado
+        elif user_id:
+            return self._check_user_create(user_id)
+        
+        # Sin identificación
+        else:
+            return {
+                'allowed': False,
+                'message': '❌ No se pudo identificar al usuario'
+            }
+    
+    async def check_create_limit_async(self, user_id: Optional[int] = None, client_ip: Optional[str] = None) -> Dict:
+        """Como check_create_limit, para los endpoints async (lecturas y escrituras sin bloquear el event loop)"""
+        if not user_id and client_ip:
+            return self._anonymous_create_result(
+                await self.anonymous_limiter.consume_async(client_ip, self.LIMITS['anonymous']['create_per_day'])
+            )
+        elif user_id:
+            user = await async_db_service.get_user_profile(user_id)
+            if not user or user['tier'] == 'premium':
+                return self._user_create_result(user, None)
+            limit = self.LIMITS['free']['create_per_day']
+            created_today = await run_write_async(lambda db: self._consume_create(db, f"user_{user_id}", limit))
+            return self._user_create_result(user, created_today)
+        return self.check_create_limit(user_id=user_id, client_ip=client_ip)
     
     def check_publish_limit(self, user_id: int) -> Dict:
         """
@@ -71,104 +315,161 @@ class LimitsService:
         Returns:
             Dict con 'allowed' (bool) y 'message' (str)
         """
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.id == user_id).first()
-            
-            if not user:
+        user = db_service.get_user_profile(user_id)
+        
+        if not user:
+            return {
+                'allowed': False,
+                'message': '❌ Usuario no encontrado'
+            }
+        
+        # Premium: ilimitado
+        if user['tier'] == 'premium':
+            return {
+                'allowed': True,
+                'message': '✅ Usuario premium - sin límites'
+            }
+        
+        # Free: máximo 20 publicaciones totales
+        if user['tier'] == 'free':
+            published = user['posts_published_total'] or 0
+            if published >= self.LIMITS['free']['publish_total']:
                 return {
                     'allowed': False,
-                    'message': '❌ Usuario no encontrado'
-                }
-            
-            # Premium: ilimitado
-            if user.tier == 'premium':
-                return {
-                    'allowed': True,
-                    'message': '✅ Usuario premium - sin límites'
-                }
-            
-            # Free: máximo 20 publicaciones totales
-            if user.tier == 'free':
-                if user.posts_published_total >= self.LIMITS['free']['publish_total']:
-                    return {
-                        'allowed': False,
-                        'message': f'❌ Límite de {self.LIMITS["free"]["publish_total"]} publicaciones alcanzado. Actualiza a Premium por €19/mes para publicaciones ilimitadas.',
-                        'upgrade_required': True
-                    }
-                
-                return {
-                    'allowed': True,
-                    'message': f'✅ Publicación {user.posts_published_total + 1}/{self.LIMITS["free"]["publish_total"]}'
+                    'message': f'❌ Límite de {self.LIMITS["free"]["publish_total"]} publicaciones alcanzado. Actualiza a Premium por €19/mes para publicaciones ilimitadas.',
+                    'upgrade_required': True
                 }
             
+            return {
+                'allowed': True,
+                'message': f'✅ Publicación {published + 1}/{self.LIMITS["free"]["publish_total"]}'
+            }
+        
+        return {
+            'allowed': False,
+            'message': '❌ Tier de usuario no reconocido'
+        }
+    
+    def reserve_publish(self, user_id: int) -> Dict:
+        """
+        Reserva una publicación del cupo antes de publicar (UPDATE condicional n = n + 1)
+        Solo suma si el tier es premium o si al free aún le queda cupo: dos publicaciones
+        simultáneas no pueden pasar ambas del límite. Si la publicación falla, devolver
+        la reserva con release_publish.
+        
+        Returns:
+            Dict con 'allowed' (bool) y 'message' (str), como check_publish_limit
+        """
+        limit = self.LIMITS['free']['publish_total']
+        published = func.coalesce(User.posts_published_total, 0)
+        reserved = run_write(lambda db: db.execute(
+            update(User)
+            .where(User.id == user_id, or_(User.tier == 'premium', and_(User.tier == 'free', published < limit)))
+            .values(posts_published_total=published + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount)
+        db_service.user_cache.invalidate(user_id)
+        
+        if reserved:
+            return {
+                'allowed': True,
+                'message': '✅ Publicación reservada'
+            }
+        
+        # Sin reserva: el motivo sale del perfil
+        user = db_service.get_user_profile(user_id)
+        if not user:
             return {
                 'allowed': False,
-                'message': '❌ Tier de usuario no reconocido'
+                'message': '❌ Usuario no encontrado'
             }
-            
-        finally:
-            db.close()
+        if user['tier'] == 'free':
+            return {
+                'allowed': False,
+                'message': f'❌ Límite de {limit} publicaciones alcanzado. Actualiza a Premium por €19/mes para publicaciones ilimitadas.',
+                'upgrade_required': True
+            }
+        return {
+            'allowed': False,
+            'message': '❌ Tier de usuario no reconocido'
+        }
     
-    def increment_publish_count(self, user_id: int):
-        """Incrementa el contador de publicaciones del usuario"""
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.id == user_id).first()
-            if user:
-                user.posts_published_total += 1
-                db.commit()
-        finally:
-            db.close()
+    def release_publish(self, user_id: int):
+        """Devuelve una reserva de reserve_publish (la publicación no se llegó a hacer)"""
+        run_write(lambda db: db.execute(
+            update(User)
+            .where(User.id == user_id, User.posts_published_total > 0)
+            .values(posts_published_total=User.posts_published_total - 1)
+            .execution_options(synchronize_session=False)
+        ))
+        db_service.user_cache.invalidate(user_id)
     
-    def _check_anonymous_create(self, db, client_ip: str) -> Dict:
-        """Verifica límite de creación para usuario anónimo"""
+    def _consume_create(self, db, key: str, limit: int) -> Optional[int]:
+        """
+        Consume un post del cupo diario de key (IP o user_<id>) con un UPDATE condicional
+        El reset diario va en la misma sentencia: si last_post_date no es hoy el contador
+        vuelve a 1. Dos creaciones simultáneas nunca superan el límite.
+        Devuelve los posts de hoy tras consumir, o None si ya se alcanzó el límite.
+        """
         today = date.today()
+        stmt = _usage_increment_stmt(key, today, limit=limit)
+        consumed = self._execute_consume(db, stmt, key)
+        if consumed is not None:
+            return consumed
         
-        # Buscar registro de esta IP
-        usage = db.query(AnonymousUsage).filter(
-            AnonymousUsage.ip_address == client_ip
-        ).first()
-        
-        if not usage:
-            # Primera vez que usa el servicio
-            usage = AnonymousUsage(
-                ip_address=client_ip,
-                posts_created_today=0,
-                last_post_date=today
-            )
-            db.add(usage)
-            db.commit()
-        
-        # Resetear contador si es un nuevo día
-        if usage.last_post_date != today:
-            usage.posts_created_today = 0
-            usage.last_post_date = today
-            db.commit()
-        
-        # Verificar límite
+        # Sin fila para esta clave (primer uso) o límite alcanzado
+        if limit <= 0:
+            return None
+        try:
+            with db.begin_nested():
+                db.execute(insert(AnonymousUsage).values(ip_address=key, posts_created_today=1, last_post_date=today))
+            return 1
+        except IntegrityError:
+            # La fila ya existía (límite alcanzado) o la creó otra petición a la vez
+            return self._execute_consume(db, stmt, key)
+    
+    def _execute_consume(self, db, stmt, key: str) -> Optional[int]:
+        """Ejecuta el UPDATE de _consume_create y devuelve el contador resultante (RETURNING si el motor lo soporta)"""
+        if db.get_bind().dialect.update_returning:
+            return db.execute(stmt.returning(AnonymousUsage.posts_created_today)).scalar()
+        if db.execute(stmt).rowcount == 0:
+            return None
+        return db.execute(
+            select(AnonymousUsage.posts_created_today).where(AnonymousUsage.ip_address == key)
+        ).scalar()
+    
+    def _check_anonymous_create(self, client_ip: str) -> Dict:
+        """Verifica y consume el límite de creación para usuario anónimo (en memoria, ver AnonymousCreateLimiter)"""
         limit = self.LIMITS['anonymous']['create_per_day']
-        
-        if usage.posts_created_today >= limit:
+        return self._anonymous_create_result(self.anonymous_limiter.consume(client_ip, limit))
+    
+    def _anonymous_create_result(self, created_today: Optional[int]) -> Dict:
+        limit = self.LIMITS['anonymous']['create_per_day']
+        if created_today is None:
             return {
                 'allowed': False,
                 'message': f'❌ Límite de {limit} posts por día alcanzado. Inicia sesión para crear más: http://localhost:5001/login.html',
                 'login_required': True
             }
         
-        # Incrementar contador
-        usage.posts_created_today += 1
-        db.commit()
-        
         return {
             'allowed': True,
-            'message': f'✅ Post {usage.posts_created_today}/{limit} hoy'
+            'message': f'✅ Post {created_today}/{limit} hoy'
         }
     
-    def _check_user_create(self, db, user_id: int) -> Dict:
-        """Verifica límite de creación para usuario registrado"""
-        user = db.query(User).filter(User.id == user_id).first()
+    def _check_user_create(self, user_id: int) -> Dict:
+        """Verifica y consume el límite de creación para usuario registrado (tier desde user_cache)"""
+        user = db_service.get_user_profile(user_id)
+        if not user or user['tier'] == 'premium':
+            return self._user_create_result(user, None)
         
+        # Free: mismo límite que anónimo (10/día)
+        # Usar tabla AnonymousUsage con user_id como identificador
+        limit = self.LIMITS['free']['create_per_day']
+        created_today = run_write(lambda db: self._consume_create(db, f"user_{user_id}", limit))
+        return self._user_create_result(user, created_today)
+    
+    def _user_create_result(self, user: Optional[Dict], created_today: Optional[int]) -> Dict:
         if not user:
             return {
                 'allowed': False,
@@ -176,53 +477,23 @@ class LimitsService:
             }
         
         # Premium: sin límites
-        if user.tier == 'premium':
+        if user['tier'] == 'premium':
             return {
                 'allowed': True,
                 'message': '✅ Usuario premium - sin límites de creación'
             }
         
-        # Free: mismo límite que anónimo (10/día)
-        # Usar tabla AnonymousUsage con user_id como identificador
-        today = date.today()
-        ip_key = f"user_{user_id}"
-        
-        usage = db.query(AnonymousUsage).filter(
-            AnonymousUsage.ip_address == ip_key
-        ).first()
-        
-        if not usage:
-            usage = AnonymousUsage(
-                ip_address=ip_key,
-                posts_created_today=0,
-                last_post_date=today
-            )
-            db.add(usage)
-            db.commit()
-        
-        # Resetear si es nuevo día
-        if usage.last_post_date != today:
-            usage.posts_created_today = 0
-            usage.last_post_date = today
-            db.commit()
-        
-        # Verificar límite
         limit = self.LIMITS['free']['create_per_day']
-        
-        if usage.posts_created_today >= limit:
+        if created_today is None:
             return {
                 'allowed': False,
                 'message': f'❌ Límite de {limit} posts por día alcanzado. Actualiza a Premium por €19/mes para creación ilimitada.',
                 'upgrade_required': True
             }
         
-        # Incrementar contador
-        usage.posts_created_today += 1
-        db.commit()
-        
         return {
             'allowed': True,
-            'message': f'✅ Post {usage.posts_created_today}/{limit} hoy'
+            'message': f'✅ Post {created_today}/{limit} hoy'
         }
 
 # Instancia global
@@ -3,36 +3,65 @@ Servicio para gestionar posts
 Usado por: MCP Server, Panel Web, API REST
 """
 from typing import List, Optional, Dict
-from datetime import datetime
+import asyncio
+import hashlib
+import json
 import sys
 import os
 
-# Agregar path para importar db_service
+# Agregar path para importar async_db_service
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-import db_service
+import async_db_service
 from services.file_service import file_service
 
+# Máximo de posts en una exportación múltiple (GET /api/posts/export)
+EXPORT_MAX_POSTS = 200
+
+# Textos que viajan dentro del bundle del post (los más grandes se piden aparte a /api/files)
+BUNDLE_TEXT_MAX_BYTES = 256 * 1024
+
 class PostService:
     """Servicio centralizado para operaciones con posts"""
     
     def __init__(self):
         self.file_service = file_service
     
-    async def list_posts(self, limit: Optional[int] = None, user_id: Optional[int] = None) -> List[Dict]:
+    async def list_posts(self, limit: Optional[int] = None, user_id: Optional[int] = None,
+                         summary: bool = False) -> List[Dict]:
         """
-        Lista todos los posts desde MySQL
+        Lista todos los posts desde MySQL (sin limit: sin paginar, crece con la tabla)
+        summary=True devuelve solo codigo, titulo, estado y fechas
         
         Usado por:
-        - Panel Web: Selector de posts
-        - MCP: list_posts()
-        - API: GET /api/posts
+        - API: GET /api/posts?all=1 (el panel usa list_posts_page)
         """
-        posts = db_service.get_all_posts(user_id=user_id)
-        
         if limit:
-            posts = posts[:limit]
+            page = await async_db_service.get_posts_page(user_id=user_id, limit=limit, summary=summary)
+            return page['posts']
+        
+        if summary:
+            return await async_db_service.get_posts_summary(user_id=user_id)
+        return await async_db_service.get_all_posts(user_id=user_id)
+    
+    async def list_posts_page(self, limit: int = 50, user_id: Optional[int] = None,
+                              cursor: Optional[str] = None, estado: Optional[str] = None,
+                              fecha_desde=None, fecha_hasta=None, summary: bool = False) -> Dict:
+        """
+        Lista una página de posts (más recientes primero) con filtros en SQL
+        
+        Usado por:
+        - Panel Web: Selector de posts
+        - API: GET /api/posts?limit=&cursor=&estado=&fecha_desde=&fecha_hasta=
+        - MCP: list_posts()
+        - Chat: herramienta list_posts
         
-        return posts
+        Returns:
+            {'posts': [...], 'next_cursor': str | None}
+        """
+        return await async_db_service.get_posts_page(
+            user_id=user_id, limit=limit, cursor=cursor, estado=estado,
+            fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, summary=summary
+        )
     
     async def get_post(self, codigo: str, user_id: Optional[int] = None) -> Optional[Dict]:
         """
@@ -43,30 +72,109 @@ class PostService:
         - MCP: get_post()
         - API: GET /api/posts/{codigo}
         """
-        post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+        post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
         if not post:
             return None
         
-        # Agregar información de archivos disponibles
-        import os
-        storage_path = os.path.join(os.path.dirname(__file__), '..', '..', 'storage', 'posts', codigo)
-        
+        # Agregar información de archivos disponibles (manifiesto del post, sin listdir)
         archivos_disponibles = {
             'textos': [],
             'imagenes': [],
             'videos': []
         }
         
-        # Listar archivos si existen
-        for tipo in ['textos', 'imagenes', 'videos']:
-            tipo_path = os.path.join(storage_path, tipo)
-            if os.path.exists(tipo_path):
-                archivos_disponibles[tipo] = os.listdir(tipo_path)
+        manifest = await self.file_service.get_manifest_async(codigo)
+        for entry in manifest.values():
+            if entry['folder'] in archivos_disponibles:
+                archivos_disponibles[entry['folder']].append(entry['name'])
+        for names in archivos_disponibles.values():
+            names.sort()
         
         post['archivos'] = archivos_disponibles
         
         return post
     
+    def _bundle_etag(self, post: Dict, manifest: Dict[str, Dict]) -> str:
+        """ETag del bundle: fila del post + hash de cada archivo (cambia si cambia cualquiera)"""
+        sha = hashlib.sha256(json.dumps(post, sort_keys=True, default=str).encode('utf-8'))
+        for key in sorted(manifest):
+            sha.update(f"{key}:{manifest[key]['hash']}".encode('utf-8'))
+        return f'"{sha.hexdigest()[:32]}"'
+    
+    async def get_post_bundle(self, codigo: str, user_id: Optional[int] = None,
+                              if_none_match: Optional[str] = None) -> Optional[Dict]:
+        """
+        Todo lo que el panel necesita para abrir un post en una sola llamada:
+        fila del post (con archivos), manifiesto y contenido de los textos
+        pequeños (base, redes, prompts, scripts, metadata JSON)
+        
+        Una sola comprobación de ownership (la de get_post). Si if_none_match
+        coincide con el ETag del bundle devuelve {'etag', 'not_modified': True}
+        sin leer ningún texto.
+        
+        Usado por:
+        - Panel Web: Abrir detalles de un post
+        - API: GET /api/posts/{codigo}/bundle
+        """
+        post = await self.get_post(codigo, user_id=user_id)
+        if not post:
+            return None
+        
+        manifest = await self.file_service.get_manifest_async(codigo)
+        etag = self._bundle_etag(post, manifest)
+        if if_none_match and etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+            return {'etag': etag, 'not_modified': True}
+        
+        small_texts = [
+            entry['name'] for entry in manifest.values()
+            if entry['folder'] == 'textos' and entry['size'] <= BUNDLE_TEXT_MAX_BYTES
+        ]
+        contents = await asyncio.gather(*(
+            self.file_service.read_file_async(codigo, 'textos', name) for name in small_texts
+        ))
+        
+        return {
+            'etag': etag,
+            'post': post,
+            'manifest': manifest,
+            'textos': {name: content for name, content in zip(small_texts, contents) if content is not None}
+        }
+    
+    async def get_posts_for_export(self, user_id: Optional[int] = None, codigos: Optional[List[str]] = None,
+                                   estado: Optional[str] = None, fecha_desde=None, fecha_hasta=None) -> List[Dict]:
+        """
+        Filas de los posts a exportar (del usuario): por códigos o por rango
+        de fechas (ej: export semanal). Como mucho EXPORT_MAX_POSTS.
+        
+        Usado por:
+        - API: GET /api/posts/export
+        
+        Raises:
+            ValueError: sin códigos ni fechas, o demasiados posts
+            LookupError: algún código no existe (o no es del usuario)
+        """
+        if codigos:
+            if len(codigos) > EXPORT_MAX_POSTS:
+                raise ValueError(f"Como mucho {EXPORT_MAX_POSTS} posts por exportación")
+            # Un solo SELECT ... WHERE codigo IN (...), no una consulta por código
+            found = {post['codigo']: post for post in await async_db_service.get_posts_by_codigos(codigos, user_id=user_id)}
+            missing = [codigo for codigo in codigos if codigo not in found]
+            if missing:
+                raise LookupError(f"Posts no encontrados: {', '.join(missing)}")
+            return [found[codigo] for codigo in dict.fromkeys(codigos)]
+        
+        if not (fecha_desde or fecha_hasta):
+            raise ValueError("Indica codigos o un rango de fechas (fecha_desde/fecha_hasta)")
+        
+        # Una página de EXPORT_MAX_POSTS: si hay cursor siguiente, el rango se pasa del máximo
+        page = await async_db_service.get_posts_page(
+            user_id=user_id, limit=EXPORT_MAX_POSTS, estado=estado,
+            fecha_desde=fecha_desde, fecha_hasta=fecha_hasta
+        )
+        if page['next_cursor']:
+            raise ValueError(f"Más de {EXPORT_MAX_POSTS} posts en el rango: acótalo")
+        return page['posts']
+    
     async def create_post(
         self,
         titulo: str,
@@ -84,14 +192,11 @@ class PostService:
         - Panel: Botón "Crear Post"
         - API: POST /api/posts
         """
-        # Generar código YYYYMMDD-ref
-        fecha_str = datetime.now().strftime('%Y%m%d')
-        posts_hoy = [p for p in db_service.get_all_posts(user_id=user_id) if p['codigo'].startswith(fecha_str)]
-        numero = len(posts_hoy) + 1
-        codigo = f"{fecha_str}-{numero}"
+        # Generar código YYYYMMDD-n (contador atómico por día, único entre usuarios)
+        codigo = await async_db_service.allocate_post_code()
         
         # Crear carpetas locales
-        self.file_service.create_post_folders(codigo)
+        await self.file_service.create_post_folders_async(codigo)
         
         # Crear post en MySQL
         post_data = {
@@ -106,22 +211,22 @@ class PostService:
             'user_id': user_id
         }
         
-        success = db_service.create_post(post_data)
+        success = await async_db_service.create_post(post_data)
         
         if not success:
             raise Exception(f"Error creando post {codigo}")
         
         # Crear base.txt inicial
         content = f"# {titulo}\n\n{idea or ''}"
-        self.file_service.save_file(codigo, 'textos', f"{codigo}_base.txt", content)
+        await self.file_service.save_file_async(codigo, 'textos', f"{codigo}_base.txt", content)
         
         # Marcar checkbox de base.txt
-        db_service.update_post(codigo, {'base_txt': True}, user_id=user_id)
+        post = await async_db_service.update_post(codigo, {'base_txt': True}, user_id=user_id, return_row=True)
         
         return {
             'success': True,
             'codigo': codigo,
-            'post': db_service.get_post_by_codigo(codigo, user_id=user_id),
+            'post': post,
             'message': f"✅ Post {codigo} creado exitosamente"
         }
     
@@ -133,14 +238,14 @@ class PostService:
         - Panel Web: Guardar cambios
         - API: PATCH /api/posts/{codigo}
         """
-        success = db_service.update_post(codigo, updates, user_id=user_id)
+        post = await async_db_service.update_post(codigo, updates, user_id=user_id, return_row=True)
         
-        if not success:
+        if not post:
             raise Exception(f"Error actualizando post {codigo}")
         
         return {
             'success': True,
-            'post': db_service.get_post_by_codigo(codigo, user_id=user_id),
+            'post': post,
             'message': f"✅ Post {codigo} actualizado"
         }
     
@@ -152,11 +257,14 @@ class PostService:
         - Panel Web: Botón "Eliminar"
         - API: DELETE /api/posts/{codigo}
         """
-        success = db_service.delete_post(codigo, user_id=user_id)
+        success = await async_db_service.delete_post(codigo, user_id=user_id)
         
         if not success:
             raise Exception(f"Error eliminando post {codigo}")
         
+        # Borrar también sus archivos (si falla, el GC de storage lo recoge como huérfano)
+        await self.file_service.delete_post_folder_async(codigo)
+        
         return {
             'success': True,
             'message': f"✅ Post {codigo} eliminado"
@@ -171,13 +279,13 @@ class PostService:
         - Panel: Botón "Inicializar Carpetas"
         - API: POST /api/posts/{codigo}/init-folders
         """
-        post = db_service.get_post_by_codigo(codigo)
+        post = await async_db_service.get_post_by_codigo(codigo)
         
         if not post:
             raise Exception(f"Post {codigo} no encontrado")
         
         # Crear carpetas locales
-        created_paths = self.file_service.create_post_folders(codigo)
+        created_paths = await self.file_service.create_post_folders_async(codigo)
         created = list(created_paths.keys())
         
         return {
@@ -37,17 +37,28 @@ class PublishService:
         Returns:
             Dict con success y post_id o error
         """
+        # Reservar el cupo antes de publicar (atómico); se devuelve si la publicación falla
+        if user_id:
+            limit_check = limits_service.reserve_publish(user_id)
+            if not limit_check['allowed']:
+                return {
+                    'success': False,
+                    'error': limit_check['message'],
+                    'upgrade_required': limit_check.get('upgrade_required', False)
+                }
+        
+        result = {'success': False, 'error': 'Publicación interrumpida'}
+        try:
+            result = self._publish_to_instagram(codigo, caption, user_id, page_id, instagram_account_id)
+        finally:
+            if user_id and not result.get('success'):
+                limits_service.release_publish(user_id)
+        return result
+    
+    def _publish_to_instagram(self, codigo: str, caption: Optional[str], user_id: Optional[int],
+                              page_id: Optional[str], instagram_account_id: Optional[str]) -> Dict:
+        """Publicación en Instagram (el cupo ya está reservado por publish_to_instagram)"""
         try:
-            # Verificar límite de publicación
-            if user_id:
-                limit_check = limits_service.check_publish_limit(user_id)
-                if not limit_check['allowed']:
-                    return {
-                        'success': False,
-                        'error': limit_check['message'],
-                        'upgrade_required': limit_check.get('upgrade_required', False)
-                    }
-            
             # Obtener token e IDs
             access_token = None
             # Si el usuario especifica una página/IG, usar SocialPage
@@ -78,13 +89,10 @@ class PublishService:
             
             # Obtener caption si no se proporciona
             if not caption:
-                # Leer desde storage local
-                storage_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'storage', 'posts', codigo, 'textos', f'{codigo}_instagram.txt')
-                if os.path.exists(storage_path):
-                    with open(storage_path, 'r', encoding='utf-8') as f:
-                        caption = f.read()
-                else:
-                    return {'success': False, 'error': f'No se encontró texto de Instagram en {storage_path}'}
+                # Leer desde storage (FileService)
+                caption = file_service.read_file(codigo, 'textos', f'{codigo}_instagram.txt')
+                if caption is None:
+                    return {'success': False, 'error': f'No se encontró texto de Instagram en posts/{codigo}/textos'}
             
             # Obtener URL de imagen (debe ser pública)
             # TODO: Subir imagen a servidor público o usar Cloudinary
@@ -122,10 +130,6 @@ class PublishService:
             post_id = response.json()['id']
             print(f"🎉 Publicado en Instagram: {post_id}")
             
-            # Incrementar contador de publicaciones
-            if user_id:
-                limits_service.increment_publish_count(user_id)
-            
             return {
                 'success': True,
                 'post_id': post_id,
@@ -170,13 +174,10 @@ class PublishService:
             
             # Obtener mensaje si no se proporciona
             if not message:
-                # Leer desde storage local
-                storage_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'storage', 'posts', codigo, 'textos', f'{codigo}_facebook.txt')
-                if os.path.exists(storage_path):
-                    with open(storage_path, 'r', encoding='utf-8') as f:
-                        message = f.read()
-                else:
-                    return {'success': False, 'error': f'No se encontró texto de Facebook en {storage_path}'}
+                # Leer desde storage (FileService)
+                message = file_service.read_file(codigo, 'textos', f'{codigo}_facebook.txt')
+                if message is None:
+                    return {'success': False, 'error': f'No se encontró texto de Facebook en posts/{codigo}/textos'}
             
             # Obtener URL de imagen
             image_url = f"https://blog.lavelo.es/storage/posts/{codigo}/imagenes/{codigo}_facebook_16x9.png"
@@ -230,13 +231,10 @@ class PublishService:
             
             # Obtener texto si no se proporciona
             if not text:
-                # Leer desde storage local
-                storage_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'storage', 'posts', codigo, 'textos', f'{codigo}_linkedin.txt')
-                if os.path.exists(storage_path):
-                    with open(storage_path, 'r', encoding='utf-8') as f:
-                        text = f.read()
-                else:
-                    return {'success': False, 'error': f'No se encontró texto de LinkedIn en {storage_path}'}
+                # Leer desde storage (FileService)
+                text = file_service.read_file(codigo, 'textos', f'{codigo}_linkedin.txt')
+                if text is None:
+                    return {'success': False, 'error': f'No se encontró texto de LinkedIn en posts/{codigo}/textos'}
             
             # LinkedIn API v2
             url = 'https://api.linkedin.com/v2/ugcPosts'
@@ -306,13 +304,10 @@ class PublishService:
             
             # Obtener texto si no se proporciona
             if not text:
-                # Leer desde storage local
-                storage_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'storage', 'posts', codigo, 'textos', f'{codigo}_twitter.txt')
-                if os.path.exists(storage_path):
-                    with open(storage_path, 'r', encoding='utf-8') as f:
-                        text = f.read()
-                else:
-                    return {'success': False, 'error': f'No se encontró texto de Twitter en {storage_path}'}
+                # Leer desde storage (FileService)
+                text = file_service.read_file(codigo, 'textos', f'{codigo}_twitter.txt')
+                if text is None:
+                    return {'success': False, 'error': f'No se encontró texto de Twitter en posts/{codigo}/textos'}
             
             # Twitter API v2
             url = 'https://api.twitter.com/2/tweets'
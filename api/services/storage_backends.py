@@ -0,0 +1,575 @@
+"""
+Backends de almacenamiento para FileService
+- LocalStorageBackend: disco local (STORAGE_PATH). Deduplica por contenido:
+  cada archivo es un hardlink a storage/blobs/<sha256[:2]>/<sha256>
+- S3StorageBackend: bucket S3 compatible (AWS, MinIO, moto...). Subidas
+  multipart en streaming y lecturas por rangos: varias réplicas de la API
+  comparten media sin NFS
+
+Las claves son rutas relativas con '/': posts/<codigo>/<folder>/<filename>,
+posts/<codigo>/.manifest.json, .usage.json
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def sha256_file(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class StorageBackend:
+    """
+    Interfaz que FileService usa para guardar bytes
+    Las escrituras devuelven el sha256 del contenido (para el manifiesto).
+    Los métodos que modifican aceptan digests: clave → sha256 ya conocido
+    (del manifiesto) de los archivos afectados, para no tener que releerlos.
+    """
+    name = 'base'
+    location = ''
+    needs_digests = False  # True si aprovecha los digests (si no, FileService no los calcula)
+
+    def read(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def write(self, key: str, data: bytes, digests: Optional[Dict[str, str]] = None) -> str:
+        raise NotImplementedError
+
+    def write_stream(self, key: str, chunks: Iterable[bytes], digests: Optional[Dict[str, str]] = None) -> str:
+        """Escribe sin tener el archivo entero en memoria"""
+        raise NotImplementedError
+
+    def write_from_path(self, key: str, source_path: Path, digest: Optional[str] = None,
+                        digests: Optional[Dict[str, str]] = None) -> str:
+        """
+        Guarda un archivo local ya escrito (ej: salida de FFmpeg); source_path desaparece
+        digest: sha256 ya calculado al escribirlo (evita releer el archivo)
+        """
+        with open(source_path, 'rb') as f:
+            digest = self.write_stream(key, iter(lambda: f.read(HASH_CHUNK_SIZE), b''), digests)
+        os.unlink(source_path)
+        return digest
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = HASH_CHUNK_SIZE) -> Iterator[bytes]:
+        """Bytes [start, end] (end inclusivo, None = hasta el final) en trozos"""
+        raise NotImplementedError
+
+    def download(self, key: str, target_path: Path):
+        with open(target_path, 'wb') as f:
+            for chunk in self.iter_range(key):
+                f.write(chunk)
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        """(tamaño, mtime) o None si no existe"""
+        raise NotImplementedError
+
+    def copy(self, src_key: str, dst_key: str, digests: Optional[Dict[str, str]] = None) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str, digests: Optional[Dict[str, str]] = None) -> bool:
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str, digests: Optional[Dict[str, str]] = None) -> int:
+        raise NotImplementedError
+
+    def list(self, prefix: str) -> List[str]:
+        """Claves bajo prefix (recursivo)"""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Path en disco para servirlo con FileResponse o pasarlo a FFmpeg (None si es remoto)"""
+        return None
+
+    def version(self, key: str) -> Optional[str]:
+        """Identificador barato de la versión actual (para validar cachés)"""
+        raise NotImplementedError
+
+    def read_json(self, key: str) -> Optional[Dict]:
+        data = self.read(key)
+        return json.loads(data) if data is not None else None
+
+    def update_json(self, key: str, fn: Callable[[Optional[Dict]], Optional[Dict]]) -> Optional[Dict]:
+        """
+        Read-modify-write atómico de un JSON pequeño (manifiestos, agregado de uso)
+        fn recibe el valor actual (None si no existe) y devuelve el nuevo
+        (None = no escribir). fn puede ejecutarse más de una vez: sin efectos fuera del dict.
+        """
+        raise NotImplementedError
+
+    def make_dirs(self, prefix: str) -> str:
+        """Prepara una "carpeta" y devuelve cómo mostrarla"""
+        return f"{self.location}/{prefix}"
+
+    def prune(self) -> int:
+        """Limpieza de datos sin referencias propia del backend. Devuelve cuántos objetos borró"""
+        return 0
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Disco local con almacén direccionado por contenido
+    El contador de enlaces del sistema de archivos es el contador de
+    referencias: un blob con st_nlink == 1 ya no lo usa ningún archivo.
+    Enlazar, soltar y podar blobs va bajo el mismo lock que update_json
+    (hilos del pool de I/O y el proceso del MCP): un blob no desaparece
+    entre comprobar que existe y enlazarlo.
+    ⚠️ Nunca abrir un archivo para escribir encima (se escribiría en el blob
+    compartido): siempre por write/write_stream/write_from_path.
+    """
+    name = 'local'
+    needs_digests = True
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.location = str(self.root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def _get_blob_path(self, digest: str) -> Path:
+        return self.root / 'blobs' / digest[:2] / digest
+
+    def scratch_path(self, suffix: str = '') -> Path:
+        """Temporal en el mismo sistema de archivos que los blobs (rename atómico)"""
+        tmp_dir = self.root / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir / f"{uuid.uuid4().hex}{suffix}"
+
+    def _blob_of(self, key: str, file_path: Path, digests: Optional[Dict[str, str]]) -> Path:
+        """
+        Blob de file_path: con el hash del manifiesto basta un stat; si falta o
+        no coincide (archivo cambiado por fuera) se recalcula leyendo el archivo
+        """
+        digest = (digests or {}).get(key)
+        if digest:
+            blob_path = self._get_blob_path(digest)
+            try:
+                if os.path.samefile(blob_path, file_path):
+                    return blob_path
+            except FileNotFoundError:
+                pass
+        return self._get_blob_path(sha256_file(file_path))
+
+    def _link_into_place(self, blob_path: Path, key: str, digests: Optional[Dict[str, str]]):
+        """
+        Apunta key al blob (hardlink + rename atómico). Con el lock tomado.
+        Libera el blob anterior si key era su última referencia.
+        Si el sistema de archivos no admite hardlinks, copia.
+        """
+        file_path = self._path(key)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        if file_path.exists() and os.path.samefile(blob_path, file_path):
+            return
+        tmp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError:
+            shutil.copyfile(blob_path, tmp_path)
+        self._release(key, digests)
+        os.replace(tmp_path, file_path)
+
+    def _release(self, key: str, digests: Optional[Dict[str, str]]):
+        """Borra el blob de key si este es su último enlace. Con el lock tomado"""
+        file_path = self._path(key)
+        try:
+            if file_path.stat().st_nlink != 2:
+                return
+            blob_path = self._blob_of(key, file_path, digests)
+            if blob_path.exists() and os.path.samefile(blob_path, file_path):
+                blob_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _adopt(self, source_path: Path, digest: str, key: str, digests: Optional[Dict[str, str]]) -> str:
+        """Mueve source_path al almacén (o lo descarta si el blob ya existía) y lo enlaza en key"""
+        blob_path = self._get_blob_path(digest)
+        with self._locked():
+            if blob_path.exists():
+                os.unlink(source_path)
+            else:
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(source_path, blob_path)
+            self._link_into_place(blob_path, key, digests)
+        return digest
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key: str, data: bytes, digests: Optional[Dict[str, str]] = None) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._get_blob_path(digest)
+        if blob_path.exists():
+            with self._locked():
+                # Otra vez dentro del lock: prune o _release pueden haberlo borrado
+                if blob_path.exists():
+                    self._link_into_place(blob_path, key, digests)
+                    return digest
+        tmp_path = self.scratch_path()
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return self._adopt(tmp_path, digest, key, digests)
+
+    def write_stream(self, key: str, chunks: Iterable[bytes], digests: Optional[Dict[str, str]] = None) -> str:
+        tmp_path = self.scratch_path()
+        sha = hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return self._adopt(tmp_path, sha.hexdigest(), key, digests)
+
+    def write_from_path(self, key: str, source_path: Path, digest: Optional[str] = None,
+                        digests: Optional[Dict[str, str]] = None) -> str:
+        source_path = Path(source_path)
+        return self._adopt(source_path, digest or sha256_file(source_path), key, digests)
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = HASH_CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self._path(key), 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def download(self, key: str, target_path: Path):
+        shutil.copyfile(self._path(key), target_path)
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        try:
+            stat = self._path(key).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def copy(self, src_key: str, dst_key: str, digests: Optional[Dict[str, str]] = None) -> bool:
+        """Nuevo enlace al mismo blob: O(1) y sin disco extra"""
+        src_path = self._path(src_key)
+        with self._locked():
+            if not src_path.is_file():
+                return False
+            blob_path = self._blob_of(src_key, src_path, digests)
+            if not blob_path.exists():
+                # Archivo anterior al almacén: se incorpora la primera vez que se copia
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                os.link(src_path, blob_path)
+            self._link_into_place(blob_path, dst_key, digests)
+        return True
+
+    def delete(self, key: str, digests: Optional[Dict[str, str]] = None) -> bool:
+        file_path = self._path(key)
+        with self._locked():
+            if not file_path.exists():
+                return False
+            self._release(key, digests)
+            file_path.unlink()
+        return True
+
+    def delete_prefix(self, prefix: str, digests: Optional[Dict[str, str]] = None) -> int:
+        base_path = self._path(prefix)
+        if not base_path.exists():
+            return 0
+        removed = 0
+        with self._locked():
+            # Soltar enlace a enlace: varios archivos pueden compartir blob
+            for file_path in list(base_path.rglob('*')):
+                if file_path.is_file():
+                    self._release(file_path.relative_to(self.root).as_posix(), digests)
+                    file_path.unlink()
+                    removed += 1
+            shutil.rmtree(base_path)
+        return removed
+
+    def list(self, prefix: str) -> List[str]:
+        base_path = self._path(prefix)
+        if not base_path.is_dir():
+            return []
+        return sorted(
+            file_path.relative_to(self.root).as_posix()
+            for file_path in base_path.rglob('*') if file_path.is_file()
+        )
+
+    def local_path(self, key: str) -> Optional[Path]:
+        file_path = self._path(key)
+        return file_path if file_path.is_file() else None
+
+    def version(self, key: str) -> Optional[str]:
+        try:
+            stat = self._path(key).stat()
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    @contextmanager
+    def _locked(self):
+        """Exclusión entre hilos y entre procesos (API y MCP comparten storage)"""
+        with self._lock:
+            with open(self.root / '.manifest.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update_json(self, key: str, fn: Callable[[Optional[Dict]], Optional[Dict]]) -> Optional[Dict]:
+        with self._locked():
+            current = self.read_json(key)
+            new = fn(current)
+            if new is None:
+                return current
+            file_path = self._path(key)
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(new, f)
+            os.replace(tmp_path, file_path)
+            return new
+
+    def make_dirs(self, prefix: str) -> str:
+        dir_path = self._path(prefix)
+        dir_path.mkdir(parents=True, exist_ok=True)
+        return str(dir_path)
+
+    def prune(self) -> int:
+        """Borra blobs sin ningún enlace (st_nlink == 1)"""
+        removed = 0
+        blobs_path = self.root / 'blobs'
+        if not blobs_path.exists():
+            return 0
+        for blob_path in blobs_path.glob('*/*'):
+            # Blob a blob: no bloquea las escrituras durante todo el recorrido
+            with self._locked():
+                try:
+                    if blob_path.stat().st_nlink == 1:
+                        blob_path.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+class S3StorageBackend(StorageBackend):
+    """
+    Bucket S3 compatible
+    - Escrituras en streaming: multipart con partes de part_size (memoria acotada)
+    - Lecturas por rangos (GetObject Range) para servir 206 sin descargar entero
+    - Copias server-side (CopyObject): los bytes no pasan por la API
+    - update_json con escrituras condicionales (If-Match / If-None-Match) y reintento:
+      seguro con varias réplicas escribiendo el mismo manifiesto
+    Requiere boto3 (no se instala por defecto: solo con STORAGE_BACKEND=s3).
+    """
+    name = 's3'
+    MIN_PART_SIZE = 5 * 1024 * 1024  # Mínimo de S3 para partes que no son la última
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, part_size: int = 8 * 1024 * 1024,
+                 access_key_id: Optional[str] = None, secret_access_key: Optional[str] = None):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requiere boto3 (pip install boto3)") from e
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.part_size = max(part_size, self.MIN_PART_SIZE)
+        self.location = f"s3://{bucket}/{self.prefix}".rstrip('/')
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=Config(signature_version='s3v4', retries={'max_attempts': 5, 'mode': 'standard'})
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    @staticmethod
+    def _is_missing(error) -> bool:
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def read(self, key: str) -> Optional[bytes]:
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+        except ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    def write(self, key: str, data: bytes, digests: Optional[Dict[str, str]] = None) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, Metadata={'sha256': digest})
+        return digest
+
+    def write_stream(self, key: str, chunks: Iterable[bytes], digests: Optional[Dict[str, str]] = None) -> str:
+        sha = hashlib.sha256()
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            for chunk in chunks:
+                sha.update(chunk)
+                buffer.extend(chunk)
+                if len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(
+                            Bucket=self.bucket, Key=self._key(key)
+                        )['UploadId']
+                    part = self.client.upload_part(
+                        Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                        PartNumber=len(parts) + 1, Body=bytes(buffer)
+                    )
+                    parts.append({'PartNumber': len(parts) + 1, 'ETag': part['ETag']})
+                    buffer.clear()
+
+            if upload_id is None:
+                # Cabe en una parte: PUT simple
+                self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=bytes(buffer),
+                                       Metadata={'sha256': sha.hexdigest()})
+                return sha.hexdigest()
+
+            if buffer:
+                part = self.client.upload_part(
+                    Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                    PartNumber=len(parts) + 1, Body=bytes(buffer)
+                )
+                parts.append({'PartNumber': len(parts) + 1, 'ETag': part['ETag']})
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+            return sha.hexdigest()
+        except BaseException:
+            if upload_id is not None:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id)
+            raise
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = HASH_CHUNK_SIZE) -> Iterator[bytes]:
+        kwargs = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if start or end is not None:
+            kwargs['Range'] = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(**kwargs)['Body']
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return head['ContentLength'], head['LastModified'].timestamp()
+
+    def copy(self, src_key: str, dst_key: str, digests: Optional[Dict[str, str]] = None) -> bool:
+        if self.stat(src_key) is None:
+            return False
+        # Copia gestionada: CopyObject, o UploadPartCopy por partes si es muy grande
+        self.client.copy({'Bucket': self.bucket, 'Key': self._key(src_key)}, self.bucket, self._key(dst_key))
+        return True
+
+    def delete(self, key: str, digests: Optional[Dict[str, str]] = None) -> bool:
+        if self.stat(key) is None:
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return True
+
+    def delete_prefix(self, prefix: str, digests: Optional[Dict[str, str]] = None) -> int:
+        keys = self.list(prefix)
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': self._key(key)} for key in keys[i:i + 1000]],
+                'Quiet': True
+            })
+        return len(keys)
+
+    def list(self, prefix: str) -> List[str]:
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get('Contents', []):
+                keys.append(obj['Key'][len(self.prefix):])
+        return sorted(keys)
+
+    def version(self, key: str) -> Optional[str]:
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['ETag']
+        except ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    def update_json(self, key: str, fn: Callable[[Optional[Dict]], Optional[Dict]],
+                    max_attempts: int = 10) -> Optional[Dict]:
+        from botocore.exceptions import ClientError
+        for _ in range(max_attempts):
+            try:
+                obj = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+                current, etag = json.loads(obj['Body'].read()), obj['ETag']
+            except ClientError as e:
+                if not self._is_missing(e):
+                    raise
+                current, etag = None, None
+
+            new = fn(current)
+            if new is None:
+                return current
+            condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+            try:
+                self.client.put_object(Bucket=self.bucket, Key=self._key(key),
+                                       Body=json.dumps(new).encode('utf-8'),
+                                       ContentType='application/json', **condition)
+                return new
+            except ClientError as e:
+                # Otra réplica escribió entre medias: releer y reintentar
+                if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                    raise
+        raise RuntimeError(f"Conflicto persistente actualizando {key}")
+
+def create_storage_backend(storage_path: str) -> StorageBackend:
+    """Backend según STORAGE_BACKEND (local por defecto)"""
+    backend = os.getenv('STORAGE_BACKEND', 'local').lower()
+    if backend == 's3':
+        return S3StorageBackend(
+            bucket=os.environ['S3_BUCKET'],
+            prefix=os.getenv('S3_PREFIX', ''),
+            endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+            region=os.getenv('S3_REGION') or None,
+            part_size=int(os.getenv('S3_MULTIPART_CHUNK_MB', '8')) * 1024 * 1024,
+            access_key_id=os.getenv('S3_ACCESS_KEY_ID') or None,
+            secret_access_key=os.getenv('S3_SECRET_ACCESS_KEY') or None
+        )
+    if backend != 'local':
+        raise ValueError(f"STORAGE_BACKEND desconocido: {backend}")
+    return LocalStorageBackend(Path(storage_path))
@@ -0,0 +1,224 @@
+"""
+Miniaturas/previews de imágenes para el panel (derivados de /api/files)
+Redimensiona con Pillow en un pool de procesos y guarda el resultado en
+storage/thumbs, indexado por hash del original + parámetros. La caché tiene
+un presupuesto de tamaño (THUMB_CACHE_MB) y se vacía por LRU.
+"""
+import asyncio
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+from services.file_service import FileService, file_service
+
+# Presupuesto de la caché de derivados en disco y procesos de Pillow
+THUMB_CACHE_MB = int(os.getenv('THUMB_CACHE_MB', '256'))
+THUMB_WORKERS = int(os.getenv('THUMB_WORKERS', '2'))
+THUMB_QUALITY = int(os.getenv('THUMB_QUALITY', '80'))
+
+# Parámetros admitidos (acotados: cada combinación es un archivo en caché)
+THUMB_MIN_WIDTH = 16
+THUMB_MAX_WIDTH = 2048
+THUMB_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG', 'png': 'PNG'}
+
+# Tras vaciar, la caché queda en este porcentaje del presupuesto (evita vaciar en cada escritura)
+EVICT_TARGET = 0.9
+
+def _render(source_path: str, target_path: str, width: Optional[int], fmt: str, quality: int):
+    """
+    Corre en el pool de procesos: redimensiona source_path a width de ancho
+    (sin ampliar, manteniendo proporción) y lo guarda en target_path con
+    un rename atómico.
+    """
+    from PIL import Image
+
+    with Image.open(source_path) as img:
+        if width and img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img.draft('RGB', (width, height))  # JPEG: decodifica ya reducido
+            img = img.resize((width, height), Image.Resampling.LANCZOS)
+        if fmt == 'jpeg' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            img = img.convert('RGBA')
+
+        tmp_path = f"{target_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            img.save(tmp_path, THUMB_FORMATS[fmt], quality=quality, optimize=True)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+class ThumbnailService:
+    """
+    Derivados redimensionados de las imágenes de los posts
+
+    - Clave: sha256 del original (del manifiesto) + ancho + formato: si la
+      imagen cambia, cambia el hash y el derivado viejo se va por LRU
+    - Un acierto actualiza el mtime del archivo (es el "último uso" del LRU;
+      atime no es fiable con noatime)
+    - Peticiones simultáneas del mismo derivado esperan al mismo render, que corre
+      en su propia tarea: cancelar una petición no lo cancela para las demás
+    """
+
+    def __init__(self, files: FileService, max_bytes: int = THUMB_CACHE_MB * 1024 * 1024):
+        self.files = files
+        self.cache_dir = files.storage_path / 'thumbs'
+        self.max_bytes = max_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._cache_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _cache_path(self, digest: str, width: Optional[int], fmt: str) -> Path:
+        return self.cache_dir / digest[:2] / f"{digest}_w{width or 0}.{fmt}"
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Perezoso: los procesos solo arrancan si el panel pide miniaturas
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=THUMB_WORKERS)
+        return self._executor
+
+    async def get_thumbnail(self, codigo: str, folder: str, filename: str, entry: Dict,
+                            width: Optional[int], fmt: str) -> Path:
+        """
+        Path del derivado en caché (lo genera si no existe)
+
+        Args:
+            entry: Entrada del manifiesto del original (hash y tamaño)
+            width: Ancho máximo (None = tamaño original, solo cambia el formato)
+            fmt: 'webp' | 'jpeg' | 'png'
+        """
+        if fmt not in THUMB_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt}")
+        target_path = self._cache_path(entry['hash'], width, fmt)
+        if await self.files._run_io(self._touch, target_path):
+            self.hits += 1
+            return target_path
+
+        cache_key = str(target_path)
+        task = self._inflight.get(cache_key)
+        if task is None:
+            self.misses += 1
+            task = self._inflight[cache_key] = asyncio.create_task(
+                self._generate(codigo, folder, filename, target_path, width, fmt)
+            )
+            task.add_done_callback(lambda done: self._finish(cache_key, done))
+        # shield: si se cancela esta petición, el render sigue para las demás
+        await asyncio.shield(task)
+        return target_path
+
+    async def _generate(self, codigo: str, folder: str, filename: str, target_path: Path,
+                        width: Optional[int], fmt: str):
+        """Render del derivado en su propia tarea (no pertenece a ninguna petición)"""
+        loop = asyncio.get_running_loop()
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        async with self.files.local_file_async(codigo, folder, filename) as source_path:
+            await loop.run_in_executor(
+                self._get_executor(), _render,
+                str(source_path), str(target_path), width, fmt, THUMB_QUALITY
+            )
+        await self.files._run_io(self._account, target_path)
+
+    def _finish(self, cache_key: str, task: asyncio.Task):
+        self._inflight.pop(cache_key, None)
+        if not task.cancelled():
+            task.exception()  # Marcada como leída aunque nadie más espere
+
+    def _touch(self, path: Path) -> bool:
+        """Acierto de caché: marca el uso y devuelve True si existe"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _account(self, path: Path):
+        """Suma el derivado nuevo al total y vacía por LRU si se pasa del presupuesto"""
+        with self._lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(size for size, _, _ in self._scan())
+            else:
+                try:
+                    self._cache_bytes += path.stat().st_size
+                except FileNotFoundError:
+                    pass
+            if self._cache_bytes > self.max_bytes:
+                self._evict(keep=path)
+
+    def _scan(self):
+        """(tamaño, mtime, path) de cada derivado en caché"""
+        if not self.cache_dir.exists():
+            return []
+        files = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for item in os.scandir(shard.path):
+                if item.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_size, stat.st_mtime, item.path))
+        return files
+
+    def evict(self) -> int:
+        with self._lock:
+            return self._evict()
+
+    def _evict(self, keep: Optional[Path] = None) -> int:
+        """
+        Borra los derivados usados hace más tiempo hasta quedar en EVICT_TARGET
+        del presupuesto. Recalcula el total desde disco (otras réplicas o
+        procesos pueden compartir la carpeta). keep: derivado recién generado
+        que se va a servir ahora (nunca se borra).
+
+        Returns:
+            Bytes liberados
+        """
+        files = self._scan()
+        total = sum(size for size, _, _ in files)
+        target = self.max_bytes * EVICT_TARGET
+        freed = 0
+        for size, _, path in sorted(files, key=lambda item: item[1]):
+            if total - freed <= target:
+                break
+            if keep is not None and path == str(keep):
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            freed += size
+            self.evictions += 1
+        self._cache_bytes = total - freed
+        if freed:
+            print(f"🧹 Caché de miniaturas: {freed / (1024 * 1024):.1f} MB liberados")
+        return freed
+
+    def stats(self) -> Dict:
+        return {
+            'cache_mb': round((self._cache_bytes or 0) / (1024 * 1024), 2),
+            'budget_mb': round(self.max_bytes / (1024 * 1024), 2),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def close(self):
+        """Cierra el pool de procesos (si llegó a arrancar)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+# Instancia global
+thumbnail_service = ThumbnailService(file_service)
@@ -7,7 +7,7 @@ import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-import db_service
+import async_db_service
 from services.content_service import content_service
 from services.image_service import image_service
 from services.video_service import video_service
@@ -23,6 +23,9 @@ class ValidationService:
     async def validate_phase(self, codigo: str, current_state: str, redes: Dict[str, bool] = None, user_id: int = None) -> Dict:
         """
         Valida una fase y ejecuta la acción correspondiente
+        Ownership y redes van en una unidad de trabajo (un commit, antes de la
+        acción). La acción confirma cada paso al terminarlo: el panel ve el
+        progreso y un error a mitad no deshace los pasos ya guardados.
         
         Usado por:
         - Panel Web: Botón "VALIDATE"
@@ -31,16 +34,17 @@ class ValidationService:
         if redes is None:
             redes = {}
         
-        if user_id:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
-            if not post:
-                raise Exception("Post no encontrado")
+        async with async_db_service.unit_of_work():
+            if user_id:
+                post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
+                if not post:
+                    raise Exception("Post no encontrado")
 
-        # Guardar configuración de redes en BD
-        print(f"📱 Redes seleccionadas: {redes}")
-        for network, active in redes.items():
-            field_name = f'redes_{network}'
-            db_service.update_post(codigo, {field_name: active}, user_id=user_id)
+            # Guardar configuración de redes en BD
+            print(f"📱 Redes seleccionadas: {redes}")
+            if redes:
+                redes_updates = {f'redes_{network}': active for network, active in redes.items()}
+                await async_db_service.update_post(codigo, redes_updates, user_id=user_id)
         
         # Máquina de estados: definir transiciones
         state_transitions = {
@@ -143,7 +147,7 @@ class ValidationService:
             action_result = {'success': True, 'message': 'Publicación pendiente de implementar'}
         
         # Actualizar estado en BD
-        db_service.update_post(codigo, {'estado': transition['next']}, user_id=user_id)
+        await async_db_service.update_post(codigo, {'estado': transition['next']}, user_id=user_id)
         
         return {
             'success': True,
@@ -174,7 +178,7 @@ class ValidationService:
         }
         
         if user_id:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             if not post:
                 raise Exception("Post no encontrado")
 
@@ -11,7 +11,7 @@ from datetime import datetime
 import asyncio
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-import db_service
+import async_db_service
 from services.file_service import file_service
 
 class VideoService:
@@ -132,22 +132,20 @@ class VideoService:
         - Panel Web: Validar Fase 6 (VIDEO_PROMPT_AWAITING)
         """
         if user_id:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             if not post:
                 raise Exception("Post no encontrado")
 
         # Leer script de video
         script_filename = f"{codigo}_script_video.txt"
-        script = self.file_service.read_file(codigo, 'textos', script_filename)
+        script = await self.file_service.read_file_async(codigo, 'textos', script_filename)
         
         if not script:
             raise Exception('Script de video no encontrado. Completa Fase 5 primero.')
         
-        # Leer imagen base para usar como referencia
+        # Comprobar que existe la imagen base (por ahora no se envía al modelo)
         base_image = f"{codigo}_imagen_base.png"
-        image_bytes = self.file_service.read_binary_file(codigo, 'imagenes', base_image)
-        
-        if not image_bytes:
+        if not await self.file_service.file_exists_async(codigo, 'imagenes', base_image):
             raise Exception('Imagen base no encontrada. Completa Fase 4 primero.')
         
         # Por ahora, generar desde texto (en futuro podría usar imagen)
@@ -155,10 +153,10 @@ class VideoService:
         
         # Guardar video base
         filename = f"{codigo}_video_base.mp4"
-        self.file_service.save_binary_file(codigo, 'videos', filename, result['video_bytes'])
+        await self.file_service.save_binary_file_async(codigo, 'videos', filename, result['video_bytes'])
         
         # Actualizar checkbox en BD
-        db_service.update_post(codigo, {'video_base_mp4': True}, user_id=user_id)
+        await async_db_service.update_post(codigo, {'video_base_mp4': True}, user_id=user_id)
         
         print(f"💾 Video base guardado: {filename}")
         
@@ -181,15 +179,14 @@ class VideoService:
         import subprocess
         
         if user_id:
-            post = db_service.get_post_by_codigo(codigo, user_id=user_id)
+            post = await async_db_service.get_post_by_codigo(codigo, user_id=user_id)
             if not post:
                 raise Exception("Post no encontrado")
 
         # Leer video base
         base_filename = f"{codigo}_video_base.mp4"
-        base_path = self.file_service._get_file_path(codigo, 'videos', base_filename)
         
-        if not base_path.exists():
+        if not await self.file_service.file_exists_async(codigo, 'videos', base_filename):
             raise Exception(f'Video base no encontrado: {base_filename}')
         
         # Formatos para redes sociales
@@ -201,33 +198,48 @@ class VideoService:
         }
         
         formatted = []
-        
-        for name, specs in formats.items():
-            output_filename = f"{codigo}_{name}.mp4"
-            output_path = self.file_service._get_file_path(codigo, 'videos', output_filename)
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Comando FFmpeg para resize y crop
-            cmd = [
-                'ffmpeg',
-                '-i', str(base_path),
-                '-vf', f"scale={specs['width']}:{specs['height']}:force_original_aspect_ratio=increase,crop={specs['width']}:{specs['height']}",
-                '-c:a', 'copy',
-                '-y',  # Sobrescribir si existe
-                str(output_path)
-            ]
-            
-            try:
-                await asyncio.to_thread(subprocess.run, cmd, check=True, capture_output=True)
-                
-                # Actualizar checkbox en BD
-                checkbox_field = f'{name}_mp4'
-                db_service.update_post(codigo, {checkbox_field: True}, user_id=user_id)
+        # Formatos con las mismas specs (stories/shorts/tiktok) son el mismo encode:
+        # se codifica una vez y el resto se copia (en local, enlace al mismo blob)
+        encoded = {}
+        
+        # FFmpeg necesita un path local (con backend remoto se descarga a un temporal)
+        async with self.file_service.local_file_async(codigo, 'videos', base_filename) as base_path:
+            for name, specs in formats.items():
+                output_filename = f"{codigo}_{name}.mp4"
+                spec_key = (specs['width'], specs['height'], specs['crop'])
                 
-                formatted.append(output_filename)
-                print(f"  ✅ {output_filename} generado ({specs['width']}x{specs['height']})")
-            except subprocess.CalledProcessError as e:
-                print(f"  ❌ Error formateando {name}: {e.stderr.decode()}")
+                try:
+                    if spec_key in encoded:
+                        if not await self.file_service.copy_file_async(codigo, 'videos', encoded[spec_key], 'videos', output_filename):
+                            raise Exception(f"No se pudo enlazar {encoded[spec_key]}")
+                    else:
+                        # FFmpeg escribe a un temporal (nunca encima de un enlace al almacén)
+                        tmp_path = self.file_service.scratch_path('.mp4')
+                        
+                        # Comando FFmpeg para resize y crop
+                        cmd = [
+                            'ffmpeg',
+                            '-i', str(base_path),
+                            '-vf', f"scale={specs['width']}:{specs['height']}:force_original_aspect_ratio=increase,crop={specs['width']}:{specs['height']}",
+                            '-c:a', 'copy',
+                            '-y',  # Sobrescribir si existe
+                            str(tmp_path)
+                        ]
+                        await asyncio.to_thread(subprocess.run, cmd, check=True, capture_output=True)
+                        if not await self.file_service.ingest_file_async(codigo, 'videos', output_filename, tmp_path):
+                            raise Exception(f"No se pudo guardar {output_filename}")
+                        encoded[spec_key] = output_filename
+                    
+                    # Actualizar checkbox en BD
+                    checkbox_field = f'{name}_mp4'
+                    await async_db_service.update_post(codigo, {checkbox_field: True}, user_id=user_id)
+                    
+                    formatted.append(output_filename)
+                    print(f"  ✅ {output_filename} generado ({specs['width']}x{specs['height']})")
+                except subprocess.CalledProcessError as e:
+                    print(f"  ❌ Error formateando {name}: {e.stderr.decode()}")
+                except Exception as e:
+                    print(f"  ❌ Error formateando {name}: {e}")
         
         return {
             'success': True,
@@ -0,0 +1,52 @@
+"""
+Configuración común de los tests de la API
+- BD sqlite y storage temporales (database.py y file_service los leen al importar)
+- db: tablas creadas en la BD temporal
+- make_client(*routers, user_id=1): app FastAPI con sesión falsa para probar routers
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP_DIR = tempfile.mkdtemp(prefix='lavelo_test_')
+
+os.environ['ENVIRONMENT'] = 'production'
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'test.db')}"
+os.environ['STORAGE_PATH'] = os.path.join(TMP_DIR, 'storage')
+sys.path.insert(0, API_DIR)
+
+@pytest.fixture(scope='session')
+def db():
+    from database import init_db
+    init_db()
+
+@pytest.fixture(scope='session')
+def make_client(db):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    clients = []
+
+    def make(*routers, user_id=1):
+        app = FastAPI()
+
+        @app.middleware('http')
+        async def fake_session(request, call_next):
+            # Usuario logueado sin pasar por /api/auth (request.session lee scope['session'])
+            request.scope['session'] = {'user_id': user_id}
+            return await call_next(request)
+
+        for router in routers:
+            app.include_router(router)
+        client = TestClient(app)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
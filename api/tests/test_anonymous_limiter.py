@@ -0,0 +1,75 @@
+"""
+Tests del cupo anónimo en memoria (AnonymousCreateLimiter)
+- Dos limitadores sobre la misma BD (dos procesos) comparten el cupo tras volcar
+- consume_async lee la IP nueva fuera del event loop
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import asyncio
+import threading
+import pytest
+
+from services.limits_service import AnonymousCreateLimiter
+
+@pytest.fixture
+def limiters(db):
+    created = []
+
+    def make():
+        limiter = AnonymousCreateLimiter(flush_interval=3600)
+        created.append(limiter)
+        return limiter
+
+    yield make
+    for limiter in created:
+        limiter.close()
+
+def test_flush_rereads_usage_from_other_processes(limiters):
+    a, b = limiters(), limiters()
+    ip = '10.0.0.1'
+
+    # Ambos leen la IP antes de que el otro vuelque: cada uno cree que quedan 10
+    assert [a.consume(ip, 10) for _ in range(6)][-1] == 6
+    assert [b.consume(ip, 10) for _ in range(3)][-1] == 3
+
+    a.flush()
+    b.flush()
+    assert b.consume(ip, 10) == 10
+    assert b.consume(ip, 10) is None
+
+    b.flush()
+    a.flush()
+    assert a.consume(ip, 10) is None
+    assert a.stats()['pending'] == 0
+
+def test_refresh_keeps_pending_increments(limiters):
+    a, b = limiters(), limiters()
+    ip = '10.0.0.2'
+
+    b.consume(ip, 10)
+    b.flush()
+    a.consume(ip, 10)
+    a.consume(ip, 10)
+
+    # Lo de b ya está en la BD; lo de a sigue pendiente
+    a._refresh(a._entries[ip][0])
+    assert a._entries[ip][1:] == [3, 2]
+
+def test_consume_async_loads_off_the_event_loop(limiters, monkeypatch):
+    limiter = limiters()
+    load = limiter._load
+    threads = []
+
+    def tracking_load(ip, today):
+        threads.append(threading.current_thread())
+        return load(ip, today)
+
+    monkeypatch.setattr(limiter, '_load', tracking_load)
+
+    async def consume_twice():
+        return [await limiter.consume_async('10.0.0.3', 10) for _ in range(2)]
+
+    assert asyncio.run(consume_twice()) == [1, 2]
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
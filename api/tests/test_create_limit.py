@@ -0,0 +1,28 @@
+"""
+Tests del cupo de creación desde endpoints async (LimitsService.check_create_limit_async)
+- Usuario free: perfil y consumo sin las llamadas bloqueantes de la versión sync
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import asyncio
+
+def test_async_user_check_does_not_use_blocking_calls(db, monkeypatch):
+    import db_service
+    from services import limits_service as limits_module
+
+    user = db_service.create_user('crear@test.local', 'hash')
+
+    def blocking(*args, **kwargs):
+        raise AssertionError('llamada bloqueante desde el event loop')
+
+    monkeypatch.setattr(limits_module, 'run_write', blocking)
+    monkeypatch.setattr(db_service, 'get_user_profile', blocking)
+
+    async def create_twice():
+        service = limits_module.limits_service
+        return [await service.check_create_limit_async(user_id=user.id) for _ in range(2)]
+
+    first, second = asyncio.run(create_twice())
+    assert first == {'allowed': True, 'message': '✅ Post 1/10 hoy'}
+    assert second['message'] == '✅ Post 2/10 hoy'
@@ -0,0 +1,79 @@
+"""
+Tests de las migraciones (db_migrations.run_migrations)
+- Varios procesos migrando a la vez: el lock aplica cada migración una vez
+- La migración de máscaras es repetible tras cortarse a medias (ALTER no transaccional en MySQL)
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import threading
+from sqlalchemy import create_engine, text
+
+import db_migrations
+from db_migrations import run_migrations, get_schema_version, LATEST_VERSION
+
+LEGACY_POSTS = """
+CREATE TABLE posts (
+    id INTEGER PRIMARY KEY,
+    codigo VARCHAR(50),
+    created_at DATETIME,
+    updated_at DATETIME,
+    base_txt BOOLEAN DEFAULT 0,
+    instagram_txt BOOLEAN DEFAULT 0,
+    redes_instagram BOOLEAN DEFAULT 0
+)
+"""
+
+def _legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_POSTS))
+        conn.execute(text(
+            "INSERT INTO posts (codigo, created_at, base_txt, instagram_txt, redes_instagram) "
+            "VALUES ('20240101-3', '2024-01-01', 1, 0, 1)"
+        ))
+    return engine
+
+def test_concurrent_runs_apply_each_migration_once(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(run_migrations(engine))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [LATEST_VERSION] * 4
+    with engine.connect() as conn:
+        versions = [row[0] for row in conn.execute(text("SELECT version FROM schema_version ORDER BY version"))]
+        counters = conn.execute(text("SELECT fecha, ultimo_numero FROM post_code_counters")).all()
+    assert versions == list(range(1, LATEST_VERSION + 1))
+    assert counters == [('20240101', 3)]
+    engine.dispose()
+
+def test_flag_masks_survive_a_rerun_after_partial_drop(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    assert run_migrations(engine) == LATEST_VERSION
+    with engine.connect() as conn:
+        masks = conn.execute(text("SELECT artefactos_mask, redes_mask FROM posts")).one()
+
+    # Simula una migración 5 cortada: una columna vieja sigue ahí y la versión no quedó registrada
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE posts ADD COLUMN instagram_txt BOOLEAN DEFAULT 0"))
+        conn.execute(text("DELETE FROM schema_version WHERE version >= 4"))
+    assert get_schema_version(engine) == 3
+
+    assert run_migrations(engine) == LATEST_VERSION
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT artefactos_mask, redes_mask FROM posts")).one() == masks
+        columns = [row[1] for row in conn.execute(text("PRAGMA table_info(posts)"))]
+        assert conn.execute(text("SELECT COUNT(*) FROM post_code_counters")).scalar() == 1
+    assert 'instagram_txt' not in columns
+    assert masks[0] & 1 and not masks[0] & 2
+    engine.dispose()
+
+def test_lock_file_sits_next_to_sqlite_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'lock.db'}")
+    with db_migrations.migration_lock(engine):
+        assert (tmp_path / 'lock.db.migrations.lock').exists()
+    engine.dispose()
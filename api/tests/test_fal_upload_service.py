@@ -0,0 +1,67 @@
+"""
+Tests de las URLs de referencias en Fal storage (FalUploadService)
+- Un acierto de caché no vuelve a subir
+- Una URL caducada se vuelve a subir
+- Si la subida falla, la referencia va como data URL en base64
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import asyncio
+import base64
+import pytest
+
+from services.fal_upload_service import FalUploadService
+from services.file_service import FileService
+from services.storage_backends import LocalStorageBackend
+
+IMAGE = b'\x89PNG referencia' * 50
+
+class FakeUploader:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, data: bytes, content_type: str) -> str:
+        self.calls.append((len(data), content_type))
+        if self.fail:
+            raise ConnectionError('Fal storage caído')
+        return f"https://fal.test/{len(self.calls)}.png"
+
+@pytest.fixture
+def files(tmp_path):
+    files = FileService(backend=LocalStorageBackend(tmp_path))
+    files.save_binary_file('p1', 'imagenes', 'ref.png', IMAGE)
+    yield files
+    files.close()
+
+def test_cached_url_is_reused(files):
+    uploader = FakeUploader()
+    service = FalUploadService(files, uploader=uploader)
+
+    async def twice():
+        return [await service.get_reference_url('p1', 'imagenes', 'ref.png') for _ in range(2)]
+
+    assert asyncio.run(twice()) == ['https://fal.test/1.png'] * 2
+    assert uploader.calls == [(len(IMAGE), 'image/png')]
+    assert service.stats()['hits'] == 1
+
+def test_expired_url_is_uploaded_again(files):
+    uploader = FakeUploader()
+    service = FalUploadService(files, uploader=uploader, ttl_hours=0)
+
+    async def twice():
+        return [await service.get_url('p1', 'imagenes', 'ref.png') for _ in range(2)]
+
+    assert asyncio.run(twice()) == ['https://fal.test/1.png', 'https://fal.test/2.png']
+    assert service.hits == 0
+
+def test_failed_upload_falls_back_to_data_url(files):
+    service = FalUploadService(files, uploader=FakeUploader(fail=True))
+
+    url = asyncio.run(service.get_reference_url('p1', 'imagenes', 'ref.png'))
+
+    assert url == f"data:image/png;base64,{base64.b64encode(IMAGE).decode('utf-8')}"
+    assert service.stats()['fallbacks'] == 1
+    assert service._inflight == {}
+    assert asyncio.run(service.get_reference_url('p1', 'imagenes', 'falta.png')) is None
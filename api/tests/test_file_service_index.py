@@ -0,0 +1,95 @@
+"""
+Tests del índice de FileService (manifiestos por post y .usage.json)
+- Las peticiones no escanean el almacenamiento: lo hace reconcile_index al arrancar
+- Archivos escritos por fuera del servicio: reconcile_index o index_file (solo ese archivo)
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+import pytest
+
+# La instancia global de file_service se crea al importar: storage temporal
+os.environ.setdefault('STORAGE_PATH', tempfile.mkdtemp(prefix='lavelo_test_storage_'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.file_service import FileService, USAGE_NAME
+from services.storage_backends import LocalStorageBackend
+
+@pytest.fixture
+def files(tmp_path):
+    service = FileService(backend=LocalStorageBackend(tmp_path))
+    yield service
+    service.close()
+
+def _write_outside(files, key, data):
+    """Archivo copiado a mano (sin pasar por FileService)"""
+    path = files.backend.root / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+def _count_reads(files, monkeypatch):
+    reads = []
+    iter_range = files.backend.iter_range
+
+    def counting(key, *args, **kwargs):
+        reads.append(key)
+        return iter_range(key, *args, **kwargs)
+    monkeypatch.setattr(files.backend, 'iter_range', counting)
+    return reads
+
+def test_request_path_does_not_scan_old_posts(files, monkeypatch):
+    _write_outside(files, 'posts/antiguo/imagenes/a.png', b'a' * 100)
+    reads = _count_reads(files, monkeypatch)
+
+    assert files.get_manifest('antiguo') == {}
+    assert files.save_file('nuevo', 'textos', 't.txt', 'hola')
+    assert files.get_storage_info()['file_count'] == 0  # Sin agregado hasta reconciliar
+    assert reads == []
+
+def test_reconcile_builds_manifests_and_usage(files):
+    _write_outside(files, 'posts/antiguo/imagenes/a.png', b'a' * 100)
+    _write_outside(files, 'posts/antiguo/textos/t.txt', b'texto')
+    files.save_binary_file('nuevo', 'videos', 'v.mp4', b'v' * 1000)
+
+    report = files.reconcile_index()
+
+    assert report['posts'] == 2
+    assert set(files.get_manifest('antiguo')) == {'imagenes/a.png', 'textos/t.txt'}
+    usage = files.backend.read_json(USAGE_NAME)
+    assert usage['file_count'] == 3
+    assert usage['total_bytes'] == 1105
+    assert usage['by_kind']['video'] == {'count': 1, 'bytes': 1000}
+
+    # Con el agregado creado, las escrituras lo mantienen
+    files.delete_file('nuevo', 'videos', 'v.mp4')
+    assert files.get_storage_info()['file_count'] == 2
+
+def test_reconcile_only_hashes_new_files_and_drops_missing(files, monkeypatch):
+    files.save_binary_file('p1', 'imagenes', 'a.png', b'a' * 100)
+    files.save_binary_file('p1', 'imagenes', 'b.png', b'b' * 100)
+    files.reconcile_index()
+
+    _write_outside(files, 'posts/p1/imagenes/manual.png', b'm' * 10)
+    os.unlink(files.backend.root / 'posts/p1/imagenes/b.png')
+    reads = _count_reads(files, monkeypatch)
+
+    report = files.reconcile_index()
+
+    assert reads == ['posts/p1/imagenes/manual.png']
+    assert report['updated'] == 1
+    assert set(files.get_manifest('p1')) == {'imagenes/a.png', 'imagenes/manual.png'}
+    assert files.backend.read_json(USAGE_NAME)['file_count'] == 2
+
+def test_index_file_picks_up_manual_copy(files):
+    files.save_file('p1', 'textos', 't.txt', 'hola')
+    files.reconcile_index()
+    _write_outside(files, 'posts/p1/imagenes/manual.png', b'm' * 10)
+
+    entry = files.index_file('p1', 'imagenes', 'manual.png')
+
+    assert entry['size'] == 10
+    assert 'imagenes/manual.png' in files.get_manifest('p1')
+    assert files.get_storage_info()['file_count'] == 2
+    assert files.index_file('p1', 'imagenes', 'no_existe.png') is None
@@ -0,0 +1,99 @@
+"""
+Tests del router de posts
+- GET /api/posts: los filtros inválidos (cursor, fechas) devuelven 400 con el
+  mensaje de la capa de BD, no el 422 de FastAPI
+- POST /api/posts/{codigo}/upload-image: multipart y el JSON base64 de antes
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import base64
+import pytest
+
+pytest.importorskip('fastapi')
+
+@pytest.fixture(scope='module')
+def client(make_client):
+    from routers import posts
+    return make_client(posts.router)
+
+def test_list_posts_page_valid_filters(client):
+    response = client.get('/api/posts/', params={'fecha_desde': '2025-01-01', 'fecha_hasta': '2025-12-31'})
+    assert response.status_code == 200
+    assert response.json()['posts'] == []
+    assert response.json()['next_cursor'] is None
+
+@pytest.mark.parametrize('params', [
+    {'fecha_desde': '2025-13-01'},
+    {'fecha_hasta': 'ayer'},
+    {'cursor': 'no-es-un-cursor'},
+])
+def test_list_posts_invalid_filters_return_400(client, params):
+    response = client.get('/api/posts/', params=params)
+    assert response.status_code == 400
+    assert response.json()['detail']
+
+@pytest.fixture(scope='module')
+def codigo(client):
+    import db_service
+    return db_service.create_post({'codigo': '20250101-1', 'titulo': 'Subidas', 'user_id': 1})['codigo']
+
+def _stored_image(codigo):
+    from services.file_service import file_service
+    return file_service.read_binary_file(codigo, 'imagenes', f'{codigo}_imagen_base.png')
+
+def test_upload_image_multipart(client, codigo):
+    response = client.post(f'/api/posts/{codigo}/upload-image',
+                           files={'file': ('foto.png', b'png multipart', 'image/png')},
+                           data={'filename': f'{codigo}_imagen_base.png'})
+    assert response.status_code == 200
+    assert response.json()['filename'] == f'{codigo}_imagen_base.png'
+    assert _stored_image(codigo) == b'png multipart'
+
+def test_upload_image_legacy_json(client, codigo):
+    image_data = 'data:image/png;base64,' + base64.b64encode(b'png json').decode()
+    response = client.post(f'/api/posts/{codigo}/upload-image', json={'image_data': image_data})
+    assert response.status_code == 200
+    assert _stored_image(codigo) == b'png json'
+
+@pytest.mark.parametrize('kwargs', [
+    {'json': {'image_data': 'no es base64!'}},
+    {'json': {}},
+    {'content': b'{no es json', 'headers': {'content-type': 'application/json'}},
+    {'data': {'filename': 'sin_archivo.png'}, 'files': {'otro': ('x.txt', b'x')}},
+])
+def test_upload_image_bad_body_returns_400(client, codigo, kwargs):
+    assert client.post(f'/api/posts/{codigo}/upload-image', **kwargs).status_code == 400
+
+def test_export_by_codigos_uses_one_query(client, codigo, monkeypatch):
+    import db_service
+    import async_db_service
+    ajeno = db_service.create_post({'codigo': '20250101-9', 'titulo': 'Ajeno', 'user_id': 7})['codigo']
+    single = []
+    monkeypatch.setattr(async_db_service, 'get_post_by_codigo', lambda *a, **k: single.append(a))
+
+    response = client.get('/api/posts/export', params={'codigos': f'{codigo},{codigo}', 'format': 'tar'})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-tar'
+
+    response = client.get('/api/posts/export', params={'codigos': f'{codigo},{ajeno}'})
+    assert response.status_code == 404
+    assert ajeno in response.json()['detail']
+    assert single == []
+
+def test_list_posts_pages_by_default(make_client):
+    import db_service
+    from routers import posts
+    for n in range(52):
+        db_service.create_post({'codigo': f'20250401-{n}', 'titulo': f'Post {n}', 'user_id': 5})
+    client = make_client(posts.router, user_id=5)
+
+    first = client.get('/api/posts/', params={'fields': 'summary'}).json()
+    assert len(first['posts']) == 50
+    assert first['next_cursor']
+    rest = client.get('/api/posts/', params={'fields': 'summary', 'cursor': first['next_cursor']}).json()
+    assert len(rest['posts']) == 2
+    assert rest['next_cursor'] is None
+
+    assert len(client.get('/api/posts/', params={'all': 1}).json()['posts']) == 52
+    assert client.get('/api/posts/', params={'all': 1, 'estado': 'DRAFT'}).status_code == 400
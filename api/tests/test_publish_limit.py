@@ -0,0 +1,63 @@
+"""
+Tests del cupo de publicaciones (LimitsService.reserve_publish / PublishService)
+- Publicaciones simultáneas no pasan del límite del tier free
+- Una publicación fallida devuelve su reserva
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import threading
+import pytest
+
+@pytest.fixture
+def free_user(db):
+    import db_service
+    from services.limits_service import limits_service
+
+    def make(email, published):
+        user = db_service.create_user(email, 'hash')
+        db_service.update_user(user.id, {'tier': 'free', 'posts_published_total': published})
+        return user.id
+
+    make.limit = limits_service.LIMITS['free']['publish_total']
+    return make
+
+def _published(user_id):
+    import db_service
+    db_service.user_cache.invalidate(user_id)
+    return db_service.get_user_profile(user_id)['posts_published_total']
+
+def test_concurrent_reservations_stop_at_the_limit(free_user):
+    from services.limits_service import limits_service
+    user_id = free_user('cupo@test.local', free_user.limit - 2)
+    results = []
+
+    def reserve():
+        results.append(limits_service.reserve_publish(user_id)['allowed'])
+
+    threads = [threading.Thread(target=reserve) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [False] * 4 + [True] * 2
+    assert _published(user_id) == free_user.limit
+
+    denied = limits_service.reserve_publish(user_id)
+    assert denied['upgrade_required'] is True
+
+def test_failed_publish_releases_the_reservation(free_user, monkeypatch):
+    from services.publish_service import publish_service
+    user_id = free_user('fallo@test.local', 3)
+
+    monkeypatch.setattr(publish_service, '_publish_to_instagram',
+                        lambda *args: {'success': False, 'error': 'Error creando container'})
+    result = publish_service.publish_to_instagram('20250101-1', user_id=user_id, page_id='p')
+    assert result == {'success': False, 'error': 'Error creando container'}
+    assert _published(user_id) == 3
+
+    monkeypatch.setattr(publish_service, '_publish_to_instagram',
+                        lambda *args: {'success': True, 'post_id': '1', 'platform': 'instagram'})
+    assert publish_service.publish_to_instagram('20250101-1', user_id=user_id, page_id='p')['success']
+    assert _published(user_id) == 4
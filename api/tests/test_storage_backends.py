@@ -0,0 +1,87 @@
+"""
+Tests del almacén local direccionado por contenido (LocalStorageBackend)
+- Soltar un blob con el hash del manifiesto no relee el archivo
+- Enlazar, soltar y podar en paralelo no deja enlaces a blobs borrados
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import storage_backends
+from services.storage_backends import LocalStorageBackend
+
+@pytest.fixture
+def backend(tmp_path):
+    return LocalStorageBackend(tmp_path)
+
+def _blob_count(backend):
+    return len(list((backend.root / 'blobs').glob('*/*')))
+
+def test_release_with_manifest_digest_does_not_rehash(backend, monkeypatch):
+    digest = backend.write('posts/a/videos/v.mp4', b'video' * 1000)
+    backend.copy('posts/a/videos/v.mp4', 'posts/a/videos/copia.mp4', {'posts/a/videos/v.mp4': digest})
+
+    def no_rehash(path):
+        raise AssertionError(f"sha256_file({path}) con el hash ya conocido")
+    monkeypatch.setattr(storage_backends, 'sha256_file', no_rehash)
+
+    digests = {'posts/a/videos/v.mp4': digest, 'posts/a/videos/copia.mp4': digest}
+    backend.write('posts/a/videos/v.mp4', b'otro video', digests)  # Sobrescribe: el blob sigue en copia
+    assert _blob_count(backend) == 2
+    assert backend.delete('posts/a/videos/copia.mp4', digests)
+    assert _blob_count(backend) == 1
+
+def test_release_with_stale_digest_falls_back_to_hash(backend):
+    backend.write('posts/a/textos/t.txt', b'hola')
+    assert backend.delete('posts/a/textos/t.txt', {'posts/a/textos/t.txt': '0' * 64})
+    assert _blob_count(backend) == 0
+
+def test_concurrent_link_release_and_prune(backend):
+    data = b'referencia compartida' * 100
+    errors = []
+    stop = threading.Event()
+
+    def writer(n):
+        # Cada hilo crea y borra su archivo: el blob pasa una y otra vez por su último enlace
+        try:
+            for i in range(300):
+                key = f'posts/p{n}/imagenes/ref.png'
+                backend.write(key, data)
+                if i % 2:
+                    backend.copy(key, f'posts/p{n}/imagenes/copia.png')
+                    backend.delete(f'posts/p{n}/imagenes/copia.png')
+                backend.delete(key)
+        except Exception as e:
+            errors.append(e)
+
+    def pruner():
+        try:
+            while not stop.is_set():
+                backend.prune()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    prune_thread = threading.Thread(target=pruner)
+    prune_thread.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    prune_thread.join()
+
+    assert errors == []
+    assert backend.list('posts/') == []
+    backend.prune()
+    assert _blob_count(backend) == 0
+
+    # Y un archivo escrito después sigue enlazado a su blob
+    backend.write('posts/p0/imagenes/ref.png', data)
+    assert backend.read('posts/p0/imagenes/ref.png') == data
+    assert backend.local_path('posts/p0/imagenes/ref.png').stat().st_nlink == 2
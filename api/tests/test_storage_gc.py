@@ -0,0 +1,94 @@
+"""
+Tests del GC de storage (FileService.plan_garbage y GET /api/files/storage/gc)
+- Los posts para el GC solo traen codigo y los checkboxes *_mp4
+- El informe del endpoint solo muestra los posts del usuario (ni ajenos ni huérfanos)
+- Las edades salen de cuándo se escribió cada archivo, no del mtime del blob compartido
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import time
+import pytest
+
+from services.file_service import FileService
+from services.storage_backends import LocalStorageBackend
+
+pytest.importorskip('fastapi')
+
+@pytest.fixture(scope='module')
+def posts(make_client):
+    import db_service
+    from services.file_service import file_service
+
+    mio = db_service.create_post({'codigo': '20250201-1', 'titulo': 'Mío', 'user_id': 2})['codigo']
+    ajeno = db_service.create_post({'codigo': '20250201-2', 'titulo': 'Ajeno', 'user_id': 3})['codigo']
+    db_service.update_post(mio, {'stories_9x16_mp4': True})
+
+    # Formato de video generado a partir de un video base ya reemplazado (checkbox a False)
+    for codigo in (mio, ajeno):
+        file_service.save_binary_file(codigo, 'videos', f'{codigo}_feed_16x9.mp4', b'viejo')
+        time.sleep(0.01)
+        file_service.save_binary_file(codigo, 'videos', f'{codigo}_video_base.mp4', b'nuevo')
+    file_service.save_binary_file('20250201-huerfano', 'textos', 't.txt', b'sin fila en BD')
+    return mio, ajeno
+
+@pytest.fixture
+def no_grace(monkeypatch):
+    from services import file_service as file_service_module
+    monkeypatch.setattr(file_service_module, 'GC_GRACE_HOURS', -1)
+
+def test_posts_for_gc_only_codigo_and_video_flags(posts):
+    import db_service
+    mio, _ = posts
+
+    assert db_service.get_posts_for_gc(user_id=2) == [{
+        'codigo': mio,
+        'feed_16x9_mp4': False,
+        'stories_9x16_mp4': True,
+        'shorts_9x16_mp4': False,
+        'tiktok_9x16_mp4': False
+    }]
+
+def test_gc_report_only_shows_own_posts(make_client, posts, no_grace):
+    from routers import files
+    mio, _ = posts
+
+    response = make_client(files.router, user_id=2).get('/api/files/storage/gc')
+
+    assert response.status_code == 200
+    report = response.json()['gc']
+    assert report['orphan_posts'] == []
+    assert [(item['codigo'], item['name'], item['reason']) for item in report['stale_files']] == [
+        (mio, f'{mio}_feed_16x9.mp4', 'superseded_video')
+    ]
+
+def test_full_plan_still_finds_orphans(posts, no_grace):
+    import db_service
+    from services.file_service import file_service
+
+    rows = {post['codigo']: post for post in db_service.get_posts_for_gc()}
+    report = file_service.plan_garbage(rows)
+
+    assert [item['codigo'] for item in report['orphan_posts']] == ['20250201-huerfano']
+    assert {item['codigo'] for item in report['stale_files']} == set(posts)
+
+def test_relinked_content_keeps_its_own_write_time(tmp_path, monkeypatch):
+    files = FileService(backend=LocalStorageBackend(tmp_path))
+    data = b'misma imagen' * 100
+    start = time.time()
+    later = start + 48 * 3600
+    try:
+        files.save_binary_file('p1', 'imagenes', 'p1_imagen_base_1.png', data)
+
+        # Dos días después el mismo contenido vuelve a escribirse: enlaza el blob de antes
+        monkeypatch.setattr(time, 'time', lambda: later)
+        files.save_binary_file('p1', 'imagenes', 'p1_imagen_base_2.png', data)
+        files.save_binary_file('huerfano', 'imagenes', 'huerfano_imagen_base_1.png', data)
+        assert files.backend.stat('posts/p1/imagenes/p1_imagen_base_2.png')[1] < start + 1
+
+        report = files.plan_garbage({'p1': {'codigo': 'p1'}, 'otro': {'codigo': 'otro'}}, now=later + 60)
+
+        assert [item['name'] for item in report['stale_files']] == ['p1_imagen_base_1.png']
+        assert report['orphan_posts'] == []
+    finally:
+        files.close()
@@ -0,0 +1,59 @@
+"""
+Tests de las miniaturas (ThumbnailService.get_thumbnail)
+- Cancelar la petición que arrancó el render no afecta a las que esperan el mismo derivado
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+from services.file_service import FileService
+from services.storage_backends import LocalStorageBackend
+from services import thumbnail_service as thumbnail_module
+
+Image = pytest.importorskip('PIL.Image')
+
+def test_cancelled_request_does_not_cancel_shared_render(tmp_path, monkeypatch):
+    files = FileService(backend=LocalStorageBackend(tmp_path))
+    thumbs = thumbnail_module.ThumbnailService(files)
+    executor = ThreadPoolExecutor(max_workers=1)
+    render = thumbnail_module._render
+
+    def slow_render(*args):
+        time.sleep(0.2)
+        render(*args)
+
+    # Hilos en vez de procesos para poder ralentizar el render desde el test
+    monkeypatch.setattr(thumbnail_module, '_render', slow_render)
+    monkeypatch.setattr(thumbs, '_get_executor', lambda: executor)
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 32), 'red').save(buffer, 'PNG')
+    files.save_binary_file('p1', 'imagenes', 'p1_imagen_base_1.png', buffer.getvalue())
+
+    async def scenario():
+        entry = await files.index_file_async('p1', 'imagenes', 'p1_imagen_base_1.png')
+        first = asyncio.create_task(thumbs.get_thumbnail('p1', 'imagenes', 'p1_imagen_base_1.png', entry, 16, 'png'))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(thumbs.get_thumbnail('p1', 'imagenes', 'p1_imagen_base_1.png', entry, 16, 'png'))
+        await asyncio.sleep(0.05)
+
+        first.cancel()
+        path = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return path
+
+    try:
+        path = asyncio.run(scenario())
+        with Image.open(path) as thumb:
+            assert thumb.size == (16, 8)
+        assert thumbs.misses == 1
+        assert thumbs._inflight == {}
+    finally:
+        executor.shutdown()
+        files.close()
@@ -0,0 +1,64 @@
+"""
+Tests de async_db_service.unit_of_work
+- Un error a mitad confirma las escrituras ya terminadas (no las deshace)
+- Confirmar cambios de un post borrado mientras tanto lanza ValueError
+- Fuera de una unidad de trabajo cada escritura se ve al momento (progreso en el panel)
+
+Uso (desde api/):
+    python -m pytest -q tests
+"""
+import asyncio
+import pytest
+
+pytest.importorskip('aiosqlite')
+
+@pytest.fixture
+def posts(db):
+    import db_service
+    created = [
+        db_service.create_post({'codigo': f'20250301-{n}', 'titulo': 'UoW', 'user_id': 1})['codigo']
+        for n in (1, 2)
+    ]
+    yield created
+    for codigo in created:
+        db_service.delete_post(codigo)
+
+def _flags(codigo):
+    import db_service
+    db_service.post_cache.invalidate(codigo)
+    return db_service.get_post_by_codigo(codigo)
+
+def test_error_commits_finished_writes(posts):
+    import async_db_service
+
+    async def run():
+        async with async_db_service.unit_of_work():
+            await async_db_service.update_post(posts[0], {'instagram_txt': True})
+            raise RuntimeError("fallo de la IA")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert _flags(posts[0])['instagram_txt'] is True
+
+def test_commit_of_deleted_post_raises(posts):
+    import async_db_service
+    import db_service
+
+    async def run():
+        async with async_db_service.unit_of_work():
+            await async_db_service.update_post(posts[0], {'linkedin_txt': True})
+            await async_db_service.update_post(posts[1], {'linkedin_txt': True})
+            db_service.delete_post(posts[1])
+
+    with pytest.raises(ValueError, match=posts[1]):
+        asyncio.run(run())
+    assert _flags(posts[0])['linkedin_txt'] is True
+
+def test_writes_outside_unit_of_work_are_visible_at_once(posts):
+    import async_db_service
+
+    async def run():
+        await async_db_service.update_post(posts[0], {'twitter_txt': True})
+        return _flags(posts[0])['twitter_txt']
+
+    assert asyncio.run(run()) is True
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark de estrés: escritores concurrentes de la API y del MCP server sobre la misma BD
+La API recibe PATCH /api/posts/{codigo} con CONCURRENCY workers mientras el
+MCP server (lanzado por stdio, como lo hace Claude Desktop) crea posts con la
+tool create_post. Cuenta errores "database is locked" y mide latencias.
+
+Comparar con la API y el MCP arrancados con y sin DB_SINGLE_WRITER=1.
+
+Uso:
+    BENCH_EMAIL=... BENCH_PASSWORD=... python bench_db_writers.py 20251104-2
+
+⚠️ Modifica el título del post indicado y crea posts en la BD: usar una BD de pruebas.
+"""
+import asyncio
+import os
+import sys
+import time
+import httpx
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from bench_posts_latency import report
+
+# URL de la API (ajusta el puerto si es necesario)
+BASE_URL = os.getenv('LAVELO_API_URL', 'http://localhost:5002')
+SAMPLES = int(os.getenv('BENCH_SAMPLES', '200'))
+CONCURRENCY = int(os.getenv('BENCH_CONCURRENCY', '8'))
+MCP_CREATES = int(os.getenv('BENCH_MCP_CREATES', '20'))
+
+async def hammer_updates(client, codigo, errors):
+    """PATCH del título con CONCURRENCY workers hasta completar SAMPLES"""
+    latencies = []
+    remaining = [SAMPLES]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            t0 = time.perf_counter()
+            response = await client.patch(f'/api/posts/{codigo}', json={
+                'titulo': f'bench {remaining[0]}'
+            })
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if response.status_code != 200:
+                errors.append(response.text)
+
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return latencies
+
+async def mcp_creates(errors):
+    """create_post por el MCP server (proceso propio, stdio)"""
+    latencies = []
+    server = StdioServerParameters(
+        command=sys.executable,
+        args=[os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mcp_server.py')],
+        env=dict(os.environ)
+    )
+    async with stdio_client(server) as (read_stream, write_stream):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            for i in range(MCP_CREATES):
+                t0 = time.perf_counter()
+                result = await session.call_tool('create_post', {'titulo': f'bench mcp {i}'})
+                latencies.append((time.perf_counter() - t0) * 1000)
+                text = result.content[0].text if result.content else ''
+                if result.isError or text.startswith('❌'):
+                    errors.append(text)
+    return latencies
+
+async def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    codigo = sys.argv[1]
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=600) as client:
+        login = await client.post('/api/auth/login', json={
+            'email': os.environ['BENCH_EMAIL'],
+            'password': os.environ['BENCH_PASSWORD']
+        })
+        login.raise_for_status()
+        print(f"🚀 Estrés contra {BASE_URL}: {SAMPLES} PATCH ({CONCURRENCY} workers) + {MCP_CREATES} create_post por MCP")
+
+        api_errors, mcp_errors = [], []
+        t0 = time.perf_counter()
+        api_latencies, mcp_latencies = await asyncio.gather(
+            hammer_updates(client, codigo, api_errors),
+            mcp_creates(mcp_errors)
+        )
+        elapsed = time.perf_counter() - t0
+
+        report("PATCH /api/posts/{codigo} (API)", api_latencies)
+        report("create_post (MCP)", mcp_latencies)
+        writes = len(api_latencies) + len(mcp_latencies)
+        print(f"⏱️ {writes} escrituras en {elapsed:.2f}s ({writes / elapsed:.1f}/s)")
+
+        for label, errors in (('API', api_errors), ('MCP', mcp_errors)):
+            locked = sum('database is locked' in error for error in errors)
+            print(f"❌ {label}: {len(errors)} errores ({locked} 'database is locked')")
+
+        stats = (await client.get('/api/stats')).json()
+        print(f"✍️ Escritor único (API): {stats.get('db_writer')}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
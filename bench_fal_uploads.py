@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark: caché de subidas de referencias a Fal storage (sin red ni FAL_KEY)
+Levanta un endpoint de subida falso en localhost (POST guarda los bytes y
+devuelve la URL, GET los sirve) y se lo inyecta a FalUploadService sobre un
+storage temporal. Simula BENCH_GENERATIONS generaciones con BENCH_REFS
+referencias y compara lo enviado con el base64 inline de antes.
+
+Comprueba:
+- Una subida por referencia, no una por generación
+- CONCURRENCY peticiones simultáneas de una referencia nueva → una subida
+- Cambiar el contenido de la referencia → nueva subida
+- La URL caducada (TTL 0) se vuelve a subir
+
+Uso:
+    python bench_fal_uploads.py
+"""
+import asyncio
+import base64
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+# Storage temporal antes de importar los servicios (STORAGE_PATH se lee al importar)
+os.environ['STORAGE_PATH'] = tempfile.mkdtemp(prefix='bench_fal_')
+os.environ.setdefault('STORAGE_BACKEND', 'local')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+from services.file_service import file_service
+from services.fal_upload_service import FalUploadService
+
+GENERATIONS = int(os.getenv('BENCH_GENERATIONS', '10'))
+REFS = int(os.getenv('BENCH_REFS', '2'))
+REF_KB = int(os.getenv('BENCH_REF_KB', '2048'))
+CONCURRENCY = int(os.getenv('BENCH_CONCURRENCY', '8'))
+CODIGO = 'bench-fal'
+
+class FakeFalStorage(BaseHTTPRequestHandler):
+    """Endpoint falso de Fal storage: POST /upload → {url}, GET /files/<id> → bytes"""
+    files = {}
+    uploads = 0
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['content-length']))
+        file_id = uuid.uuid4().hex
+        FakeFalStorage.files[file_id] = (self.headers['content-type'], data)
+        FakeFalStorage.uploads += 1
+        time.sleep(0.05)  # Latencia de red aproximada
+        body = f'{{"url": "http://{self.headers["host"]}/files/{file_id}"}}'.encode()
+        self.send_response(200)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        content_type, data = FakeFalStorage.files.get(self.path.rsplit('/', 1)[-1], (None, None))
+        if data is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('content-type', content_type)
+        self.send_header('content-length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def start_fake_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeFalStorage)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    def uploader(data: bytes, content_type: str) -> str:
+        response = requests.post(f'{base_url}/upload', data=data, headers={'content-type': content_type})
+        response.raise_for_status()
+        return response.json()['url']
+    return server, uploader
+
+def check(label, ok):
+    print(f"{'✅' if ok else '❌'} {label}")
+    return ok
+
+async def generation(service, filenames):
+    """Lo que hace generate_image con las referencias: una URL por archivo"""
+    return await asyncio.gather(*(service.get_url(CODIGO, 'imagenes', name) for name in filenames))
+
+async def main():
+    server, uploader = start_fake_server()
+    service = FalUploadService(file_service, uploader=uploader)
+    filenames = [f'{CODIGO}_referencia_{i}.png' for i in range(1, REFS + 1)]
+    for name in filenames:
+        await file_service.save_binary_file_async(CODIGO, 'imagenes', name, os.urandom(REF_KB * 1024))
+    print(f"🚀 {GENERATIONS} generaciones × {REFS} referencias de {REF_KB} KB (storage: {os.environ['STORAGE_PATH']})")
+
+    results = []
+    t0 = time.perf_counter()
+    urls = None
+    for _ in range(GENERATIONS):
+        urls = await generation(service, filenames)
+    elapsed = time.perf_counter() - t0
+
+    inline_bytes = GENERATIONS * REFS * len(base64.b64encode(os.urandom(REF_KB * 1024)))
+    uploaded_bytes = service.bytes_uploaded
+    print(f"📊 Enviado: {uploaded_bytes / (1024 * 1024):.1f} MB subidos una vez "
+          f"vs {inline_bytes / (1024 * 1024):.1f} MB en base64 inline ({elapsed:.2f}s)")
+    results.append(check(f"{FakeFalStorage.uploads} subidas para {GENERATIONS * REFS} referencias usadas",
+                         FakeFalStorage.uploads == REFS))
+    served = requests.get(urls[0]).content
+    original = await file_service.read_binary_file_async(CODIGO, 'imagenes', filenames[0])
+    results.append(check("La URL cacheada sirve los mismos bytes", served == original))
+
+    before = FakeFalStorage.uploads
+    fresh = f'{CODIGO}_referencia_nueva.png'
+    await file_service.save_binary_file_async(CODIGO, 'imagenes', fresh, os.urandom(REF_KB * 1024))
+    urls = await asyncio.gather(*(service.get_url(CODIGO, 'imagenes', fresh) for _ in range(CONCURRENCY)))
+    results.append(check(f"{CONCURRENCY} peticiones simultáneas → {FakeFalStorage.uploads - before} subida",
+                         FakeFalStorage.uploads - before == 1 and len(set(urls)) == 1))
+
+    before = FakeFalStorage.uploads
+    await file_service.save_binary_file_async(CODIGO, 'imagenes', filenames[0], os.urandom(REF_KB * 1024))
+    await generation(service, filenames)
+    results.append(check("Referencia reemplazada → se sube de nuevo solo esa",
+                         FakeFalStorage.uploads - before == 1))
+
+    before = FakeFalStorage.uploads
+    expired = FalUploadService(file_service, uploader=uploader, ttl_hours=0)
+    await generation(expired, filenames)
+    results.append(check("URLs caducadas (TTL 0) → se vuelven a subir",
+                         FakeFalStorage.uploads - before == REFS))
+
+    missing = await service.get_url(CODIGO, 'imagenes', 'no_existe.png')
+    results.append(check("Archivo inexistente → None", missing is None))
+
+    print(f"📈 {service.stats()}")
+    server.shutdown()
+    file_service.close()
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memoria de la API con N previews de video simultáneas
+Lanza CONCURRENCY descargas completas y CONCURRENCY saltos (Range) del mismo
+video contra GET /api/files/{codigo}/videos/{filename} y muestrea el RSS del
+proceso de la API. Con el archivo entero en memoria el pico crece ~N × tamaño;
+en streaming debe quedarse casi plano.
+
+Uso:
+    BENCH_EMAIL=... BENCH_PASSWORD=... BENCH_API_PID=$(pgrep -f "uvicorn main:app" | head -1) \\
+        python bench_file_streaming.py 20251104-2 20251104-2_video_base.mp4
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import httpx
+import psutil
+
+# URL de la API (ajusta el puerto si es necesario)
+BASE_URL = os.getenv('LAVELO_API_URL', 'http://localhost:5002')
+CONCURRENCY = int(os.getenv('BENCH_CONCURRENCY', '20'))
+SAMPLE_INTERVAL = 0.02
+
+async def sample_rss(process, samples, stop_event):
+    """Muestrea el RSS (MB) del proceso de la API hasta stop_event"""
+    while not stop_event.is_set():
+        samples.append(process.memory_info().rss / (1024 * 1024))
+        await asyncio.sleep(SAMPLE_INTERVAL)
+
+async def preview(client, url):
+    """Descarga completa en streaming (sin acumular en el cliente)"""
+    received = 0
+    async with client.stream('GET', url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+    return received
+
+async def seek(client, url, size):
+    """Salto a una posición aleatoria: Range de 1 MB (espera 206)"""
+    start = random.randrange(0, max(size - 1, 1))
+    response = await client.get(url, headers={'Range': f'bytes={start}-{start + 1024 * 1024 - 1}'})
+    return response.status_code
+
+async def run(label, process, coros):
+    samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(process, samples, stop))
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*coros)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await sampler
+    baseline = samples[0] if samples else 0.0
+    peak = max(samples or [0.0])
+    print(f"📊 {label}: {elapsed:.2f}s, RSS base={baseline:.1f}MB pico={peak:.1f}MB (+{peak - baseline:.1f}MB)")
+    return results
+
+async def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    codigo, filename = sys.argv[1], sys.argv[2]
+    url = f'/api/files/{codigo}/videos/{filename}'
+    process = psutil.Process(int(os.environ['BENCH_API_PID']))
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=600) as client:
+        login = await client.post('/api/auth/login', json={
+            'email': os.environ['BENCH_EMAIL'],
+            'password': os.environ['BENCH_PASSWORD']
+        })
+        login.raise_for_status()
+
+        head = await client.get(url, headers={'Range': 'bytes=0-0'})
+        if head.status_code == 206:
+            size = int(head.headers['content-range'].rsplit('/', 1)[-1])
+        else:
+            size = int(head.headers.get('content-length', 0))
+        print(f"🚀 {CONCURRENCY} previews de {filename} ({size / (1024 * 1024):.1f} MB) contra {BASE_URL}")
+        print(f"   Range bytes=0-0 → {head.status_code}, Accept-Ranges: {head.headers.get('accept-ranges')}")
+
+        sizes = await run("Previews completas", process, [preview(client, url) for _ in range(CONCURRENCY)])
+        print(f"   {sum(sizes) / (1024 * 1024):.1f} MB servidos")
+        statuses = await run("Saltos con Range", process, [seek(client, url, size) for _ in range(CONCURRENCY)])
+        print(f"   Respuestas: {sorted(set(statuses))}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
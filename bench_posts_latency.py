@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latencia de GET /api/posts/ mientras corre un validate-phase
+Mide p50/p95/p99 en reposo y con un validate-phase concurrente, para
+comprobar que las llamadas a BD no bloquean el event loop de uvicorn.
+
+Uso:
+    BENCH_EMAIL=... BENCH_PASSWORD=... python bench_posts_latency.py 20251104-2 IMAGE_FORMATS_AWAITING
+
+⚠️ validate-phase avanza el estado del post: usar un post de pruebas.
+"""
+import asyncio
+import os
+import sys
+import time
+import httpx
+
+# URL de la API (ajusta el puerto si es necesario)
+BASE_URL = os.getenv('LAVELO_API_URL', 'http://localhost:5002')
+SAMPLES = int(os.getenv('BENCH_SAMPLES', '200'))
+CONCURRENCY = int(os.getenv('BENCH_CONCURRENCY', '4'))
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def report(label, latencies):
+    print(f"📊 {label}: n={len(latencies)} "
+          f"p50={percentile(latencies, 50):.1f}ms "
+          f"p95={percentile(latencies, 95):.1f}ms "
+          f"p99={percentile(latencies, 99):.1f}ms "
+          f"max={max(latencies or [0]):.1f}ms")
+
+async def hammer_list(client, samples, stop_event=None):
+    """Lanza GET /api/posts/ con CONCURRENCY workers hasta completar samples (o hasta stop_event)"""
+    latencies = []
+    remaining = [samples]
+
+    async def worker():
+        while remaining[0] > 0 and not (stop_event and stop_event.is_set()):
+            remaining[0] -= 1
+            t0 = time.perf_counter()
+            response = await client.get('/api/posts/')
+            latencies.append((time.perf_counter() - t0) * 1000)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return latencies
+
+async def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    codigo, current_state = sys.argv[1], sys.argv[2]
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=600) as client:
+        login = await client.post('/api/auth/login', json={
+            'email': os.environ['BENCH_EMAIL'],
+            'password': os.environ['BENCH_PASSWORD']
+        })
+        login.raise_for_status()
+        print(f"🚀 Benchmark contra {BASE_URL} ({SAMPLES} muestras, {CONCURRENCY} workers)")
+
+        # 1. Línea base sin carga
+        report("GET /api/posts/ en reposo", await hammer_list(client, SAMPLES))
+
+        # 2. Con validate-phase concurrente
+        done = asyncio.Event()
+
+        async def run_validate():
+            t0 = time.perf_counter()
+            response = await client.post('/api/validate-phase', json={
+                'codigo': codigo,
+                'current_state': current_state,
+                'redes': {}
+            })
+            done.set()
+            print(f"⏱️ validate-phase → {response.status_code} en {time.perf_counter() - t0:.2f}s")
+
+        validate_task = asyncio.create_task(run_validate())
+        await asyncio.sleep(0.05)
+        latencies = await hammer_list(client, SAMPLES, stop_event=done)
+        await validate_task
+        report("GET /api/posts/ durante validate-phase", latencies)
+
+if __name__ == '__main__':
+    asyncio.run(main())
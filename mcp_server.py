@@ -24,7 +24,7 @@ from services.image_service import ImageService
 from services.video_service import VideoService
 from services.content_service import ContentService
 from services.publish_service import publish_service
-from services.file_service import file_service
+from services.file_service import file_service, STORAGE_RECONCILE_ON_STARTUP
 
 # Configurar logging a archivo
 logging.basicConfig(
@@ -55,8 +55,22 @@ logger.info("🚀 MCP Server iniciado (modo directo a servicios)")
 JOBS: dict[str, dict] = {}
 JOBS_LOCK = asyncio.Lock()
 # Lock global para escrituras en BD (evita 'database is locked' en SQLite)
+# El contador atómico de códigos no lo sustituye: la contención de escritura sigue
+# ahí mientras el escritor único (DB_SINGLE_WRITER) sea opcional
 DB_WRITE_LOCK = asyncio.Lock()
 
+async def _create_post_serialized(titulo: str, categoria: str, idea: str) -> dict:
+    """create_post serializado con DB_WRITE_LOCK y reintentos contra locks transitorios"""
+    async with DB_WRITE_LOCK:
+        last_err = None
+        for attempt in range(5):
+            try:
+                return await post_service.create_post(titulo=titulo, categoria=categoria, idea=idea)
+            except Exception as e:
+                last_err = e
+                await asyncio.sleep(1 + attempt * 0.5)
+        raise last_err
+
 async def _create_job(task_coro, job_type: str, args: dict) -> str:
     job_id = str(uuid.uuid4())
     async with JOBS_LOCK:
@@ -177,11 +191,15 @@ async def handle_list_tools() -> list[Tool]:
         Tool(
             name="list_posts",
             title="List Posts",
-            description="Lista posts con soporte de límite y respuesta compacta",
+            description="Lista posts (más recientes primero) con paginación por cursor, filtros y respuesta compacta",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "limit": {"type": "integer", "description": "Máximo de posts a devolver", "default": 50},
+                    "cursor": {"type": "string", "description": "next_cursor de la página anterior (para paginar)"},
+                    "estado": {"type": "string", "description": "Filtrar por estado (ej: DRAFT, PUBLISHED)"},
+                    "fecha_desde": {"type": "string", "description": "Fecha programada mínima (YYYY-MM-DD)"},
+                    "fecha_hasta": {"type": "string", "description": "Fecha programada máxima (YYYY-MM-DD)"},
                     "compact": {"type": "boolean", "description": "Devolver formato compacto para el LLM", "default": True}
                 },
                 "required": []
@@ -511,23 +529,7 @@ async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
                 if not tema:
                     tema = "Tema de triatlón generado automáticamente"
 
-                async with DB_WRITE_LOCK:
-                    # Retry simple contra locks transitorios
-                    create_result = None
-                    last_err = None
-                    for attempt in range(5):
-                        try:
-                            create_result = await post_service.create_post(
-                                titulo=tema,
-                                categoria=categoria,
-                                idea=tema
-                            )
-                            break
-                        except Exception as e:
-                            last_err = e
-                            await asyncio.sleep(1 + attempt * 0.5)
-                    if create_result is None:
-                        raise last_err
+                create_result = await _create_post_serialized(tema, categoria, tema)
                 
                 if not create_result.get('success'):
                     return [TextContent(type="text", text=f"❌ Error creando post: {create_result.get('error')}")]
@@ -560,17 +562,28 @@ async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
         
         elif name == "list_posts":
             logger.info("📋 Listando posts...")
-            limit = arguments.get('limit')
             compact = arguments.get('compact', True)
-            posts = await post_service.list_posts()
-            posts = posts[:limit] if limit else posts
+            try:
+                page = await post_service.list_posts_page(
+                    limit=arguments.get('limit') or 50,
+                    cursor=arguments.get('cursor'),
+                    estado=arguments.get('estado'),
+                    fecha_desde=arguments.get('fecha_desde'),
+                    fecha_hasta=arguments.get('fecha_hasta'),
+                    summary=compact
+                )
+            except ValueError as e:
+                return [TextContent(type="text", text=f"❌ Error: {str(e)}")]
+            posts = page['posts']
             if compact:
                 lines = [f"• {p.get('codigo')}: {p.get('titulo','')} ({p.get('estado','')})" for p in posts]
                 body = "\n".join(lines)
+                if page['next_cursor']:
+                    body += f"\n\n➡️ Más posts: cursor=\"{page['next_cursor']}\""
                 return [TextContent(type="text", text=f"📋 Posts ({len(posts)}):\n\n{body}")]
             else:
                 import json
-                return [TextContent(type="text", text=json.dumps(posts, ensure_ascii=False))]
+                return [TextContent(type="text", text=json.dumps(page, ensure_ascii=False))]
         
         elif name == "create_post":
             titulo = arguments.get('titulo', 'Sin título')
@@ -788,22 +801,7 @@ async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
                 local_tema = tema or "Tema de triatlón generado automáticamente"
                 s = monotonic()
                 # Serializar inserción para evitar lock
-                async with DB_WRITE_LOCK:
-                    create_result = None
-                    last_err = None
-                    for attempt in range(5):
-                        try:
-                            create_result = await post_service.create_post(
-                                titulo=local_tema,
-                                categoria=categoria,
-                                idea=local_tema
-                            )
-                            break
-                        except Exception as e:
-                            last_err = e
-                            await asyncio.sleep(1 + attempt * 0.5)
-                    if create_result is None:
-                        raise last_err
+                create_result = await _create_post_serialized(local_tema, categoria, local_tema)
                 e = monotonic(); step("create_post", s, e)
                 if not create_result.get('success'):
                     return {"success": False, "error": create_result.get('error'), "timeline": timeline, "total_ms": int((e - t0) * 1000)}
@@ -1027,19 +1025,40 @@ async def main():
     except Exception:
         pass
 
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="lavelo-blog",
-                server_version="1.0.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={}
+    # Índice de storage (manifiestos y agregado) en segundo plano: no retrasa el handshake
+    async def _reconcile_storage():
+        try:
+            await file_service.reconcile_index_async()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo reconciliar el índice de storage: {e}")
+    reconcile_task = asyncio.create_task(_reconcile_storage()) if STORAGE_RECONCILE_ON_STARTUP else None
+
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="lavelo-blog",
+                    server_version="1.0.0",
+                    capabilities=server.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={}
+                    )
                 )
             )
-        )
+    finally:
+        # Cerrar conexiones async (aiosqlite usa un hilo por conexión),
+        # terminar las escrituras de disco pendientes
+        # y confirmar las escrituras que queden en la cola del escritor único
+        from database import async_engine
+        from db_writer import write_queue
+        if reconcile_task is not None:
+            await reconcile_task
+        file_service.close()
+        if write_queue is not None:
+            write_queue.close()
+        await async_engine.dispose()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -15,6 +15,9 @@ let currentPost = null;
 let currentPostIndex = 0;
 let initialNetworksState = null; // Para detectar cambios en validación
 let urlPostCodigo = null;
+// Selector de posts: GET /api/posts devuelve páginas; next_cursor pide la siguiente
+const POSTS_PAGE_SIZE = 50;
+let postsNextCursor = null;
 
 // ============================================
 // INICIALIZACIÓN
@@ -81,30 +84,69 @@ async function checkAuth() {
 // ============================================
 // CARGAR DATOS
 // ============================================
-async function loadPostData() {
-    try {
-        const response = await fetch(`${API_BASE}/posts/`, { credentials: 'include' });
-        if (response.status === 401) {
-            window.location.href = '/panel/login.html';
-            return;
-        }
-        const result = await response.json();
+async function fetchPostsPage(cursor) {
+    // Una página del resumen para el selector (null si hay que salir: login o error ya mostrado)
+    const params = new URLSearchParams({ fields: 'summary', limit: POSTS_PAGE_SIZE });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_BASE}/posts/?${params}`, { credentials: 'include' });
+    if (response.status === 401) {
+        window.location.href = '/panel/login.html';
+        return null;
+    }
+    const result = await response.json();
 
-        if (result.error) {
-            showError(result.error);
-            return;
-        }
+    if (result.error || result.detail) {
+        showError(result.error || result.detail);
+        return null;
+    }
 
-        const posts = result.posts || result;
+    // Verificar que posts sea un array
+    if (!Array.isArray(result.posts)) {
+        console.error('posts no es un array:', result.posts);
+        showError('Formato de datos incorrecto');
+        return null;
+    }
+    return result;
+}
 
-        // Verificar que posts sea un array
-        if (!Array.isArray(posts)) {
-            console.error('posts no es un array:', posts);
-            showError('Formato de datos incorrecto');
-            return;
-        }
+async function loadMorePosts() {
+    if (!postsNextCursor) return;
+    const page = await fetchPostsPage(postsNextCursor);
+    if (!page) return;
+    const posts = getStoredPosts();
+    const known = new Set(posts.map(p => p.codigo));
+    posts.push(...page.posts.filter(p => !known.has(p.codigo)));
+    postsNextCursor = page.next_cursor;
+    localStorage.setItem('posts', JSON.stringify(posts));
+    addPostSelector();
+}
 
-        localStorage.setItem('posts', JSON.stringify(posts));
+async function loadPostData(reloadList = true) {
+    try {
+        let posts = getStoredPosts();
+        if (reloadList) {
+            // Primera página del resumen; el post actual se pide completo más abajo
+            const page = await fetchPostsPage(null);
+            if (!page) return;
+            posts = page.posts;
+            postsNextCursor = page.next_cursor;
+
+            // El post abierto (o el de ?codigo=) puede no estar en la primera página
+            const wanted = urlPostCodigo || (currentPost && currentPost.codigo);
+            if (wanted && !posts.some(p => p.codigo === wanted)) {
+                const wantedResponse = await fetch(`${API_BASE}/posts/${wanted}`, { credentials: 'include' });
+                const wantedResult = wantedResponse.ok ? await wantedResponse.json() : null;
+                if (wantedResult && wantedResult.post) {
+                    posts.unshift(wantedResult.post);
+                }
+            }
+            if (!urlPostCodigo && currentPost) {
+                // La lista va por fecha de actualización: validar mueve el post, buscarlo por código
+                const keptIndex = posts.findIndex(p => p.codigo === currentPost.codigo);
+                if (keptIndex >= 0) currentPostIndex = keptIndex;
+            }
+            localStorage.setItem('posts', JSON.stringify(posts));
+        }
 
         if (posts.length === 0) {
             currentPost = null;
@@ -132,7 +174,15 @@ async function loadPostData() {
             }
         }
 
-        const data = posts[currentPostIndex] || posts[0];
+        const summary = posts[currentPostIndex] || posts[0];
+        const detailResponse = await fetch(`${API_BASE}/posts/${summary.codigo}`, { credentials: 'include' });
+        const detail = await detailResponse.json();
+        if (!detail.post) {
+            showError(detail.detail || 'Error al cargar el post');
+            return;
+        }
+
+        const data = detail.post;
         currentPost = data;
 
         renderPostInfo(data);
@@ -581,6 +631,7 @@ function addPostSelector() {
                             ${post.codigo} - ${post.titulo}
                         </option>
                     `).join('')}
+                    ${postsNextCursor ? '<option value="more">⏬ Cargar más posts…</option>' : ''}
                 </select>
             </div>
             <button id="create-post-btn" class="create-post-btn" title="Crear nuevo post con IA">
@@ -591,8 +642,12 @@ function addPostSelector() {
     header.appendChild(selector);
 
     document.getElementById('post-selector').addEventListener('change', (e) => {
+        if (e.target.value === 'more') {
+            loadMorePosts();
+            return;
+        }
         currentPostIndex = parseInt(e.target.value);
-        loadPostData();
+        loadPostData(false);
     });
 
     document.getElementById('create-post-btn').addEventListener('click', createNewPost);
@@ -4,6 +4,9 @@ const API_BASE = isProduction ? '/api' : 'http://localhost:5001/api';
 
 // Estado global
 let currentPost = null;
+// Bundle del post (manifiesto + textos pequeños) para el primer render: evita
+// una petición por archivo. Se descarta después: lo que cambie se pide a /api/files.
+let postBundle = null;
 let phaseIsValidated = false;
 let userConfirmedEdit = false;
 
@@ -22,16 +25,31 @@ document.addEventListener('DOMContentLoaded', () => {
 });
 
 // Cargar datos del post
+// Versión de los assets para la URL: cambia cuando cambia el post.
+// La API responde con ETag/Cache-Control, así que recargar el panel reutiliza
+// lo ya descargado (304) en vez de forzar ?t=Date.now() en cada carga.
+function assetVersion() {
+    return encodeURIComponent((currentPost && currentPost.updated_at) || '');
+}
+
+// Preview reducida de una imagen de /api/files: la API la redimensiona y la
+// cachea (?w=...&fmt=webp). Las descargas siguen apuntando al original.
+function previewUrl(url, width) {
+    return `${url}${url.includes('?') ? '&' : '?'}w=${width}&fmt=webp`;
+}
+
 async function cargarPost() {
     try {
-        const response = await fetch(`${API_BASE}/posts`);
+        // Post + manifiesto + textos en una sola petición (ETag: si no cambió, 304)
+        const response = await fetch(`${API_BASE}/posts/${codigo}/bundle`);
         const data = await response.json();
 
-        if (!data.success) {
+        if (response.status !== 404 && !data.success) {
             throw new Error('Error al cargar posts');
         }
 
-        currentPost = data.posts.find(p => p.codigo === codigo);
+        currentPost = data.post;
+        postBundle = data.success ? data : null;
 
         if (!currentPost) {
             throw new Error('Post no encontrado');
@@ -46,7 +64,11 @@ async function cargarPost() {
         estadoBadge.className = 'status-badge status-awaiting';
 
         // Cargar contenido según fase
-        await cargarContenidoFase();
+        try {
+            await cargarContenidoFase();
+        } finally {
+            postBundle = null;
+        }
 
     } catch (error) {
         showError(error.message);
@@ -197,7 +219,7 @@ async function renderImagePromptPhase() {
                     const imageUrl = `${API_BASE}/files/${codigo}/imagenes/${encodeURIComponent(ref.filename)}`;
                     return `
                                 <div style="text-align: center;">
-                                    <img src="${imageUrl}" 
+                                    <img src="${previewUrl(imageUrl, 400)}" 
                                          style="max-width: 100%; border-radius: 8px; border: 2px solid #ddd; margin-bottom: 8px; background: #f5f5f5;"
                                          onerror="this.style.display='none'; this.nextElementSibling.style.display='block';"
                                          alt="Referencia ${idx + 1}">
@@ -282,7 +304,7 @@ async function renderImageBasePhase() {
         `;
     } else {
         // Imagen ya existe, mostrar preview
-        const imageUrl = `${API_BASE}/files/${codigo}/imagenes/${codigo}_imagen_base.png?t=${Date.now()}`;
+        const imageUrl = `${API_BASE}/files/${codigo}/imagenes/${codigo}_imagen_base.png?v=${assetVersion()}`;
         const variationsMeta = await fetchFileFromDrive('textos', `${codigo}_imagen_variations.json`);
         let variations = [];
         let selectedBase = `${codigo}_imagen_base.png`;
@@ -303,7 +325,7 @@ async function renderImageBasePhase() {
                 <div class="text-item">
                     <h3>📸 Imagen Base (1024x1024)</h3>
                     <div style="text-align: center; padding: 20px;">
-                        <img src="${imageUrl}" alt="Imagen base" style="max-width: 100%; border-radius: 10px; box-shadow: 0 4px 15px rgba(0,0,0,0.2);" onerror="this.src=''; this.alt='Error cargando imagen';">
+                        <img src="${previewUrl(imageUrl, 800)}" alt="Imagen base" style="max-width: 100%; border-radius: 10px; box-shadow: 0 4px 15px rgba(0,0,0,0.2);" onerror="this.src=''; this.alt='Error cargando imagen';">
                         <div style="margin-top: 15px;">
                             <a href="${imageUrl}" download="${codigo}_imagen_base.png" class="ai-btn" style="display: inline-block; text-decoration: none;">⬇️ Descargar Imagen</a>
                         </div>
@@ -322,14 +344,14 @@ async function renderImageBasePhase() {
                         <h3 style="text-align: center; margin-bottom: 20px;">🎨 Variaciones Generadas con Fal.ai</h3>
                         <div id="fal-variations-grid" style="display: grid; grid-template-columns: repeat(2, 1fr); gap: 20px; margin-bottom: 20px;">
                             ${variations.map((fname, idx) => {
-                                const vUrl = `/api/files/${codigo}/imagenes/${fname}?t=${Date.now()}`;
+                                const vUrl = `/api/files/${codigo}/imagenes/${fname}?v=${assetVersion()}`;
                                 const isSelected = fname === selectedBase;
                                 return `
                                     <div style="text-align: center; padding: 15px; border: 2px solid ${isSelected ? '#16a34a' : '#ddd'}; border-radius: 10px; cursor: pointer; transition: all 0.3s;"
                                          onclick="selectFalVariation('${fname}', ${idx + 1})"
                                          onmouseover="this.style.borderColor='#7c3aed'; this.style.transform='scale(1.02)'"
                                          onmouseout="this.style.borderColor='${isSelected ? '#16a34a' : '#ddd'}'; this.style.transform='scale(1)'">
-                                        <img src="${vUrl}" style="width: 100%; border-radius: 8px;" alt="Variación ${idx + 1}">
+                                        <img src="${previewUrl(vUrl, 480)}" style="width: 100%; border-radius: 8px;" alt="Variación ${idx + 1}">
                                         <p style="margin-top: 10px; color: #666; font-weight: bold;">Variación ${idx + 1}${isSelected ? ' ✅' : ''}</p>
                                     </div>
                                 `;
@@ -352,6 +374,9 @@ async function renderImageBasePhase() {
 
 // Función para verificar si una imagen existe en storage local
 async function checkImageExists(folder, filename) {
+    if (postBundle) {
+        return `${folder}/${filename}` in postBundle.manifest;
+    }
     try {
         // Verificar en storage local usando el endpoint /api/files/
     const response = await fetch(`${API_BASE}/files/${codigo}/${folder}/${filename}`);
@@ -392,7 +417,7 @@ async function generateImageWithAI() {
                 const imageUrl = `/api/files/${codigo}/imagenes/${img.filename}?t=${Date.now()}`;
                 imagesHTML += `
                     <div style="text-align: center; padding: 15px; border: 2px solid #ddd; border-radius: 10px; cursor: pointer;" onclick="selectGeneratedImage('${img.filename}', ${idx})">
-                        <img src="${imageUrl}" style="width: 100%; border-radius: 8px;" alt="Variación ${idx + 1}">
+                        <img src="${previewUrl(imageUrl, 480)}" style="width: 100%; border-radius: 8px;" alt="Variación ${idx + 1}">
                         <p style="margin-top: 10px; color: #666;">Variación ${idx + 1}</p>
                     </div>
                 `;
@@ -431,7 +456,7 @@ async function selectGeneratedImage(filename, index) {
         // Actualizar imagen base en UI sin recargar
         const mainImg = document.querySelector('img[alt="Imagen base"]');
         if (mainImg) {
-            mainImg.src = `${API_BASE}/files/${codigo}/imagenes/${codigo}_imagen_base.png?t=${Date.now()}`;
+            mainImg.src = previewUrl(`${API_BASE}/files/${codigo}/imagenes/${codigo}_imagen_base.png?t=${Date.now()}`, 800);
         }
         showNotification('Imagen base actualizada', 'success');
         // Resaltar selección en grid
@@ -495,16 +520,14 @@ async function loadImageWithRetry(filename, containerId, altText, maxRetries = 3
 
     for (let attempt = 1; attempt <= maxRetries; attempt++) {
         try {
-            const url = `${API_BASE}/files/${codigo}/imagenes/${filename}?t=${Date.now()}`;
+            const url = previewUrl(`${API_BASE}/files/${codigo}/imagenes/${filename}?v=${assetVersion()}`, 640);
 
             // Verificar que la imagen existe antes de mostrarla
+            // (la misma URL en el <img> sale de la caché del navegador)
             const response = await fetch(url);
             if (response.ok) {
-                const blob = await response.blob();
-                const imageUrl = URL.createObjectURL(blob);
-
                 container.innerHTML = `
-                    <img src="${imageUrl}" 
+                    <img src="${url}" 
                          alt="${altText}" 
                          style="max-width: 100%; max-height: 400px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.15);">
                 `;
@@ -620,17 +643,15 @@ async function loadVideoWithRetry(filename, containerId, altText, maxRetries = 3
 
     for (let attempt = 1; attempt <= maxRetries; attempt++) {
         try {
-            const url = `${API_BASE}/files/${codigo}/videos/${filename}?t=${Date.now()}`;
+            const url = `${API_BASE}/files/${codigo}/videos/${filename}?v=${assetVersion()}`;
 
-            // Verificar que el video existe antes de mostrarlo
-            const response = await fetch(url);
+            // Verificar que el video existe pidiendo solo el primer byte;
+            // el <video> lo descarga por rangos según se reproduce
+            const response = await fetch(url, { headers: { 'Range': 'bytes=0-0' } });
             if (response.ok) {
-                const blob = await response.blob();
-                const videoUrl = URL.createObjectURL(blob);
-
                 container.innerHTML = `
-                    <video controls style="max-width: 100%; max-height: 500px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.15);">
-                        <source src="${videoUrl}" type="video/mp4">
+                    <video controls preload="metadata" style="max-width: 100%; max-height: 500px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.15);">
+                        <source src="${url}" type="video/mp4">
                         Tu navegador no soporta video.
                     </video>
                 `;
@@ -668,6 +689,11 @@ async function renderReadyToPublishPhase() {
 
 // Obtener archivo del storage local
 async function fetchFileFromDrive(folder, filename) {
+    if (postBundle && folder === 'textos') {
+        if (filename in postBundle.textos) return postBundle.textos[filename];
+        // No está en el manifiesto → no existe; si está, es grande y se pide aparte
+        if (!(`${folder}/${filename}` in postBundle.manifest)) return null;
+    }
     try {
         const response = await fetch(`${API_BASE}/files/${codigo}/${folder}/${filename}`);
         if (!response.ok) return null;
@@ -971,7 +997,7 @@ async function generateVariationsWithFalAI() {
                          onclick="selectFalVariation('${img.filename}', ${idx + 1})"
                          onmouseover="this.style.borderColor='#7c3aed'; this.style.transform='scale(1.02)'"
                          onmouseout="this.style.borderColor='#ddd'; this.style.transform='scale(1)'">
-                        <img src="${imageUrl}" style="width: 100%; border-radius: 8px;" alt="Variación ${idx + 1}">
+                        <img src="${previewUrl(imageUrl, 480)}" style="width: 100%; border-radius: 8px;" alt="Variación ${idx + 1}">
                         <p style="margin-top: 10px; color: #666; font-weight: bold;">Variación ${idx + 1}</p>
                     </div>
                 `;
@@ -1015,7 +1041,7 @@ async function selectFalVariation(filename, variationNumber) {
         }
         const mainImg = document.querySelector('img[alt="Imagen base"]');
         if (mainImg) {
-            mainImg.src = `${API_BASE}/files/${codigo}/imagenes/${codigo}_imagen_base.png?t=${Date.now()}`;
+            mainImg.src = previewUrl(`${API_BASE}/files/${codigo}/imagenes/${codigo}_imagen_base.png?t=${Date.now()}`, 800);
         }
         showNotification(`✅ Variación ${variationNumber} seleccionada`, 'success');
         // Resaltar selección en grid
@@ -1088,24 +1114,13 @@ async function confirmarSubidaImagenFase4() {
     showUploadOverlay('Reemplazando imagen...', 'Guardando imagen, por favor espera...');
 
     try {
-        // Convertir imagen a base64
-        const reader = new FileReader();
-        const imageBase64 = await new Promise((resolve, reject) => {
-            reader.onload = () => resolve(reader.result);
-            reader.onerror = reject;
-            reader.readAsDataURL(selectedImageFile);
-        });
-
-        // Enviar como JSON con base64
+        // Enviar como multipart (la API lo copia por trozos, sin base64)
+        const formData = new FormData();
+        formData.append('file', selectedImageFile);
+        formData.append('filename', `${codigo}_imagen_base.png`);
         const response = await fetch(`${API_BASE}/posts/${codigo}/upload-image`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                image_data: imageBase64,
-                filename: `${codigo}_imagen_base.png`
-            })
+            body: formData
         });
 
         const result = await response.json();
@@ -1118,7 +1133,7 @@ async function confirmarSubidaImagenFase4() {
                 location.reload();
             }, 2000);
         } else {
-            showError(result.error || 'Error reemplazando imagen');
+            showError(result.error || result.detail || 'Error reemplazando imagen');
         }
     } catch (error) {
         hideUploadOverlay();